@@ -5,24 +5,586 @@ Change log:
   2015/10/24 -- module started; nloomis@gmail.com
   2016/01/18 -- minor formatting fixes; nloomis@gmail.com
   2016/05/25 -- documentation work; nloomis@gmail.com
+  2026/10/18 -- batched multi-depth reconstruction, reconstruct_stack;
+                nloomis@
+  2026/10/18 -- LRU kernel cache with a byte budget; nloomis@
+  2026/10/18 -- pluggable FFT backends (numpy, scipy, pyFFTW); nloomis@
+  2026/10/18 -- single-precision (float32/complex64) mode; nloomis@
+  2026/10/18 -- separable kernel mode; nloomis@
+  2026/10/18 -- depth scans with an incremental kernel recurrence; nloomis@
+  2026/10/18 -- reduced-resolution previews by spectrum cropping; nloomis@
+  2026/10/18 -- frequency grids shared between Holograms; nloomis@
+  2026/10/18 -- allocation-free workspace mode for reconstruct(); nloomis@
+  2026/10/18 -- multi-wavelength stacks sharing one forward FFT; nloomis@
+  2026/10/18 -- OffAxisHologram with sideband extraction; nloomis@
+  2026/10/18 -- least-squares phase unwrapping; nloomis@
+  2026/10/18 -- opt-in per-stage instrumentation of reconstruct(); nloomis@
+  2026/10/18 -- synthetic holograms of particles; nloomis@
+  2026/10/18 -- iterative twin-image suppression; nloomis@
+  2026/10/18 -- memory-mapped 8/16-bit ingest in load(); nloomis@
+  2026/10/18 -- cached FFTW plans no longer keep the caller's arrays;
+                nloomis@
+  2026/10/18 -- synthetic particles propagated over small patches;
+                nloomis@
+  2026/10/18 -- per-thread FFTW plans, so backends can be shared between
+                threads; nloomis@
 """
 __authors__ = ("nloomis@gmail.com",)
 
+import cv2
 import cv2utils
 import cv2color
 import imageutils
 
+import collections
+import contextlib
+import multiprocessing
 import numpy
+import os
+import pickle
+import threading
+import timeit
+import weakref
 import matplotlib.pyplot as plt
+try:
+    # scipy.fft (scipy >= 1.4) supports multithreaded transforms; older
+    # versions only have scipy.fftpack.
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+import scipy.fftpack
+try:
+    # pyFFTW is optional, see http://hgomersall.github.io/pyFFTW/
+    import pyfftw
+    import pyfftw.builders
+except ImportError:
+    pyfftw = None
+
+# Default memory budget, in bytes, for the working arrays of a batched
+# multi-depth reconstruction (see Hologram.reconstruct_stack).
+STACK_MAX_BYTES = 512 * 1024 ** 2
+
+# Kernel modes for Hologram. 'full' evaluates the kernel on the full 2D
+# frequency grid; 'separable' uses exp(1j*a*(u^2 + v^2)) =
+# exp(1j*a*u^2) * exp(1j*a*v^2) and only evaluates the two 1D factors.
+KERNEL_MODES = ('full', 'separable')
+
+# Number of depths in a uniform scan between exact kernel evaluations; the
+# kernels in between come from the recurrence kernel(z + dz) =
+# kernel(z) * kernel(dz), which slowly accumulates round-off.
+SCAN_REFRESH = 64
+
+# Default memory budget, in bytes, for each Hologram's kernel cache.
+KERNEL_CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+
+#
+# FFT backends
+#
+
+# All of the backends transform over the last two axes, so a stack of
+# fields with shape (depth, ny, nx) is transformed plane-by-plane in a single
+# call. If an out array is given to fft2 or ifft2, the result is written to
+# it and out is returned.
+
+def _store(result, out):
+    """Copies a transform into out, if given, and returns the output."""
+    if out is None:
+        return result
+    if result is not out:
+        out[...] = result
+    return out
+
+def empty_aligned(shape, dtype):
+    """Allocates an uninitialized array suitable for in-place FFTs.
+
+    With pyFFTW installed the array is SIMD-aligned, so FFTW can write to it
+    directly; otherwise it is a plain numpy.empty array."""
+    if pyfftw is not None:
+        return pyfftw.empty_aligned(shape, dtype=dtype)
+    return numpy.empty(shape, dtype=dtype)
+
+class NumpyFFT(object):
+    """FFT backend using numpy.fft; single-threaded, no plan re-use."""
+    name = 'numpy'
+
+    def fft2(self, a, overwrite=False, out=None):
+        """Forward 2D FFT over the last two axes; see ifft2 for the options."""
+        return _store(numpy.fft.fft2(a), out)
+
+    def ifft2(self, a, overwrite=False, out=None):
+        """Inverse 2D FFT over the last two axes.
+
+        If overwrite is True, the backend may use the input array as scratch
+        space. numpy.fft always allocates its result, which is copied to out
+        if it is given."""
+        return _store(numpy.fft.ifft2(a), out)
+
+
+class ScipyFFT(object):
+    """FFT backend using scipy, with multithreading if it is available.
+
+    scipy.fft (scipy >= 1.4) is used with the requested number of worker
+    threads; the default is one worker per CPU. Older versions of scipy fall
+    back to the single-threaded scipy.fftpack."""
+    name = 'scipy'
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.workers = workers
+
+    def fft2(self, a, overwrite=False, out=None):
+        """Forward 2D FFT over the last two axes; see ifft2 for the options."""
+        if scipy_fft is not None:
+            result = scipy_fft.fft2(a, overwrite_x=overwrite,
+                                    workers=self.workers)
+        else:
+            result = scipy.fftpack.fft2(a, overwrite_x=overwrite)
+        return _store(result, out)
+
+    def ifft2(self, a, overwrite=False, out=None):
+        """Inverse 2D FFT over the last two axes.
+
+        If overwrite is True, the backend may use the input array as scratch
+        space; scipy then often transforms in place instead of allocating.
+        The result is copied to out if it is given."""
+        if scipy_fft is not None:
+            result = scipy_fft.ifft2(a, overwrite_x=overwrite,
+                                     workers=self.workers)
+        else:
+            result = scipy.fftpack.ifft2(a, overwrite_x=overwrite)
+        return _store(result, out)
+
+
+class FFTWFFT(object):
+    """FFT backend using pyFFTW, with cached plans and multithreading.
+
+    A plan is made the first time a (direction, shape, dtype) combination is
+    seen and is re-used on every later call, so the planning cost is paid
+    once per geometry rather than once per transform. Plans made with
+    FFTW_MEASURE or FFTW_PATIENT are expensive; save the accumulated wisdom
+    with save_wisdom() and reload it in later sessions with load_wisdom() to
+    skip most of the planning.
+
+    The backend can be shared between threads: each thread keeps its own
+    plans, since executing a plan rebinds it to the caller's arrays. The
+    wisdom is shared, so only the first thread pays for FFTW_MEASURE."""
+    name = 'pyfftw'
+
+    def __init__(self, threads=None, planner_effort='FFTW_MEASURE',
+                 wisdom_file=None):
+        if pyfftw is None:
+            raise ImportError('pyFFTW is not installed; pip install pyfftw')
+        if threads is None:
+            threads = multiprocessing.cpu_count()
+        self.threads = threads
+        self.planner_effort = planner_effort
+        # _local.plans is the calling thread's plan cache; clear_plans() bumps
+        # _generation, which makes every thread start a new cache.
+        self._local = threading.local()
+        self._generation = 0
+        if wisdom_file is not None:
+            self.load_wisdom(wisdom_file)
+
+    @property
+    def _plans(self):
+        """The calling thread's cache of plans."""
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            local.plans = {}
+            local.generation = self._generation
+        return local.plans
+
+    def _plan(self, builder, a, overwrite):
+        """Returns a cached plan for transforming arrays like a.
+
+        The plan is returned with its own input and output arrays."""
+        key = (builder.__name__, a.shape, a.dtype.str, overwrite)
+        plan = self._plans.get(key)
+        if plan is None:
+            #planning may write to the array, so plan on scratch space
+            scratch = pyfftw.empty_aligned(a.shape, dtype=a.dtype)
+            plan = builder(scratch, axes=(-2, -1), threads=self.threads,
+                           planner_effort=self.planner_effort,
+                           overwrite_input=overwrite, avoid_copy=False)
+            plan = (plan, plan.input_array, plan.output_array)
+            self._plans[key] = plan
+        return plan
+
+    def _execute(self, builder, a, overwrite, out=None):
+        """Runs a cached plan.
+
+        The result is written to out, or to a newly-allocated array if out is
+        None. FFTW writes directly to out if it is aligned (see
+        empty_aligned) and has the plan's dtype; otherwise the plan's own
+        output array is copied to it.
+
+        Calling a plan with new arrays rebinds it to them, so the plan's own
+        arrays are restored afterwards: a cached plan must never keep a
+        caller's array, or a later call would write over it. The plans are
+        per-thread, so no other thread can run a plan while it is rebound."""
+        plan, input_array, output_array = self._plan(builder, a, overwrite)
+        if out is None:
+            out = pyfftw.empty_aligned(plan.output_shape,
+                                       dtype=plan.output_dtype)
+        try:
+            if (out.dtype == plan.output_dtype and
+                    pyfftw.is_n_byte_aligned(out, pyfftw.simd_alignment)):
+                return plan(a, output_array=out)
+            return _store(plan(a), out)
+        finally:
+            plan.update_arrays(input_array, output_array)
+
+    def fft2(self, a, overwrite=False, out=None):
+        """Forward 2D FFT over the last two axes; see ifft2 for the options."""
+        return self._execute(pyfftw.builders.fft2, numpy.asarray(a),
+                             overwrite, out)
+
+    def ifft2(self, a, overwrite=False, out=None):
+        """Inverse 2D FFT over the last two axes.
+
+        If overwrite is True, the backend may use the input array as scratch
+        space. With an aligned out array, no memory is allocated."""
+        return self._execute(pyfftw.builders.ifft2, numpy.asarray(a),
+                             overwrite, out)
+
+    def clear_plans(self):
+        """Discards all of the cached plans, in every thread."""
+        self._generation += 1
+
+    def load_wisdom(self, filename):
+        """Imports FFTW wisdom previously written by save_wisdom()."""
+        with open(filename, 'rb') as wisdom_file:
+            pyfftw.import_wisdom(pickle.load(wisdom_file))
+
+    def save_wisdom(self, filename):
+        """Exports the accumulated FFTW wisdom to a file."""
+        with open(filename, 'wb') as wisdom_file:
+            pickle.dump(pyfftw.export_wisdom(), wisdom_file)
+
+
+FFT_BACKENDS = {NumpyFFT.name: NumpyFFT,
+                ScipyFFT.name: ScipyFFT,
+                FFTWFFT.name: FFTWFFT}
+
+_default_fft_backend = NumpyFFT()
+
+def make_fft_backend(backend, **opts):
+    """Returns an FFT backend from a name or an existing backend object.
+
+    Names are the keys of FFT_BACKENDS: 'numpy', 'scipy' or 'pyfftw'. Any
+    options are passed to the backend's constructor, for example
+      make_fft_backend('scipy', workers=8)
+      make_fft_backend('pyfftw', threads=4, wisdom_file='fftw.wisdom')"""
+    if isinstance(backend, basestring):
+        if backend not in FFT_BACKENDS:
+            raise ValueError('Unknown FFT backend %s; known backends are %s.'
+                             % (backend, sorted(FFT_BACKENDS.keys())))
+        return FFT_BACKENDS[backend](**opts)
+    return backend
+
+def set_fft_backend(backend, **opts):
+    """Sets the FFT backend used by Holograms which don't have their own."""
+    global _default_fft_backend
+    _default_fft_backend = make_fft_backend(backend, **opts)
+
+def get_fft_backend():
+    """Returns the FFT backend used by Holograms which don't have their own."""
+    return _default_fft_backend
+
+
+class KernelCache(object):
+    """Least-recently-used cache of propagation kernels with a byte budget.
+
+    Kernels are stored under a key which describes everything the kernel
+    depends on (see Hologram._kernel_key). When adding a kernel would exceed
+    max_bytes, the least-recently-used kernels are evicted first; a kernel
+    which is larger than the whole budget is not stored at all, so setting
+    max_bytes to zero disables caching.
+
+    Cached kernels are marked read-only, since the same array is handed out
+    on every hit. The hits and misses counters record how often get() found
+    a kernel; reset them with reset_stats()."""
+
+    def __init__(self, max_bytes=KERNEL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._kernels = collections.OrderedDict()
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._kernels)
+
+    def __contains__(self, key):
+        return key in self._kernels
+
+    def reset_stats(self):
+        """Resets the hit and miss counters."""
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns the kernel stored under key, or None if it isn't cached."""
+        kernel = self._kernels.pop(key, None)
+        if kernel is None:
+            self.misses += 1
+            return None
+        #re-inserting the kernel marks it as the most recently used
+        self._kernels[key] = kernel
+        self.hits += 1
+        return kernel
+
+    def put(self, key, kernel):
+        """Stores a kernel, evicting the least recently used as needed."""
+        if key in self._kernels:
+            self.nbytes -= self._kernels.pop(key).nbytes
+        if kernel.nbytes > self.max_bytes:
+            return
+        while self._kernels and self.nbytes + kernel.nbytes > self.max_bytes:
+            _, evicted = self._kernels.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+        kernel.flags.writeable = False
+        self._kernels[key] = kernel
+        self.nbytes += kernel.nbytes
+
+    def clear(self):
+        """Removes all of the cached kernels."""
+        self._kernels.clear()
+        self.nbytes = 0
+
+
+class ReconstructionStats(object):
+    """Per-stage timers and counters for Hologram.reconstruct().
+
+    The stages of a reconstruction are
+      'fft': the forward FFT of the data, which is only computed once after
+        new data is loaded;
+      'holokern': the kernel (or the separable kernel factors), including
+        kernel cache look-ups;
+      'multiply': the product of the spectrum and the kernel;
+      'ifft2': the inverse FFT back to the field.
+    For each stage, seconds[stage] is the cumulative wall-clock time,
+    calls[stage] the number of times it ran and bytes[stage] the size of the
+    arrays it allocated. Cached kernels and workspace buffers which are
+    re-used count as zero bytes; temporaries inside the FFT libraries are not
+    counted. last[stage] holds the times of the most recent reconstruction
+    only, and reconstructions counts the calls to reconstruct().
+
+    If a callback is given, it is called as callback(stats, z) at the end of
+    every reconstruction, eg, to forward the timings of that call (from
+    stats.last) to a metrics system."""
+
+    STAGES = ('fft', 'holokern', 'multiply', 'ifft2')
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.reset()
+
+    def reset(self):
+        """Zeroes all of the timers and counters."""
+        self.seconds = dict.fromkeys(self.STAGES, 0.)
+        self.calls = dict.fromkeys(self.STAGES, 0)
+        self.bytes = dict.fromkeys(self.STAGES, 0)
+        self.last = {}
+        self.reconstructions = 0
+
+    @staticmethod
+    def clock():
+        """Returns the current time, to pass to record() as the start time."""
+        return timeit.default_timer()
+
+    def record(self, stage, start, nbytes=0):
+        """Adds the time since start, and the bytes allocated, to a stage."""
+        elapsed = timeit.default_timer() - start
+        self.seconds[stage] += elapsed
+        self.calls[stage] += 1
+        self.bytes[stage] += nbytes
+        self.last[stage] = self.last.get(stage, 0.) + elapsed
+
+    def begin(self):
+        """Marks the start of a reconstruction."""
+        self.last = {}
+
+    def end(self, z):
+        """Marks the end of a reconstruction and calls the callback."""
+        self.reconstructions += 1
+        if self.callback is not None:
+            self.callback(self, z)
+
+    @property
+    def total_seconds(self):
+        """Returns the time spent in all of the stages."""
+        return sum(self.seconds.values())
+
+    def as_dict(self):
+        """Returns the counters as a dictionary of plain values."""
+        return {'reconstructions': self.reconstructions,
+                'stages': dict((stage, {'seconds': self.seconds[stage],
+                                        'calls': self.calls[stage],
+                                        'bytes': self.bytes[stage]})
+                               for stage in self.STAGES)}
+
+
+def _uniform_step(z_values):
+    """Returns the step between evenly-spaced depths, or None if uneven."""
+    if len(z_values) < 2:
+        return None
+    steps = numpy.diff(z_values)
+    tolerance = 1e-9 * numpy.max(numpy.abs(z_values))
+    if numpy.all(numpy.abs(steps - steps[0]) <= tolerance):
+        return steps[0]
+    return None
+
+
+# Number of pixels converted at a time by _convert_pixels when the source
+# has to be byte-swapped.
+CONVERT_BLOCK_PIXELS = 2 ** 20
+
+def _convert_pixels(img, scale, dtype):
+    """Returns img * scale as a new array of the given dtype.
+
+    This is the only full-size allocation: numpy converts the pixels in small
+    buffered blocks. Big-endian pixels (eg, 16-bit PGM files) are swapped a
+    block of rows at a time, since numpy's casts of non-native data are slow."""
+    out = numpy.empty(img.shape, dtype=dtype)
+    if img.dtype.isnative:
+        numpy.multiply(img, scale, out=out, dtype=dtype)
+        return out
+    native = img.view(img.dtype.newbyteorder('='))
+    rows = max(1, CONVERT_BLOCK_PIXELS // max(1, numpy.prod(img.shape[1:])))
+    for start in range(0, img.shape[0], rows):
+        numpy.multiply(native[start:start + rows].byteswap(), scale,
+                       out=out[start:start + rows], dtype=dtype)
+    return out
+
+
+class FrequencyGrid(object):
+    """Read-only frequency grids for one sampling geometry.
+
+    u and v are the 1D x- and y-direction spatial frequencies, in FFT order.
+    The 2D grids U, V (in the working dtype) and R2 = U^2 + V^2 (always double
+    precision; see Hologram._make_frequency_grids) are only built the first
+    time they are needed, so holograms using separable kernels never pay for
+    them. Use frequency_grid() to get a shared instance."""
+
+    def __init__(self, nx, ny, dx, dy, dtype):
+        self.nx = nx
+        self.ny = ny
+        self.dx = dx
+        self.dy = dy
+        self.dtype = numpy.dtype(dtype)
+        self.u = _read_only(numpy.fft.fftfreq(nx, dx))
+        self.v = _read_only(numpy.fft.fftfreq(ny, dy))
+        self._U = None
+        self._V = None
+        self._R2 = None
+        self._lock = threading.Lock()
+
+    def _make_2d_grids(self):
+        """Builds the 2D grids, once."""
+        with self._lock:
+            if self._R2 is None:
+                U, V = numpy.meshgrid(self.u, self.v)
+                self._U = _read_only(U.astype(self.dtype, copy=False))
+                self._V = _read_only(V.astype(self.dtype, copy=False))
+                self._R2 = _read_only(U ** 2.0 + V ** 2.0)
+
+    @property
+    def U(self):
+        """Returns the 2D grid of x-direction frequencies."""
+        self._make_2d_grids()
+        return self._U
+
+    @property
+    def V(self):
+        """Returns the 2D grid of y-direction frequencies."""
+        self._make_2d_grids()
+        return self._V
+
+    @property
+    def R2(self):
+        """Returns U^2 + V^2 in double precision."""
+        self._make_2d_grids()
+        return self._R2
+
+
+# Process-wide cache of FrequencyGrids. The Holograms using a grid hold the
+# only strong references to it, so a grid is dropped from the cache as soon as
+# no Hologram uses that geometry any more.
+_frequency_grids = weakref.WeakValueDictionary()
+_frequency_grids_lock = threading.Lock()
+
+def frequency_grid(nx, ny, dx, dy=None, dtype=numpy.float64):
+    """Returns the shared FrequencyGrid for a sampling geometry.
+
+    dx and dy are the sample spacings; dy defaults to dx."""
+    if dy is None:
+        dy = dx
+    key = (nx, ny, dx, dy, numpy.dtype(dtype).str)
+    with _frequency_grids_lock:
+        grid = _frequency_grids.get(key)
+        if grid is None:
+            grid = FrequencyGrid(nx, ny, dx, dy, dtype)
+            _frequency_grids[key] = grid
+    return grid
+
+def _read_only(array):
+    """Marks an array as read-only and returns it."""
+    array.flags.writeable = False
+    return array
+
+def _band_indices(n, m):
+    """Indices of the m lowest frequencies of an n-sample FFT, in FFT order.
+
+    The selected frequencies are exactly those of an m-sample FFT with the
+    same frequency spacing, so the cropped spectrum can be inverse-transformed
+    directly to give an m-sample signal."""
+    n_positive = (m + 1) // 2
+    return numpy.concatenate((numpy.arange(n_positive),
+                              numpy.arange(n - (m - n_positive), n)))
 
 
 class Hologram(object):
-    def __init__(self, wavelength=0.500e-3, pixel_size=0.010):
+    """Digital hologram and its reconstructions.
+
+    The dtype sets the working precision: numpy.float64 (the default) or
+    numpy.float32. In single precision the data is stored as float32 and the
+    spectrum, kernels and fields are complex64, halving their memory. The
+    phase of the kernel is still evaluated in double precision, so only the
+    final kernel values are rounded. The numpy FFT backend always computes in
+    double precision; use the scipy or pyfftw backends to get the speed-up
+    of single-precision transforms.
+
+    The kernel_mode is one of KERNEL_MODES. In 'separable' mode, only the 1D
+    frequency vectors are stored, the kernel's two 1D factors are computed
+    with nx + ny complex exponentials instead of nx * ny, and reconstruct()
+    applies the factors to the spectrum as two broadcast multiplies without
+    forming the 2D kernel.
+
+    With workspace=True, reconstruct() works in buffers which are allocated
+    once per geometry: the kernel, the product with the spectrum and the field
+    are all computed in place. See reconstruct() for the lifetime of the
+    returned field.
+
+    Hologram.stats is None by default; set it to a ReconstructionStats (or
+    use the instrument() context manager) to time the stages of each call to
+    reconstruct(). Without stats, the only overhead is a check for None."""
+
+    def __init__(self, wavelength=0.500e-3, pixel_size=0.010,
+                 kernel_cache_bytes=KERNEL_CACHE_MAX_BYTES, fft_backend=None,
+                 dtype=numpy.float64, kernel_mode='full', workspace=False):
         # Values related to the physics.
         # _data holds the raw hologram data, if it has been loaded.
         self._data = None
         self.wavelength = wavelength
         self._pixel_size = pixel_size
+        if numpy.dtype(dtype) not in (numpy.float32, numpy.float64):
+            raise ValueError('dtype must be numpy.float32 or numpy.float64.')
+        self._dtype = numpy.dtype(dtype)
+        if kernel_mode not in KERNEL_MODES:
+            raise ValueError('kernel_mode must be one of %s.' % (KERNEL_MODES,))
+        self._kernel_mode = kernel_mode
 
         # Internal state.
         # nx, ny are the number of samples in the x and y directions.
@@ -30,9 +592,21 @@ class Hologram(object):
         self._ny = None
         # fft holds the fast Fourier transform of the source _data.
         self.fft = None
-        # _freq_R2 = U^2 + V^2, a variable which is used repeatedly when
-        # calculating a diffraction kernel.
-        self._freq_R2 = None
+        # kernel_cache holds recently-used propagation kernels.
+        self.kernel_cache = KernelCache(kernel_cache_bytes)
+        # _freq_u, _freq_v are the 1D frequency vectors; _freq_R2 =
+        # U^2 + V^2, a variable which is used repeatedly when calculating a
+        # diffraction kernel (only in the 'full' kernel mode).
+        self._reset_frequency_grids()
+        # _fft_backend computes the FFTs; None uses the module-wide default.
+        self.fft_backend = fft_backend
+        # workspace selects in-place reconstructions; _workspace holds the
+        # buffers, which are allocated on first use.
+        self.workspace = workspace
+        # stats collects per-stage timings of reconstruct() if it isn't None.
+        self.stats = None
+        # iterative_stats describes the last reconstruct_iterative() call.
+        self.iterative_stats = None
 
         # Reset all variables related to reconstruction
         self._reset_reconstruction()
@@ -43,29 +617,64 @@ class Hologram(object):
         self.field = None
         self._set_z(None)
 
-    def load(self, data):
+    def load(self, data, bit_depth=None, shape=None, raw_dtype=None,
+             offset=0):
         """Loads data into a Hologram object.
 
         The data can either be a numpy array already in memory or a filename
-        to read from disk using opencv.
+        to read from disk.
 
-        If the data is a numpy array, it is assumed to be floating point and
-        single channel.
+        If the data is a numpy array, it is assumed to be single channel. Real
+        data is converted to the Hologram's dtype (without a copy if it
+        already matches) and complex data to the matching complex dtype.
 
-        If the data is a string, it is treated as a file on disk. The file is
-        read into an array, converted to grayscale if it is 3-channel, and 
-        divided by 255 to convert to floating point."""
+        If the data is a string, it is treated as a file on disk. npy, PGM and
+        uncompressed TIFF files are memory-mapped (see
+        imageutils.memmap_image), as are raw sensor frames, for which the
+        shape (rows, columns), raw_dtype and header offset are needed. Other
+        images are read with opencv, keeping their bit depth, and converted
+        to grayscale if they are in color. The pixels are scaled to a [0..1]
+        range: by 2**bit_depth - 1 if bit_depth is given (eg, 12 for 12-bit
+        frames stored in 16-bit words), or else by the white level of the
+        file (see imageutils.image_white_level). The conversion is a single
+        pass from the file's pixels into the Hologram's dtype."""
         if isinstance(data, basestring):
-            img = cv2utils.imread(data)
-            if imageutils.nchannels(img) == 3:
-                print "Converting 3-channel image to grayscale..."
-                img = cv2color.bgr2gray(img)
-            self.data = img / 255. #converts to float, [0..1] range
+            img = self._read_image(data, shape, raw_dtype, offset)
+            if bit_depth is not None:
+                white = 2 ** bit_depth - 1
+            else:
+                white = imageutils.image_white_level(data, img.dtype)
+            dtype = (self.complex_dtype if numpy.iscomplexobj(img)
+                     else self.dtype)
+            self.data = _convert_pixels(img, 1. / white, dtype)
         elif isinstance(data, numpy.ndarray):
-            self.data = data
+            if numpy.iscomplexobj(data):
+                self.data = numpy.asarray(data, dtype=self.complex_dtype)
+            else:
+                self.data = numpy.asarray(data, dtype=self.dtype)
         else:
             raise TypeError("Must be a numpy array or a filename.")
 
+    @staticmethod
+    def _read_image(filename, shape=None, raw_dtype=None, offset=0):
+        """Opens an image file as a single-channel array; see load()."""
+        ext = os.path.splitext(filename)[1].lower()
+        if shape is not None or ext in ('.npy', '.pgm', '.tif', '.tiff'):
+            try:
+                return imageutils.memmap_image(filename, shape, raw_dtype,
+                                               offset)
+            except ValueError:
+                #compressed, tiled or multi-channel TIFFs and ASCII PGMs are
+                #left to opencv
+                if ext not in ('.pgm', '.tif', '.tiff'):
+                    raise
+        img = cv2utils.imread(filename, cv2.IMREAD_UNCHANGED)
+        if imageutils.nchannels(img) == 4:
+            img = img[..., :3]
+        if imageutils.nchannels(img) == 3:
+            img = cv2color.bgr2gray(img)
+        return img
+
     @property
     def data(self):
         """Returns the source data as a floating-point numpy array."""
@@ -84,6 +693,41 @@ class Hologram(object):
             self.ny = self.data.shape[0]
             self.nx = self.data.shape[1]
 
+    @property
+    def dtype(self):
+        """Returns the real-valued working dtype."""
+        return self._dtype
+
+    @property
+    def complex_dtype(self):
+        """Returns the complex-valued dtype of the spectrum, kernels and fields."""
+        return numpy.result_type(self._dtype, numpy.complex64)
+
+    @property
+    def kernel_mode(self):
+        """Returns the kernel mode, 'full' or 'separable'."""
+        return self._kernel_mode
+
+    @property
+    def fft_backend(self):
+        """Returns the FFT backend used for reconstructions.
+
+        Unless a backend has been set for this Hologram, the module-wide
+        default from set_fft_backend() is used. A backend can be set with
+        either a name or a backend object; set None to go back to the module
+        default:
+          holo.fft_backend = 'scipy'
+          holo.fft_backend = FFTWFFT(threads=4)"""
+        if self._fft_backend is None:
+            return get_fft_backend()
+        return self._fft_backend
+
+    @fft_backend.setter
+    def fft_backend(self, backend):
+        if backend is not None:
+            backend = make_fft_backend(backend)
+        self._fft_backend = backend
+
     @property
     def pixel_size(self):
         """Returns the physical size of a pixel."""
@@ -92,7 +736,7 @@ class Hologram(object):
     @pixel_size.setter
     def pixel_size(self, pixel_size):
         if self._pixel_size != pixel_size:
-            self._freq_R2 = None
+            self._reset_frequency_grids()
         self._pixel_size = pixel_size
 
     @property
@@ -103,7 +747,7 @@ class Hologram(object):
     @ny.setter
     def ny(self, ny):
         if self._ny != ny:
-            self._freq_R2 = None
+            self._reset_frequency_grids()
         self._ny = ny
 
     @property
@@ -114,7 +758,7 @@ class Hologram(object):
     @nx.setter
     def nx(self, nx):
         if self._nx != nx:
-            self._freq_R2 = None
+            self._reset_frequency_grids()
         self._nx = nx
 
     @property
@@ -181,36 +825,565 @@ class Hologram(object):
         The field is returned after the computation completes. The field is also
         accessible from Hologram.field.
 
-        The field is, in general, a complex-valued array."""
+        The field is, in general, a complex-valued array.
+
+        In the 'separable' kernel mode the kernel factors are applied directly
+        and Hologram.kernel is set to None; use holokern() if the 2D kernel
+        itself is needed.
+
+        In workspace mode, the kernel is evaluated in place (bypassing the
+        kernel cache) and the returned field is a view of the workspace, as is
+        Hologram.kernel. Both are only valid until the next call to
+        reconstruct(), which overwrites them; copy the field to keep it. The
+        workspace is re-allocated if the geometry or dtype changes. Apart from
+        the small separable factors, no memory is allocated per call in
+        workspace mode with the pyfftw backend; the numpy and scipy backends
+        still allocate the inverse FFT's output internally.
+
+        If Hologram.stats is set, the time spent in each stage is added to it;
+        see ReconstructionStats."""
+        stats = self.stats
+        if stats is not None:
+            stats.begin()
+        self._prepare_fft()
+        if self.workspace:
+            self.field = self._reconstruct_in_workspace(z, stats)
+        else:
+            spectrum = self._propagate_spectrum(z, stats)
+            if stats is None:
+                self.field = self._ifft2(spectrum)
+            else:
+                start = stats.clock()
+                self.field = self._ifft2(spectrum)
+                stats.record('ifft2', start, self.field.nbytes)
+        self._set_z(z)
+        if stats is not None:
+            stats.end(z)
+        return self.field
+
+    @contextlib.contextmanager
+    def instrument(self, callback=None):
+        """Context manager which times the reconstructions in its block.
+
+        Yields a new ReconstructionStats, which is installed as
+        Hologram.stats for the duration of the block; the previous stats are
+        restored afterwards. callback is passed on to the ReconstructionStats.
+
+          with holo.instrument() as stats:
+              holo.reconstruct(z)
+          print(stats.seconds)"""
+        previous = self.stats
+        self.stats = ReconstructionStats(callback)
+        try:
+            yield self.stats
+        finally:
+            self.stats = previous
+
+    def _get_workspace(self):
+        """Returns the workspace buffers, allocating them if needed."""
+        shape = (self.ny, self.nx)
+        workspace = self._workspace
+        if (workspace is None or workspace['field'].shape != shape or
+                workspace['field'].dtype != self.complex_dtype):
+            workspace = {'phase': numpy.empty(shape, dtype=float),
+                         'kernel': numpy.empty(shape, dtype=self.complex_dtype),
+                         'product': empty_aligned(shape, self.complex_dtype),
+                         'field': empty_aligned(shape, self.complex_dtype)}
+            self._workspace = workspace
+        return workspace
+
+    def _reconstruct_in_workspace(self, z, stats=None):
+        """Reconstructs at a depth using only the workspace buffers.
+
+        Stage timings are added to stats, if it isn't None."""
+        workspace = self._get_workspace()
+        product = workspace['product']
+        if stats is not None:
+            start = stats.clock()
+            misses = self.kernel_cache.misses
+        if self.kernel_mode == 'separable':
+            kv, ku = self.holokern_factors(z)
+            if stats is not None:
+                #a cache hit doesn't allocate new factors
+                computed = self.kernel_cache.misses > misses
+                stats.record('holokern', start,
+                             kv.nbytes + ku.nbytes if computed else 0)
+                start = stats.clock()
+            numpy.multiply(self.fft, kv[:, numpy.newaxis], out=product)
+            product *= ku
+            self.kernel = None
+        else:
+            self._prepare_frequency_grids()
+            phase = workspace['phase']
+            kernel = workspace['kernel']
+            numpy.multiply(self._freq_R2, numpy.pi * self.wavelength * z,
+                           out=phase)
+            numpy.cos(phase, out=kernel.real)
+            numpy.sin(phase, out=kernel.imag)
+            if stats is not None:
+                stats.record('holokern', start)
+                start = stats.clock()
+            numpy.multiply(self.fft, kernel, out=product)
+            self.kernel = kernel
+        if stats is None:
+            return self.fft_backend.ifft2(product, overwrite=True,
+                                          out=workspace['field'])
+        stats.record('multiply', start)
+        start = stats.clock()
+        field = self.fft_backend.ifft2(product, overwrite=True,
+                                       out=workspace['field'])
+        stats.record('ifft2', start)
+        return field
+
+    def _propagate_spectrum(self, z, stats=None):
+        """Returns the spectrum multiplied by the kernel for a depth.
+
+        Hologram.kernel is updated as described in reconstruct(). The kernel
+        and multiply stage timings are added to stats, if it isn't None."""
+        if stats is not None:
+            start = stats.clock()
+            misses = self.kernel_cache.misses
+        if self.kernel_mode == 'separable':
+            kv, ku = self.holokern_factors(z)
+            if stats is not None:
+                #a cache hit doesn't allocate new factors
+                computed = self.kernel_cache.misses > misses
+                stats.record('holokern', start,
+                             kv.nbytes + ku.nbytes if computed else 0)
+                start = stats.clock()
+            spectrum = self.fft * kv[:, numpy.newaxis]
+            spectrum *= ku
+            self.kernel = None
+        else:
+            self.holokern(z)
+            if stats is not None:
+                computed = self.kernel_cache.misses > misses
+                stats.record('holokern', start,
+                             self.kernel.nbytes if computed else 0)
+                start = stats.clock()
+            spectrum = self.fft * self.kernel
+        if stats is not None:
+            stats.record('multiply', start, spectrum.nbytes)
+        return spectrum
+
+    def reconstruct_iterative(self, z, iterations=50, tolerance=1e-4,
+                              support=None, callback=None):
+        """Reconstructs at a depth with iterative twin-image suppression.
+
+        An in-line hologram only records the intensity at the sensor, and the
+        missing phase shows up as the out-of-focus twin image. This method
+        recovers the phase by bouncing between the sensor and object planes
+        (Gerchberg-Saxton, with the constraints of Latychevskaia and Fink,
+        PRL 98, 233901 (2007)):
+          1. propagate the sensor field to the object plane at z;
+          2. apply the object constraints: objects can only absorb, so the
+             amplitude is limited to 1, and if a support mask is given (True
+             where there are objects), the field outside of it is set to 1;
+          3. propagate back to the sensor plane at -z;
+          4. keep the phase, but replace the amplitude with the measured one.
+        The data must be an intensity hologram, normalized here so that its
+        mean background is 1. The iterations start from the measured
+        amplitude, the square root of the normalized intensity, with a flat
+        phase; so unlike reconstruct(z), which propagates the intensity
+        itself, even the first propagation differs from the plain
+        reconstruction. Off-axis holograms have no twin image to suppress,
+        and OffAxisHologram raises a ValueError.
+
+        The +z and -z kernels, the working buffers and (with the pyfftw
+        backend) the FFT plans are set up once and re-used by every
+        iteration; the numpy and scipy backends still allocate the outputs of
+        their transforms internally. The iterations stop early once the
+        relative change in the sensor-plane amplitude error,
+          error = ||(|U| - A)|| / ||A||
+        for the propagated field U and the measured amplitude A, falls below
+        tolerance. If callback is given, it is called as callback(iteration,
+        error) after each iteration.
+
+        Returns the object-plane field, which is also stored to
+        Hologram.field. Hologram.iterative_stats is set to a dictionary with
+        the number of 'iterations', the final 'error', the list of 'errors',
+        the 'seconds' taken and the 'iterations_per_sec'."""
         if self.data is None:
             raise ValueError("No data to reconstruct.")
-        if self.fft is None:
-            self.fft = numpy.fft.fft2(self.data)
-        
-        self.holokern(z)
-        self.field = numpy.fft.ifft2(self.fft * self.kernel)
+        if numpy.iscomplexobj(self.data):
+            raise ValueError('Iterative reconstructions need an intensity '
+                             'hologram.')
+        start_time = timeit.default_timer()
+        shape = (self.ny, self.nx)
+        backend = self.fft_backend
+        amplitude = numpy.sqrt(numpy.maximum(self.data, 0)).astype(
+            self.dtype, copy=False)
+        amplitude = amplitude / amplitude.mean()
+        amplitude_norm = numpy.sqrt(numpy.vdot(amplitude, amplitude).real)
+        if self.kernel_mode == 'separable':
+            forward = numpy.outer(*self.holokern_factors(z))
+        else:
+            self.holokern(z)
+            forward = self.kernel
+        backward = numpy.conjugate(forward)
+        outside = None
+        if support is not None:
+            outside = ~numpy.asarray(support, dtype=bool)
+        sensor = empty_aligned(shape, self.complex_dtype)
+        spectrum = empty_aligned(shape, self.complex_dtype)
+        field = empty_aligned(shape, self.complex_dtype)
+        magnitude = numpy.empty(shape, dtype=self.dtype)
+        difference = numpy.empty(shape, dtype=self.dtype)
+        too_bright = numpy.empty(shape, dtype=bool)
+        sensor[...] = amplitude
+        errors = []
+        for iteration in range(iterations):
+            #to the object plane, and apply the constraints
+            backend.fft2(sensor, overwrite=True, out=spectrum)
+            spectrum *= forward
+            backend.ifft2(spectrum, overwrite=True, out=field)
+            numpy.abs(field, out=magnitude)
+            numpy.greater(magnitude, 1, out=too_bright)
+            numpy.divide(field, magnitude, out=field, where=too_bright)
+            if outside is not None:
+                numpy.copyto(field, 1, where=outside)
+            #back to the sensor plane, and restore the measured amplitude
+            backend.fft2(field, out=spectrum)
+            spectrum *= backward
+            backend.ifft2(spectrum, overwrite=True, out=sensor)
+            numpy.abs(sensor, out=magnitude)
+            numpy.subtract(magnitude, amplitude, out=difference)
+            error = numpy.sqrt(numpy.vdot(difference, difference).real)
+            errors.append(error / amplitude_norm)
+            if callback is not None:
+                callback(iteration, errors[-1])
+            numpy.maximum(magnitude, numpy.finfo(self.dtype).tiny,
+                          out=magnitude)
+            numpy.divide(amplitude, magnitude, out=magnitude)
+            sensor *= magnitude
+            if (len(errors) > 1 and
+                    abs(errors[-2] - errors[-1]) <= tolerance * errors[-1]):
+                break
+        seconds = timeit.default_timer() - start_time
+        self.iterative_stats = {'iterations': len(errors),
+                                'error': errors[-1] if errors else None,
+                                'errors': errors,
+                                'seconds': seconds,
+                                'iterations_per_sec': len(errors) / seconds}
+        self.field = field
         self._set_z(z)
         return self.field
 
+    def scan(self, z_values, refresh=SCAN_REFRESH):
+        """Generator over reconstructions at a sequence of depths.
+
+        Yields (z, field) for each depth in z_values, in order, holding only
+        one field in memory at a time. Hologram.field and Hologram.z are not
+        changed.
+
+        When the depths are evenly spaced by dz, the kernels are updated with
+        the recurrence kernel(z + dz) = kernel(z) * kernel(dz): one complex
+        multiply per sample instead of a complex exponential. The kernel is
+        re-evaluated exactly every refresh depths so that the round-off in the
+        recurrence stays bounded. Irregular depths, and the 'separable' kernel
+        mode (where the kernel factors are already cheap), use the kernels
+        from holokern() directly."""
+        self._prepare_fft()
+        z_values = numpy.atleast_1d(numpy.asarray(z_values, dtype=float))
+        dz = _uniform_step(z_values)
+        if dz is None or self.kernel_mode == 'separable':
+            for z in z_values:
+                yield z, self._ifft2(self._propagate_spectrum(z))
+            return
+        step = self.holokern_stack([dz])[0]
+        for index, z in enumerate(z_values):
+            if index % refresh == 0:
+                kernel = self.holokern_stack([z])[0]
+            else:
+                kernel *= step
+            yield z, self._ifft2(self.fft * kernel)
+
+    def preview(self, z, factor=4, antialias=False):
+        """Quick, reduced-resolution reconstruction at a propagation distance.
+
+        Only the central (low-frequency) band of the spectrum, 1/factor of its
+        size in each direction, is multiplied by the kernel and inverse-
+        transformed. The result is a field downsampled by factor, with a
+        sample spacing of about factor * pixel_size, for roughly 1/factor^2 of
+        the cost of a full reconstruction; it is scaled to match the
+        amplitude of the full-resolution field.
+
+        If antialias is True, frequencies above aliasing_pixel(z), where the
+        kernel itself is undersampled, are also removed.
+
+        The preview is returned; Hologram.field, kernel and z are unchanged."""
+        self._prepare_fft()
+        ny = max(1, self.ny // factor)
+        nx = max(1, self.nx // factor)
+        rows = _band_indices(self.ny, ny)
+        cols = _band_indices(self.nx, nx)
+        u = numpy.fft.fftfreq(self.nx, self.dx)[cols]
+        v = numpy.fft.fftfreq(self.ny, self.dy)[rows]
+        spectrum = self.fft[numpy.ix_(rows, cols)]
+        #the kernel is separable, so only nx + ny exponentials are needed
+        a = numpy.pi * self.wavelength * z
+        spectrum *= self._phase_kernel(a * v ** 2.0)[:, numpy.newaxis]
+        spectrum *= self._phase_kernel(a * u ** 2.0)[numpy.newaxis, :]
+        if antialias and z != 0:
+            df = 1. / (self.nx * self.dx)
+            f_alias = self.aliasing_pixel(abs(z)) * df
+            R2 = numpy.add.outer(v ** 2.0, u ** 2.0)
+            spectrum[R2 > f_alias ** 2.0] = 0
+        field = self._ifft2(spectrum)
+        field *= float(nx * ny) / (self.nx * self.ny)
+        return field
+
+    def _prepare_fft(self):
+        """Computes the Fourier transform of the data if it is not available."""
+        if self.data is None:
+            raise ValueError("No data to reconstruct.")
+        if self.fft is None:
+            stats = self.stats
+            if stats is not None:
+                start = stats.clock()
+            self.fft = self.fft_backend.fft2(self.data).astype(
+                self.complex_dtype, copy=False)
+            if stats is not None:
+                stats.record('fft', start, self.fft.nbytes)
+
+    def _ifft2(self, spectrum):
+        """Inverse FFT in the working precision; overwrites the spectrum."""
+        return self.fft_backend.ifft2(spectrum, overwrite=True).astype(
+            self.complex_dtype, copy=False)
+
+    def reconstruct_stack(self, z_values, max_bytes=STACK_MAX_BYTES):
+        """Reconstruct the optical field at a series of propagation distances.
+
+        Returns a complex-valued volume with shape (len(z_values), ny, nx),
+        where volume[k] is the field at z_values[k]. The depths are processed
+        in chunks: the kernels for a whole chunk are built at once and the
+        chunk is inverse-transformed in a single batched FFT. The chunk size
+        is chosen so that the temporary arrays stay within max_bytes; the
+        returned volume itself is not counted against the budget.
+
+        Unlike reconstruct(), Hologram.field, Hologram.kernel and Hologram.z
+        are left untouched."""
+        if self.data is None:
+            raise ValueError("No data to reconstruct.")
+        z_values = numpy.atleast_1d(numpy.asarray(z_values, dtype=float))
+        volume = numpy.empty((z_values.size, self.ny, self.nx),
+                             dtype=self.complex_dtype)
+        start = 0
+        for _, fields in self.iter_stack(z_values, max_bytes):
+            volume[start:start + len(fields)] = fields
+            start += len(fields)
+        return volume
+
+    def iter_stack(self, z_values, max_bytes=STACK_MAX_BYTES):
+        """Generator over chunks of a multi-depth reconstruction.
+
+        Yields (z_chunk, fields) pairs, where fields has the shape
+        (len(z_chunk), ny, nx) and fields[k] is the field at z_chunk[k]. Use
+        this instead of reconstruct_stack() when the full volume does not need
+        to be held in memory at once. The chunk size is set from max_bytes,
+        as described in reconstruct_stack()."""
+        z_values = numpy.atleast_1d(numpy.asarray(z_values, dtype=float))
+        wavelengths = numpy.full(z_values.shape, self.wavelength)
+        for start, fields in self._iter_chunks(wavelengths, z_values,
+                                               max_bytes):
+            yield z_values[start:start + len(fields)], fields
+
+    def _iter_chunks(self, wavelengths, z_values, max_bytes):
+        """Yields (start, fields) for chunks of (wavelength, z) pairs.
+
+        wavelengths and z_values are 1D arrays of the same length; fields[k] is
+        the field for the pair at index start + k."""
+        self._prepare_fft()
+        chunk = self.stack_chunk_size(max_bytes)
+        for start in range(0, z_values.size, chunk):
+            z_chunk = z_values[start:start + chunk]
+            wavelength_chunk = wavelengths[start:start + chunk]
+            if self.kernel_mode == 'separable':
+                kv, ku = self._kernel_factors(z_chunk, wavelength_chunk)
+                spectra = self.fft * kv[:, :, numpy.newaxis]
+                spectra *= ku[:, numpy.newaxis, :]
+            else:
+                spectra = self.holokern_stack(z_chunk, wavelength_chunk)
+                spectra *= self.fft
+            yield start, self._ifft2(spectra)
+
+    def reconstruct_wavelengths(self, wavelengths, z_values,
+                                max_bytes=STACK_MAX_BYTES):
+        """Reconstruct the field for several wavelengths and depths.
+
+        For holograms recorded with several lasers at once, the spectrum of
+        the data is computed once and shared by every wavelength; only the
+        kernels differ. Returns a complex-valued array with shape
+        (len(wavelengths), len(z_values), ny, nx), where fields[i, j] is the
+        field for wavelengths[i] at z_values[j]. The (wavelength, depth) pairs
+        are processed in chunks within max_bytes, as for reconstruct_stack().
+        Hologram.wavelength, field, kernel and z are left untouched."""
+        if self.data is None:
+            raise ValueError("No data to reconstruct.")
+        wavelengths = numpy.atleast_1d(numpy.asarray(wavelengths, dtype=float))
+        z_values = numpy.atleast_1d(numpy.asarray(z_values, dtype=float))
+        volume = numpy.empty((wavelengths.size, z_values.size,
+                              self.ny, self.nx), dtype=self.complex_dtype)
+        pairs = volume.reshape((-1, self.ny, self.nx))
+        for start, fields in self.iter_wavelength_stack(wavelengths, z_values,
+                                                        max_bytes):
+            pairs[start:start + len(fields)] = fields
+        return volume
+
+    def iter_wavelength_stack(self, wavelengths, z_values,
+                              max_bytes=STACK_MAX_BYTES):
+        """Generator over chunks of a multi-wavelength reconstruction.
+
+        The (wavelength, depth) pairs are taken in wavelength-major order,
+        pair index = i * len(z_values) + j for wavelengths[i] and z_values[j].
+        Yields (start, fields), where fields[k] is the field for the pair with
+        index start + k."""
+        wavelengths = numpy.atleast_1d(numpy.asarray(wavelengths, dtype=float))
+        z_values = numpy.atleast_1d(numpy.asarray(z_values, dtype=float))
+        pair_wavelengths = numpy.repeat(wavelengths, z_values.size)
+        pair_z = numpy.tile(z_values, wavelengths.size)
+        return self._iter_chunks(pair_wavelengths, pair_z, max_bytes)
+
+    def stack_chunk_size(self, max_bytes=STACK_MAX_BYTES):
+        """Number of depths to process at once within a memory budget.
+
+        Each depth in a chunk needs a double-precision phase array (except in
+        the 'separable' kernel mode), a complex kernel array (which is re-used
+        for the product with the spectrum) and a complex output array from the
+        inverse FFT. At least one depth is always processed, even if it
+        exceeds the budget."""
+        n_samples = self.nx * self.ny
+        bytes_per_depth = n_samples * 2 * self.complex_dtype.itemsize
+        if self.kernel_mode == 'full':
+            bytes_per_depth += n_samples * numpy.dtype(float).itemsize
+        return max(1, int(max_bytes // bytes_per_depth))
+
+    def _phase_coefficient(self, z_values, wavelengths=None):
+        """Returns a = pi * wavelength * z, the kernel phase per unit R2.
+
+        wavelengths defaults to Hologram.wavelength, and otherwise is
+        broadcast against z_values."""
+        if wavelengths is None:
+            wavelengths = self.wavelength
+        return numpy.pi * numpy.multiply(wavelengths, z_values, dtype=float)
+
+    def holokern_stack(self, z_values, wavelengths=None):
+        """Construct propagation kernels for several depths at once.
+
+        Returns an array with shape (len(z_values), ny, nx) where the k-th
+        plane is the kernel for z_values[k]. Hologram.kernel is not changed.
+        An array of wavelengths, one per depth, can be given to override
+        Hologram.wavelength."""
+        if self.kernel_mode == 'separable':
+            kv, ku = self._kernel_factors(z_values, wavelengths)
+            return kv[:, :, numpy.newaxis] * ku[:, numpy.newaxis, :]
+        self._prepare_frequency_grids()
+        a = self._phase_coefficient(z_values, wavelengths)
+        return self._phase_kernel(numpy.multiply.outer(a, self._freq_R2))
+
+    def _kernel_factors(self, z_values, wavelengths=None):
+        """Separable kernel factors for one or more depths.
+
+        Returns (kv, ku) with kv = exp(1j*a*v^2) and ku = exp(1j*a*u^2), where
+        a = pi * wavelength * z. For a scalar z, kv has ny samples and ku has
+        nx samples; for an array of depths, the depth is the leading axis.
+        The kernel at each depth is the outer product of kv and ku."""
+        self._prepare_frequency_grids()
+        a = self._phase_coefficient(z_values, wavelengths)
+        kv = self._phase_kernel(numpy.multiply.outer(a, self._freq_v ** 2.0))
+        ku = self._phase_kernel(numpy.multiply.outer(a, self._freq_u ** 2.0))
+        return kv, ku
+
+    def holokern_factors(self, z):
+        """Separable factors (kv, ku) of the propagation kernel for a depth.
+
+        The kernel is numpy.outer(kv, ku). The factors are kept in
+        Hologram.kernel_cache, stored together in a single read-only array."""
+        key = ('factors',) + self._kernel_key(z)
+        factors = self.kernel_cache.get(key)
+        if factors is None:
+            factors = numpy.concatenate(self._kernel_factors(z))
+            self.kernel_cache.put(key, factors)
+        return factors[:self.ny], factors[self.ny:]
+
+    def _phase_kernel(self, phase):
+        """Returns exp(1j * phase) in the working complex dtype.
+
+        The cosine and sine are evaluated at the precision of the phase (which
+        is double precision for all of the kernels) and only the results are
+        rounded to the working precision."""
+        kernel = numpy.empty(phase.shape, dtype=self.complex_dtype)
+        numpy.cos(phase, out=kernel.real)
+        numpy.sin(phase, out=kernel.imag)
+        return kernel
+
     def _make_frequency_grids(self):
         """Constructs u and v grids in the Fourier domain.
 
         u is the x-direction spatial frequency, while v is the y-direction
-        spatial frequency."""
-        u = numpy.fft.fftfreq(self.nx, self.pixel_size)
-        v = numpy.fft.fftfreq(self.ny, self.pixel_size)
-        self._freq_U, self._freq_V = numpy.meshgrid(u, v)
-        self._freq_R2 = self._freq_U ** 2.0 + self._freq_V ** 2.0
+        spatial frequency. U and V are stored in the working dtype, but
+        R2 = U^2 + V^2 is always double precision: the kernel phase,
+        pi * wavelength * z * R2, can reach thousands of radians at high
+        frequencies, and single precision would lose too much of it.
+
+        In the 'separable' kernel mode, only the 1D vectors u and v are kept.
+
+        The grids are read-only and shared with every other Hologram with the
+        same geometry and dtype, through frequency_grid()."""
+        self._grid = frequency_grid(self.nx, self.ny, self.dx, self.dy,
+                                    self.dtype)
+        self._freq_u = self._grid.u
+        self._freq_v = self._grid.v
+        if self.kernel_mode == 'full':
+            self._freq_R2 = self._grid.R2
+            self._freq_U = self._grid.U
+            self._freq_V = self._grid.V
+
+    def _prepare_frequency_grids(self):
+        """Makes the frequency grids if they are not available."""
+        if self._freq_u is None:
+            self._make_frequency_grids()
+
+    def _reset_frequency_grids(self):
+        """Discards the frequency grids and the kernels built from them."""
+        self._grid = None
+        self._workspace = None
+        self._freq_u = None
+        self._freq_v = None
+        self._freq_U = None
+        self._freq_V = None
+        self._freq_R2 = None
+        self.kernel_cache.clear()
+
+    def _kernel_key(self, z):
+        """Key which identifies the kernel for a depth in the kernel cache."""
+        return (z, self.wavelength, self.dx, self.dy, self.nx, self.ny)
 
     def holokern(self, z):
         """Construct the propagation kernel for a specific depth.
 
-        The kernel is stored to Hologram.kernel."""
-        if self._freq_R2 is None:
-            self._make_frequency_grids()
-        a = numpy.pi * self.wavelength * z
-        self.kernel = numpy.exp(1j * a * self._freq_R2)
-        #TODO: check speed of cos, sin, exp(i) methods
+        The kernel is stored to Hologram.kernel. Kernels are kept in
+        Hologram.kernel_cache, so asking for the same depth again returns the
+        cached (read-only) array instead of recomputing it.
+
+        In the 'separable' kernel mode, the kernel is the outer product of the
+        factors from holokern_factors()."""
+        if self.kernel_mode == 'separable':
+            self.kernel = numpy.outer(*self.holokern_factors(z))
+            return
+        key = self._kernel_key(z)
+        kernel = self.kernel_cache.get(key)
+        if kernel is None:
+            self._prepare_frequency_grids()
+            a = numpy.pi * self.wavelength * z
+            if self.complex_dtype == numpy.complex128:
+                kernel = numpy.exp(1j * a * self._freq_R2)
+            else:
+                #avoids a complex128 temporary in single precision
+                kernel = self._phase_kernel(a * self._freq_R2)
+            #TODO: check speed of cos, sin, exp(i) methods
+            self.kernel_cache.put(key, kernel)
+        self.kernel = kernel
 
     def holokern_cs(self, z):
         """Construct the propagation kernel; alternate cosine+sine version.
@@ -218,11 +1391,14 @@ class Hologram(object):
         The kernel is stored to Hologram.kernel. The only difference between
         holokern() and holokern_cs() is that this version uses the Euler
         identity to avoid a complex exponential. It is intended primarily for
-        comparing the speed of the two implementations."""
-        if self._freq_R2 is None:
-            self._make_frequency_grids()
+        comparing the speed of the two implementations, so the kernel cache is
+        not used."""
+        if self.kernel_mode == 'separable':
+            self.kernel = numpy.outer(*self._kernel_factors(z))
+            return
+        self._prepare_frequency_grids()
         R2 = self._freq_R2 * numpy.pi * self.wavelength * z
-        self.kernel = numpy.cos(R2) + 1j * numpy.sin(R2)
+        self.kernel = self._phase_kernel(R2)
 
     def plot_intensity(self):
         """Plots the intensity of a reconstructed field.
@@ -272,6 +1448,25 @@ class Hologram(object):
         plt.imshow(numpy.imag(self.field))
         plt.title('Imag')
 
+    def unwrap_phase(self, weighted=False, tolerance=1e-6,
+                     max_iterations=100):
+        """Returns the unwrapped phase of the reconstructed field.
+
+        Works on the last field from reconstruct(). If weighted is True, the
+        normalized magnitude of the field is used as the quality map, so dark
+        regions (where the phase is mostly noise) count for less. See the
+        module-level unwrap_phase() for the other options, and for unwrapping
+        stacks of fields."""
+        if self.field is None:
+            raise ValueError("No field to unwrap; call reconstruct() first.")
+        weights = None
+        if weighted:
+            weights = numpy.abs(self.field)
+            peak = weights.max()
+            if peak > 0:
+                weights /= peak
+        return unwrap_phase(self.field, weights, tolerance, max_iterations)
+
     def _is_ready_to_show(self, z=None):
         """Returns a bool for whether a field is ready to show.
         
@@ -327,5 +1522,469 @@ class Hologram(object):
         taking the zero-frequency pixel to be pixel[0, 0] in the Fourier
         domain. Round or floor the value to get the integer pixel to use as a
         Nyquist cut-off, or use the value as a float to construct a mask."""
-        df = 1. / (self.nx * self.pixel_size)
+        df = 1. / (self.nx * self.dx)
         return 1. / (2 * self.wavelength * z * df ** 2)
+
+
+class OffAxisHologram(Hologram):
+    """Off-axis digital hologram, reconstructed from its +1 sideband.
+
+    In an off-axis hologram, the tilted reference beam shifts the object's
+    spectrum to a carrier frequency, away from the DC term and the twin image
+    (the -1 sideband). Only a window around the +1 sideband is kept: it is
+    cropped from the spectrum of the data and re-centred so that the carrier
+    is at zero frequency, which also removes the reference tilt. Kernels,
+    inverse FFTs and fields then all use the much smaller window.
+
+    The window is sideband_fraction of the full spectrum in each direction,
+    so the reconstructed field has nx = sideband_fraction * sensor_nx samples
+    with a spacing dx = sensor_nx * pixel_size / nx (and likewise in y). The
+    carrier can be given as a (row, column) frequency index, with negative
+    frequencies as negative indices; by default, it is found as the brightest
+    point of the spectrum in the half-plane of positive x-frequencies, away
+    from the DC term -- the unscattered part of the object beam puts a peak
+    there. The carrier which was used is available from
+    OffAxisHologram.carrier once the spectrum has been computed."""
+
+    def __init__(self, wavelength=0.500e-3, pixel_size=0.010,
+                 sideband_fraction=1 / 3., carrier=None, **kwargs):
+        self.sideband_fraction = sideband_fraction
+        self._fixed_carrier = carrier
+        self.carrier = carrier
+        self.sensor_shape = None
+        super(OffAxisHologram, self).__init__(wavelength, pixel_size, **kwargs)
+
+    def _set_nx_ny_from_data(self):
+        """Sets the sample counts to the size of the sideband window."""
+        if not self._data is None:
+            if self.sensor_shape != self._data.shape[:2]:
+                #the sample spacing changes with the sensor size
+                self._reset_frequency_grids()
+            self.sensor_shape = self._data.shape[:2]
+            self.ny = max(1, int(round(self.sensor_shape[0] *
+                                       self.sideband_fraction)))
+            self.nx = max(1, int(round(self.sensor_shape[1] *
+                                       self.sideband_fraction)))
+
+    @property
+    def dx(self):
+        """Returns the sample spacing of the sideband field, x-direction.
+
+        Before data is loaded, this is the pixel size."""
+        if self.sensor_shape is None:
+            return self.pixel_size
+        return self.pixel_size * self.sensor_shape[1] / float(self.nx)
+
+    @property
+    def dy(self):
+        """Returns the sample spacing of the sideband field, y-direction.
+
+        Before data is loaded, this is the pixel size."""
+        if self.sensor_shape is None:
+            return self.pixel_size
+        return self.pixel_size * self.sensor_shape[0] / float(self.ny)
+
+    def _prepare_fft(self):
+        """Computes the re-centred sideband, if it is not available."""
+        if self.data is None:
+            raise ValueError("No data to reconstruct.")
+        if self.fft is not None:
+            return
+        stats = self.stats
+        if stats is not None:
+            start = stats.clock()
+        spectrum = self.fft_backend.fft2(self.data)
+        if self._fixed_carrier is None:
+            self.carrier = self.find_carrier(spectrum)
+        else:
+            self.carrier = self._fixed_carrier
+        sensor_ny, sensor_nx = self.sensor_shape
+        rows = (self.carrier[0] + _band_indices(sensor_ny, self.ny)) % sensor_ny
+        cols = (self.carrier[1] + _band_indices(sensor_nx, self.nx)) % sensor_nx
+        sideband = spectrum[numpy.ix_(rows, cols)]
+        #scale so that the field has the amplitude of the full-size field
+        sideband *= float(self.nx * self.ny) / (sensor_nx * sensor_ny)
+        self.fft = sideband.astype(self.complex_dtype, copy=False)
+        if stats is not None:
+            stats.record('fft', start, spectrum.nbytes + self.fft.nbytes)
+
+    def find_carrier(self, spectrum):
+        """Finds the carrier frequency of the +1 sideband in a spectrum.
+
+        Returns the (row, column) frequency index of the brightest point with
+        a positive x-frequency (or, on the v axis, a positive y-frequency),
+        excluding a region around DC as large as the sideband window: the DC
+        term spreads to twice the bandwidth of the object."""
+        sensor_ny, sensor_nx = spectrum.shape[-2:]
+        ky = numpy.fft.fftfreq(sensor_ny, 1. / sensor_ny)[:, numpy.newaxis]
+        kx = numpy.fft.fftfreq(sensor_nx, 1. / sensor_nx)[numpy.newaxis, :]
+        magnitude = numpy.abs(spectrum)
+        positive = (kx > 0) | ((kx == 0) & (ky > 0))
+        near_dc = (numpy.abs(ky) < self.ny) & (numpy.abs(kx) < self.nx)
+        magnitude[~positive | near_dc] = 0
+        row, col = numpy.unravel_index(numpy.argmax(magnitude), magnitude.shape)
+        return int(ky[row, 0]), int(kx[0, col])
+
+    def reconstruct_iterative(self, z, *args, **kwargs):
+        """Not available for off-axis holograms; raises a ValueError.
+
+        The sideband already separates the object wave from its twin, and the
+        iterations would need the full-sensor amplitude, not the sideband's.
+        Use reconstruct() instead."""
+        raise ValueError('Off-axis holograms have no twin image to suppress; '
+                         'use reconstruct() instead.')
+
+
+#
+# Phase unwrapping
+#
+
+# The unwrappers find the phase, phi, whose gradient best matches the wrapped
+# gradient of the measured phase in the (weighted) least-squares sense,
+#   minimize sum w * (grad(phi) - wrap(grad(psi)))^2,
+# following Ghiglia and Romero, JOSA A 11, 107 (1994). Without weights, this
+# is a Poisson equation with Neumann boundaries, which is diagonalized by the
+# type-II DCT; with weights, it is solved by conjugate gradients with the
+# unweighted solver as the preconditioner. All of the functions work on the
+# last two axes, so a (depth, ny, nx) stack is unwrapped in a single call.
+
+def _dctn(a):
+    """Orthonormal type-II DCT over the last two axes."""
+    if scipy_fft is not None:
+        return scipy_fft.dctn(a, type=2, axes=(-2, -1), norm='ortho',
+                              workers=multiprocessing.cpu_count())
+    return scipy.fftpack.dctn(a, type=2, axes=(-2, -1), norm='ortho')
+
+def _idctn(a):
+    """Inverse of _dctn."""
+    if scipy_fft is not None:
+        return scipy_fft.idctn(a, type=2, axes=(-2, -1), norm='ortho',
+                               workers=multiprocessing.cpu_count())
+    return scipy.fftpack.idctn(a, type=2, axes=(-2, -1), norm='ortho')
+
+def _wrap(phase):
+    """Wraps phases into [-pi, pi), in place."""
+    phase += numpy.pi
+    numpy.mod(phase, 2 * numpy.pi, out=phase)
+    phase -= numpy.pi
+    return phase
+
+def _divergence(gx, gy):
+    """Backward-difference divergence of forward-difference gradients.
+
+    gx has shape (..., ny, nx - 1) and gy has shape (..., ny - 1, nx); the
+    gradients are taken as zero across the edges (Neumann boundaries)."""
+    div = numpy.zeros(gx.shape[:-1] + gy.shape[-1:], dtype=gx.dtype)
+    div[..., :, :-1] += gx
+    div[..., :, 1:] -= gx
+    div[..., :-1, :] += gy
+    div[..., 1:, :] -= gy
+    return div
+
+def _poisson_dct(rho):
+    """Solves laplacian(phi) = rho with Neumann boundaries, using DCTs.
+
+    The solution has zero mean over each plane."""
+    ny, nx = rho.shape[-2:]
+    cos_y = numpy.cos(numpy.pi * numpy.arange(ny) / ny).astype(rho.dtype)
+    cos_x = numpy.cos(numpy.pi * numpy.arange(nx) / nx).astype(rho.dtype)
+    denominator = 2 * cos_y[:, numpy.newaxis] + 2 * cos_x - 4
+    denominator[0, 0] = 1
+    spectrum = _dctn(rho)
+    spectrum /= denominator
+    spectrum[..., 0, 0] = 0
+    return _idctn(spectrum)
+
+def unwrap_phase(phase, weights=None, tolerance=1e-6, max_iterations=100):
+    """Unwraps phase maps with a least-squares DCT solver.
+
+    Inputs:
+      phase: wrapped phase, with shape (ny, nx) or (..., ny, nx). Complex
+        input, such as Hologram.field or a stack from reconstruct_stack, is
+        unwrapped from its angle.
+      weights: optional quality map with the same shape as the phase, with
+        values in [0, 1] (eg, the normalized magnitude of the field);
+        unreliable pixels with low weights have less influence on the
+        solution. The weight of each phase difference is the square of the
+        smaller of the weights of its two pixels.
+      tolerance: with weights, the conjugate gradient iterations stop once
+        the residual of every plane has fallen by this factor.
+      max_iterations: limit on the number of conjugate gradient iterations.
+
+    Single-precision input is unwrapped in single precision. The result is
+    only defined up to a constant, so each plane is shifted to match the mean
+    of the wrapped phase; the unwrapped phase is generally not congruent with
+    the wrapped phase where the wrapped phase is inconsistent (noise, phase
+    vortices), as the least-squares solution smooths over those regions."""
+    phase = numpy.asarray(phase)
+    if numpy.iscomplexobj(phase):
+        phase = numpy.angle(phase)
+    dtype = numpy.result_type(phase.dtype, numpy.float32)
+    phase = phase.astype(dtype, copy=False)
+    gx = _wrap(numpy.diff(phase, axis=-1))
+    gy = _wrap(numpy.diff(phase, axis=-2))
+    if weights is None:
+        unwrapped = _poisson_dct(_divergence(gx, gy))
+    else:
+        weights = numpy.asarray(weights, dtype=dtype)
+        wx = numpy.minimum(weights[..., :, 1:], weights[..., :, :-1]) ** 2
+        wy = numpy.minimum(weights[..., 1:, :], weights[..., :-1, :]) ** 2
+        unwrapped = _weighted_least_squares(gx, gy, wx, wy, tolerance,
+                                            max_iterations)
+    mean_offset = (phase.mean(axis=(-2, -1), keepdims=True) -
+                   unwrapped.mean(axis=(-2, -1), keepdims=True))
+    unwrapped += mean_offset
+    return unwrapped
+
+def _weighted_least_squares(gx, gy, wx, wy, tolerance, max_iterations):
+    """Solves the weighted least-squares unwrapping problem, batched.
+
+    Preconditioned conjugate gradients on the normal equations
+      div(w * grad(phi)) = div(w * g),
+    with the unweighted Poisson solver as the preconditioner. Each plane has
+    its own step sizes, and the iterations stop when every plane has
+    converged."""
+    def apply_operator(phi):
+        return _divergence(wx * numpy.diff(phi, axis=-1),
+                           wy * numpy.diff(phi, axis=-2))
+
+    def plane_sum(a, b):
+        return numpy.sum(a * b, axis=(-2, -1), keepdims=True)
+
+    residual = _divergence(wx * gx, wy * gy)
+    phi = numpy.zeros_like(residual)
+    initial_norm = numpy.sqrt(plane_sum(residual, residual))
+    initial_norm[initial_norm == 0] = 1
+    rz_previous = None
+    for _ in range(max_iterations):
+        z = _poisson_dct(residual)
+        rz = plane_sum(residual, z)
+        if rz_previous is None:
+            direction = z
+        else:
+            direction = z + (rz / rz_previous) * direction
+        rz_previous = rz
+        q = apply_operator(direction)
+        #rz and dq are both negative: the operator is negative semi-definite
+        dq = plane_sum(direction, q)
+        dq[dq == 0] = 1
+        alpha = rz / dq
+        phi += alpha * direction
+        residual -= alpha * q
+        norm = numpy.sqrt(plane_sum(residual, residual))
+        if numpy.all(norm <= tolerance * initial_norm):
+            break
+    return phi
+
+
+#
+# Synthetic holograms
+#
+
+# The forward model treats each particle as an opaque (or partially
+# absorbing) disk, or as a point, in a unit-amplitude plane wave; the
+# scattered fields of the particles are summed without multiple scattering.
+# The particles are grouped by depth: the disks at each depth are drawn into
+# one image, whose spectrum is multiplied by the same Fresnel kernel which
+# reconstruct() uses. The depths' contributions are summed in the frequency
+# domain, so a single inverse FFT gives the field at the sensor. The cost is
+# one forward FFT per distinct depth, no matter how many particles share it.
+
+def random_particles(n, shape, z_range, radius=0., n_depths=None,
+                     random_state=None):
+    """Random particle positions for synthetic_hologram().
+
+    Returns an (n, 4) array of (x, y, z, radius), with x and y in pixels,
+    uniform over an image of shape (ny, nx), and z uniform over z_range =
+    (z_min, z_max). With n_depths, the depths are drawn from n_depths evenly
+    spaced values instead, which keeps the forward model fast."""
+    if random_state is None:
+        random_state = numpy.random.RandomState()
+    particles = numpy.empty((n, 4))
+    particles[:, 0] = random_state.uniform(0, shape[1], n)
+    particles[:, 1] = random_state.uniform(0, shape[0], n)
+    if n_depths is None:
+        particles[:, 2] = random_state.uniform(z_range[0], z_range[1], n)
+    else:
+        depths = numpy.linspace(z_range[0], z_range[1], n_depths)
+        particles[:, 2] = depths[random_state.randint(0, n_depths, n)]
+    particles[:, 3] = radius
+    return particles
+
+def _disk_offsets(radius):
+    """(row, column) offsets of the pixels within a radius of a centre."""
+    r = int(numpy.floor(radius))
+    dy, dx = numpy.mgrid[-r:r + 1, -r:r + 1]
+    inside = dy ** 2 + dx ** 2 <= radius ** 2
+    return dy[inside], dx[inside]
+
+def _draw_disks(image, rows, cols, radii, values):
+    """Adds disks to an image, wrapping around its edges."""
+    ny, nx = image.shape
+    for radius in numpy.unique(radii):
+        members = radii == radius
+        dy, dx = _disk_offsets(radius)
+        numpy.add.at(image,
+                     ((rows[members, numpy.newaxis] + dy) % ny,
+                      (cols[members, numpy.newaxis] + dx) % nx),
+                     values[members, numpy.newaxis])
+
+def _patch_size(wavelength, pixel_size, z, radius):
+    """Side of a square patch which holds a particle's diffraction pattern.
+
+    The pattern of a particle at a distance z spreads over the half-width of
+    the propagation kernel, where its chirp reaches the Nyquist frequency
+    (see holotiles.guard_band), on each side of the particle's disk."""
+    guard = int(numpy.ceil(abs(z) * wavelength / (2. * pixel_size ** 2)))
+    return scipy.fftpack.next_fast_len(2 * (guard + int(radius)) + 1)
+
+# Number of particle patches which synthetic_field transforms in one call.
+PATCH_BATCH = 16
+
+def _add_patches(scattered, holo, size, z, rows, cols, radii, values):
+    """Adds the diffraction patterns of particles at a depth, patch by patch.
+
+    Each particle is drawn at the centre of a size x size patch, which is
+    propagated by -z and added to scattered around the particle's position,
+    wrapping around its edges like a transform of the whole sensor would."""
+    patch_holo = Hologram(holo.wavelength, holo.pixel_size,
+                          kernel_cache_bytes=0, fft_backend=holo.fft_backend,
+                          dtype=holo.dtype, kernel_mode='separable')
+    patch_holo.ny = patch_holo.nx = size
+    kv, ku = patch_holo._kernel_factors(-z)
+    ny, nx = scattered.shape
+    centre = size // 2
+    offsets = numpy.arange(size) - centre
+    for start in range(0, len(rows), PATCH_BATCH):
+        batch = slice(start, start + PATCH_BATCH)
+        n = len(rows[batch])
+        patches = numpy.zeros((n, size, size), dtype=holo.dtype)
+        for k in range(n):
+            _draw_disks(patches[k], numpy.array([centre]),
+                        numpy.array([centre]), radii[batch][k:k + 1],
+                        values[batch][k:k + 1])
+        spectra = holo.fft_backend.fft2(patches)
+        spectra *= kv[:, numpy.newaxis]
+        spectra *= ku
+        patches = holo.fft_backend.ifft2(spectra, overwrite=True)
+        for k in range(n):
+            #the indices are unique, since the patch is no larger than the
+            #sensor, so += adds every sample
+            scattered[numpy.ix_((rows[batch][k] + offsets) % ny,
+                                (cols[batch][k] + offsets) % nx)] += patches[k]
+
+def synthetic_field(shape, particles, wavelength=0.500e-3, pixel_size=0.010,
+                    opacity=1., dtype=numpy.float64, fft_backend=None,
+                    depth_tolerance=0.):
+    """Complex field at the sensor from particles in a plane wave.
+
+    Inputs:
+      shape: (ny, nx) of the sensor.
+      particles: (n, 3) array of (x, y, z) or (n, 4) of (x, y, z, radius),
+        with x, y and the radius in pixels and z, the distance from the
+        particle to the sensor, in the units of the wavelength. Particles
+        with a radius below one are single-pixel points. x and y are rounded
+        to the nearest pixel.
+      wavelength, pixel_size: as for Hologram.
+      opacity: absorption of the particles, from 0 (transparent) to 1
+        (opaque); a scalar or one value per particle. Overlapping particles
+        at the same depth add their absorption.
+      dtype, fft_backend: working precision and FFT backend, as for
+        Hologram.
+      depth_tolerance: particles whose depths round to the same multiple of
+        depth_tolerance are propagated together, from the mean of their
+        depths; 0 only groups equal depths.
+
+    Each group of particles at one depth is propagated to the sensor either
+    with one transform of the whole sensor, or, when that is cheaper, one
+    particle at a time over a patch which is just large enough to hold its
+    diffraction pattern (see _patch_size). The cost is then set by the
+    number of particles and their distances, rather than by the sensor size,
+    so continuous depths stay fast.
+
+    Reconstructing the field with Hologram.reconstruct(z) brings a particle
+    at depth z into focus."""
+    particles = numpy.atleast_2d(numpy.asarray(particles, dtype=float))
+    opacity = numpy.broadcast_to(numpy.asarray(opacity, dtype=float),
+                                 (len(particles),))
+    radii = (particles[:, 3] if particles.shape[1] > 3
+             else numpy.zeros(len(particles)))
+    rows = numpy.round(particles[:, 1]).astype(int)
+    cols = numpy.round(particles[:, 0]).astype(int)
+    holo = Hologram(wavelength, pixel_size, kernel_cache_bytes=0,
+                    fft_backend=fft_backend, dtype=dtype,
+                    kernel_mode='separable')
+    holo.ny, holo.nx = shape
+    backend = holo.fft_backend
+    if depth_tolerance > 0:
+        bins = numpy.round(particles[:, 2] / depth_tolerance)
+    else:
+        bins = particles[:, 2]
+    _, depth_index = numpy.unique(bins, return_inverse=True)
+    #the mean depth of each group; exact for groups of equal depths
+    depths = (numpy.bincount(depth_index, particles[:, 2]) /
+              numpy.bincount(depth_index))
+    #propagating by -z takes the particles to the sensor
+    scattered = numpy.zeros(shape, dtype=holo.complex_dtype)
+    spectrum = None
+    image = None
+    for depth, z in enumerate(depths):
+        members = numpy.flatnonzero(depth_index == depth)
+        size = _patch_size(wavelength, pixel_size, z, radii[members].max())
+        if (size <= min(shape) and
+                len(members) * size ** 2 < shape[0] * shape[1]):
+            _add_patches(scattered, holo, size, z, rows[members],
+                         cols[members], radii[members], opacity[members])
+            continue
+        if spectrum is None:
+            spectrum = numpy.zeros(shape, dtype=holo.complex_dtype)
+            image = numpy.zeros(shape, dtype=holo.dtype)
+            kv, ku = holo._kernel_factors(-depths)
+        image[...] = 0
+        _draw_disks(image, rows[members], cols[members], radii[members],
+                    opacity[members])
+        depth_spectrum = backend.fft2(image)
+        depth_spectrum *= kv[depth][:, numpy.newaxis]
+        depth_spectrum *= ku[depth]
+        spectrum += depth_spectrum
+    if spectrum is not None:
+        scattered += backend.ifft2(spectrum, overwrite=True)
+    #the particles block part of the unit plane wave
+    numpy.negative(scattered, out=scattered)
+    scattered += 1
+    return scattered
+
+def synthetic_hologram(shape, particles, wavelength=0.500e-3,
+                       pixel_size=0.010, opacity=1., noise=0.,
+                       bit_depth=8, background=0.5, dtype=numpy.float64,
+                       fft_backend=None, random_state=None,
+                       depth_tolerance=0.):
+    """Simulated in-line hologram of particles, with noise and quantization.
+
+    The intensity of synthetic_field() (see there for the inputs) is scaled
+    so that the unscattered background has the value background, as a
+    fraction of full scale. Gaussian noise with a standard deviation of
+    noise (also a fraction of full scale) is added, and with a bit_depth of
+    8 or 16, the result is quantized and clipped to uint8 or uint16. With
+    bit_depth=None, the scaled intensity is returned as floats in the working
+    dtype, without quantization."""
+    field = synthetic_field(shape, particles, wavelength, pixel_size, opacity,
+                            dtype, fft_backend, depth_tolerance)
+    intensity = numpy.abs(field)
+    intensity **= 2
+    intensity *= background
+    if noise:
+        if random_state is None:
+            random_state = numpy.random.RandomState()
+        intensity += noise * random_state.standard_normal(shape).astype(
+            intensity.dtype)
+    if bit_depth is None:
+        return intensity
+    if bit_depth not in (8, 16):
+        raise ValueError('bit_depth must be 8, 16 or None.')
+    out_dtype = numpy.uint8 if bit_depth == 8 else numpy.uint16
+    full_scale = numpy.iinfo(out_dtype).max
+    intensity *= full_scale
+    numpy.rint(intensity, out=intensity)
+    numpy.clip(intensity, 0, full_scale, out=intensity)
+    return intensity.astype(out_dtype)
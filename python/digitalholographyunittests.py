@@ -6,14 +6,27 @@ Change log:
   2015/10/31: unit tests started; nloomis@gmail.com
   2016/01/18: fixed error in test_du_dv where the wrong variable was checked;
               small formatting changes; nloomis@
+  2026/10/18: tests for multi-depth stacks; kernel cache; FFT backends;
+              single precision; separable kernels; previews;
+              shared frequency grids; workspaces;
+              multiple wavelengths; off-axis holograms; phase
+                unwrapping; reconstruction instrumentation; synthetic
+                holograms; iterative reconstructions; 8/16-bit file
+                ingest; nloomis@
 """
 __authors__ = ('nloomis@gmail.com',)
 
 import digitalholography as dhi
+import holotilesunittests
 import imageutils
 
+import cv2
+import gc
 import numpy
 import os.path
+import shutil
+import tempfile
+import threading
 import unittest
 
 class HologramTest(unittest.TestCase):
@@ -62,5 +75,719 @@ class HologramTestLoad(unittest.TestCase):
         self.assertEqual(1024, self.holo.nx)
         self.assertEqual(1024, self.holo.ny)
 
+
+class HologramStackTest(unittest.TestCase):
+    """Tests for multi-depth reconstructions on small synthetic data."""
+
+    z_values = [40., 45., 50., 55., 60.]
+
+    def setUp(self):
+        self.holo = dhi.Hologram()
+        self.holo.load(numpy.random.RandomState(0).rand(32, 48))
+
+    def test_reconstruct_stack(self):
+        volume = self.holo.reconstruct_stack(self.z_values)
+        self.assertEqual((5, 32, 48), volume.shape)
+        for z, field in zip(self.z_values, volume):
+            self.assertTrue(numpy.allclose(self.holo.reconstruct(z), field))
+
+    def test_no_data(self):
+        holo = dhi.Hologram()
+        with self.assertRaises(ValueError):
+            holo.reconstruct_stack(self.z_values)
+        with self.assertRaises(ValueError):
+            list(holo.iter_stack(self.z_values))
+
+    def test_scan(self):
+        volume = self.holo.reconstruct_stack(self.z_values)
+        #refresh=2 mixes exact kernels with the recurrence
+        scanned = list(self.holo.scan(self.z_values, refresh=2))
+        self.assertEqual(self.z_values, [z for z, _ in scanned])
+        self.assertTrue(numpy.allclose(volume, [f for _, f in scanned]))
+        #irregular depths use the kernels directly
+        irregular = [40., 41., 50.]
+        scanned = [f for _, f in self.holo.scan(irregular)]
+        self.assertTrue(numpy.allclose(
+            self.holo.reconstruct_stack(irregular), scanned))
+        self.assertIsNone(self.holo.field)
+
+    def test_reconstruct_wavelengths(self):
+        wavelengths = [0.405e-3, 0.532e-3, 0.658e-3]
+        z_values = self.z_values[:3]
+        volume = self.holo.reconstruct_wavelengths(wavelengths, z_values,
+                                                   max_bytes=0)
+        self.assertEqual((3, 3, 32, 48), volume.shape)
+        for wavelength, fields in zip(wavelengths, volume):
+            holo = dhi.Hologram(wavelength=wavelength)
+            holo.load(self.holo.data)
+            self.assertTrue(numpy.allclose(holo.reconstruct_stack(z_values),
+                                           fields))
+        self.assertEqual(0.500e-3, self.holo.wavelength)
+        with self.assertRaises(ValueError):
+            dhi.Hologram().reconstruct_wavelengths(wavelengths, z_values)
+
+    def test_stack_chunks(self):
+        #a budget of a few slices forces the stack to be split into chunks
+        max_bytes = 2.5 * self.holo.nx * self.holo.ny * 40
+        self.assertEqual(2, self.holo.stack_chunk_size(max_bytes))
+        chunks = list(self.holo.iter_stack(self.z_values, max_bytes))
+        self.assertEqual([2, 2, 1], [len(z) for z, _ in chunks])
+        volume = numpy.concatenate([fields for _, fields in chunks])
+        self.assertTrue(numpy.allclose(
+            self.holo.reconstruct_stack(self.z_values), volume))
+        #the stack doesn't touch the single-depth reconstruction state
+        self.assertIsNone(self.holo.field)
+        self.assertIsNone(self.holo.z)
+
+
+class KernelCacheTest(unittest.TestCase):
+    """Tests for the LRU kernel cache."""
+
+    def test_lru_eviction(self):
+        kernels = [numpy.zeros(10, dtype=complex) for _ in range(3)]
+        cache = dhi.KernelCache(max_bytes=2 * kernels[0].nbytes)
+        cache.put('a', kernels[0])
+        cache.put('b', kernels[1])
+        self.assertIs(kernels[0], cache.get('a'))
+        cache.put('c', kernels[2])
+        #'b' was the least recently used, so it is the one evicted
+        self.assertIsNone(cache.get('b'))
+        self.assertIn('a', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(2 * kernels[0].nbytes, cache.nbytes)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        self.assertFalse(kernels[0].flags.writeable)
+
+    def test_oversized_kernel(self):
+        cache = dhi.KernelCache(max_bytes=0)
+        cache.put('a', numpy.zeros(10, dtype=complex))
+        self.assertEqual(0, len(cache))
+
+    def test_hologram_cache(self):
+        holo = dhi.Hologram()
+        holo.load(numpy.ones((16, 16)))
+        holo.holokern(50.)
+        kernel = holo.kernel
+        holo.holokern(50.)
+        self.assertIs(kernel, holo.kernel)
+        self.assertEqual((1, 1), (holo.kernel_cache.hits,
+                                  holo.kernel_cache.misses))
+        #changing the geometry invalidates the cached kernels
+        holo.pixel_size = 0.020
+        self.assertEqual(0, len(holo.kernel_cache))
+        holo.holokern(50.)
+        self.assertFalse(numpy.allclose(kernel, holo.kernel))
+
+
+class FFTBackendTest(unittest.TestCase):
+    """Tests that the FFT backends agree with numpy.fft."""
+
+    data = numpy.random.RandomState(1).rand(24, 40)
+
+    def _check_backend(self, backend):
+        holo = dhi.Hologram(fft_backend=backend)
+        holo.load(self.data)
+        self.assertTrue(numpy.allclose(numpy.fft.fft2(self.data),
+                                       holo.fft_backend.fft2(self.data)))
+        out = dhi.empty_aligned(self.data.shape, complex)
+        self.assertIs(out, holo.fft_backend.fft2(self.data + 0j, out=out))
+        self.assertTrue(numpy.allclose(numpy.fft.fft2(self.data), out))
+        reference = dhi.Hologram(fft_backend='numpy')
+        reference.load(self.data)
+        self.assertTrue(numpy.allclose(reference.reconstruct(30.),
+                                       holo.reconstruct(30.)))
+        self.assertTrue(numpy.allclose(reference.reconstruct_stack([30., 40.]),
+                                       holo.reconstruct_stack([30., 40.])))
+
+    def test_numpy(self):
+        self._check_backend('numpy')
+
+    def test_scipy(self):
+        self._check_backend(dhi.ScipyFFT(workers=2))
+
+    @unittest.skipIf(dhi.pyfftw is None, 'pyFFTW is not installed')
+    def test_pyfftw(self):
+        backend = dhi.FFTWFFT(threads=2, planner_effort='FFTW_ESTIMATE')
+        self._check_backend(backend)
+        #plans are re-used for arrays with the same shape
+        n_plans = len(backend._plans)
+        backend.fft2(self.data)
+        self.assertEqual(n_plans, len(backend._plans))
+
+    @unittest.skipIf(dhi.pyfftw is None, 'pyFFTW is not installed')
+    def test_pyfftw_keeps_results(self):
+        #a cached plan must not write over the arrays of earlier calls
+        backend = dhi.FFTWFFT(threads=1, planner_effort='FFTW_ESTIMATE')
+        data = self.data + 0j
+        first = backend.fft2(data)
+        expected = first.copy()
+        aligned = dhi.empty_aligned(self.data.shape, complex)
+        backend.fft2(data * 2, out=aligned)
+        #a misaligned output, which takes the copying path
+        buffer = numpy.empty(data.size * data.itemsize + 1, dtype=numpy.uint8)
+        misaligned = buffer[1:].view(complex).reshape(data.shape)
+        backend.fft2(data * 3, out=misaligned)
+        backend.fft2(data * 4, out=numpy.empty(data.shape, numpy.complex64))
+        self.assertTrue(numpy.array_equal(expected, first))
+        self.assertTrue(numpy.allclose(2 * expected, aligned))
+        self.assertTrue(numpy.allclose(3 * expected, misaligned))
+        #nor over the input arrays of earlier calls
+        aligned_input = dhi.empty_aligned(self.data.shape, complex)
+        aligned_input[...] = data
+        backend.ifft2(aligned_input)
+        backend.ifft2(misaligned)
+        self.assertTrue(numpy.array_equal(data, aligned_input))
+
+    @unittest.skipIf(dhi.pyfftw is None, 'pyFFTW is not installed')
+    def test_pyfftw_threads(self):
+        #threads sharing a backend must not run each other's plans
+        backend = dhi.FFTWFFT(threads=1, planner_effort='FFTW_ESTIMATE')
+        inputs = [numpy.random.RandomState(k).rand(128, 128)
+                  for k in range(8)]
+        expected = [numpy.fft.fft2(data) for data in inputs]
+        results = [[] for _ in inputs]
+
+        def transform(k):
+            out = dhi.empty_aligned(inputs[k].shape, complex)
+            for _ in range(50):
+                backend.fft2(inputs[k], out=out)
+                results[k].append(numpy.allclose(expected[k], out))
+
+        threads = [threading.Thread(target=transform, args=(k,))
+                   for k in range(len(inputs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(all(all(matches) for matches in results))
+        #each thread made its own plan; clear_plans() drops all of them
+        backend.clear_plans()
+        self.assertEqual({}, backend._plans)
+
+    def test_default_backend(self):
+        holo = dhi.Hologram()
+        self.assertIs(dhi.get_fft_backend(), holo.fft_backend)
+        default = dhi.get_fft_backend()
+        try:
+            dhi.set_fft_backend('scipy', workers=1)
+            self.assertEqual('scipy', holo.fft_backend.name)
+            holo.fft_backend = 'numpy'
+            self.assertEqual('numpy', holo.fft_backend.name)
+        finally:
+            dhi.set_fft_backend(default)
+        with self.assertRaises(ValueError):
+            dhi.make_fft_backend('no-such-backend')
+
+
+class SinglePrecisionTest(unittest.TestCase):
+    """Tests for float32/complex64 reconstructions."""
+
+    data = numpy.random.RandomState(2).rand(32, 32)
+
+    def test_dtypes(self):
+        holo = dhi.Hologram(dtype=numpy.float32, fft_backend='scipy')
+        holo.load(self.data)
+        self.assertEqual(numpy.float32, holo.data.dtype)
+        field = holo.reconstruct(50.)
+        self.assertEqual(numpy.complex64, holo.fft.dtype)
+        self.assertEqual(numpy.complex64, holo.kernel.dtype)
+        self.assertEqual(numpy.complex64, field.dtype)
+        self.assertEqual(numpy.complex64, holo.reconstruct_stack([50.]).dtype)
+        holo.holokern_cs(50.)
+        self.assertEqual(numpy.complex64, holo.kernel.dtype)
+
+    def test_accuracy(self):
+        single = dhi.Hologram(dtype=numpy.float32)
+        double = dhi.Hologram()
+        single.load(self.data)
+        double.load(self.data)
+        #a long distance gives a large kernel phase
+        z = 5000.
+        self.assertTrue(numpy.allclose(double.reconstruct(z),
+                                       single.reconstruct(z), atol=1e-5))
+
+    def test_bad_dtype(self):
+        with self.assertRaises(ValueError):
+            dhi.Hologram(dtype=numpy.int32)
+
+
+class SeparableKernelTest(unittest.TestCase):
+    """Tests that the separable kernel mode matches the full 2D kernels."""
+
+    data = numpy.random.RandomState(3).rand(24, 40)
+
+    def setUp(self):
+        self.full = dhi.Hologram()
+        self.full.load(self.data)
+        self.separable = dhi.Hologram(kernel_mode='separable')
+        self.separable.load(self.data)
+
+    def test_kernel(self):
+        self.full.holokern(60.)
+        self.separable.holokern(60.)
+        self.assertTrue(numpy.allclose(self.full.kernel, self.separable.kernel))
+        self.separable.holokern_cs(60.)
+        self.assertTrue(numpy.allclose(self.full.kernel, self.separable.kernel))
+        #only the 1D frequency vectors are stored
+        self.assertIsNone(self.separable._freq_R2)
+        self.assertEqual((24,), self.separable._freq_v.shape)
+
+    def test_reconstruct(self):
+        self.assertTrue(numpy.allclose(self.full.reconstruct(60.),
+                                       self.separable.reconstruct(60.)))
+        self.assertIsNone(self.separable.kernel)
+        z_values = [20., 40., 60.]
+        self.assertTrue(numpy.allclose(self.full.reconstruct_stack(z_values),
+                                       self.separable.reconstruct_stack(
+                                           z_values, max_bytes=0)))
+
+    def test_bad_mode(self):
+        with self.assertRaises(ValueError):
+            dhi.Hologram(kernel_mode='diagonal')
+
+
+class PreviewTest(unittest.TestCase):
+    """Tests for reduced-resolution previews."""
+
+    def test_band_indices(self):
+        self.assertEqual([0, 1, 6, 7], list(dhi._band_indices(8, 4)))
+        self.assertEqual([0, 1, 2, 7, 8], list(dhi._band_indices(9, 5)))
+
+    def test_preview(self):
+        #a smooth field is well represented by its low frequencies
+        rows, cols = numpy.indices((64, 48))
+        data = 1. + numpy.cos(2 * numpy.pi * (rows / 32. + cols / 24.))
+        holo = dhi.Hologram()
+        holo.load(data)
+        preview = holo.preview(30., factor=4)
+        self.assertEqual((16, 12), preview.shape)
+        field = holo.reconstruct(30.)
+        self.assertTrue(numpy.allclose(field[::4, ::4], preview))
+        #the antialiasing mask only removes high frequencies
+        antialiased = holo.preview(30., factor=4, antialias=True)
+        self.assertAlmostEqual(numpy.mean(preview), numpy.mean(antialiased))
+
+
+class FrequencyGridTest(unittest.TestCase):
+    """Tests for the frequency grids shared between Holograms."""
+
+    def test_shared_grids(self):
+        holos = [dhi.Hologram(pixel_size=0.0123) for _ in range(2)]
+        for holo in holos:
+            holo.load(numpy.ones((20, 30)))
+            holo.reconstruct(10.)
+        self.assertIs(holos[0]._freq_R2, holos[1]._freq_R2)
+        self.assertFalse(holos[0]._freq_R2.flags.writeable)
+        key = (30, 20, 0.0123, 0.0123, numpy.dtype(float).str)
+        self.assertIn(key, dhi._frequency_grids)
+        #a different geometry or dtype gets its own grid
+        other = dhi.Hologram(pixel_size=0.0123, dtype=numpy.float32)
+        other.load(numpy.ones((20, 30)))
+        other.reconstruct(10.)
+        self.assertIsNot(holos[0]._grid, other._grid)
+        #the grid is dropped once no Hologram uses it
+        del holos, holo
+        gc.collect()
+        self.assertNotIn(key, dhi._frequency_grids)
+
+    def test_separable_grids(self):
+        holo = dhi.Hologram(pixel_size=0.0234, kernel_mode='separable')
+        holo.load(numpy.ones((20, 30)))
+        holo.reconstruct(10.)
+        self.assertIsNone(holo._grid._R2)
+
+
+class WorkspaceTest(unittest.TestCase):
+    """Tests for in-place reconstructions in a preallocated workspace."""
+
+    data = numpy.random.RandomState(4).rand(24, 32)
+
+    def _check_workspace(self, **opts):
+        reference = dhi.Hologram(**opts)
+        reference.load(self.data)
+        holo = dhi.Hologram(workspace=True, **opts)
+        holo.load(self.data)
+        field = holo.reconstruct(30.)
+        self.assertTrue(numpy.allclose(reference.reconstruct(30.), field))
+        #the same buffer is re-used by the next reconstruction
+        self.assertIs(field, holo.reconstruct(40.))
+        self.assertIs(field, holo.field)
+        self.assertTrue(numpy.allclose(reference.reconstruct(40.), field))
+
+    def test_workspace(self):
+        self._check_workspace()
+        self._check_workspace(dtype=numpy.float32)
+        self._check_workspace(kernel_mode='separable')
+        self._check_workspace(fft_backend='scipy')
+
+    @unittest.skipIf(dhi.pyfftw is None, 'pyFFTW is not installed')
+    def test_pyfftw_workspace(self):
+        self._check_workspace(fft_backend=dhi.FFTWFFT(
+            planner_effort='FFTW_ESTIMATE'))
+
+    def test_geometry_change(self):
+        holo = dhi.Hologram(workspace=True)
+        holo.load(self.data)
+        holo.reconstruct(30.)
+        holo.load(self.data[:16])
+        self.assertEqual((16, 32), holo.reconstruct(30.).shape)
+
+
+class OffAxisTest(unittest.TestCase):
+    """Tests for sideband extraction from off-axis holograms."""
+
+    def setUp(self):
+        #an object wave which is band-limited to the central 1/4 of the
+        #spectrum, with an unscattered component, interfered with a tilted
+        #plane reference wave
+        random_state = numpy.random.RandomState(5)
+        self.shape = (96, 128)
+        spectrum = numpy.zeros(self.shape, dtype=complex)
+        rows = dhi._band_indices(96, 20)
+        cols = dhi._band_indices(128, 26)
+        spectrum[numpy.ix_(rows, cols)] = (random_state.randn(20, 26) +
+                                           1j * random_state.randn(20, 26))
+        self.object_wave = numpy.fft.ifft2(spectrum)
+        self.object_wave *= 0.2 / numpy.abs(self.object_wave).max()
+        self.object_wave += 0.5
+        self.carrier = (-24, 48)
+        y, x = numpy.indices(self.shape)
+        reference = numpy.exp(-2j * numpy.pi * (self.carrier[0] * y / 96. +
+                                               self.carrier[1] * x / 128.))
+        self.data = numpy.abs(reference + self.object_wave) ** 2
+
+    def test_before_load(self):
+        #like Hologram, the sample spacing is the pixel size until data is
+        #loaded
+        holo = dhi.OffAxisHologram(pixel_size=0.010)
+        self.assertEqual(0.010, holo.dx)
+        self.assertEqual(0.010, holo.dy)
+        self.assertEqual(50., holo.u_max)
+        self.assertEqual(50., holo.v_max)
+
+    def test_find_carrier(self):
+        holo = dhi.OffAxisHologram(sideband_fraction=0.25)
+        holo.load(self.data)
+        holo.reconstruct(0.)
+        self.assertEqual(self.carrier, holo.carrier)
+        self.assertEqual((24, 32), (holo.ny, holo.nx))
+        self.assertAlmostEqual(0.040, holo.dx)
+
+    def test_sideband_field(self):
+        holo = dhi.OffAxisHologram(sideband_fraction=0.25)
+        holo.load(self.data)
+        #at z = 0 the sideband is the object wave, sampled every 4 pixels
+        field = holo.reconstruct(0.)
+        self.assertTrue(numpy.allclose(self.object_wave[::4, ::4], field))
+        #propagation matches propagating the object wave directly
+        reference = dhi.Hologram()
+        reference.load(self.object_wave)
+        self.assertTrue(numpy.allclose(reference.reconstruct(20.)[::4, ::4],
+                                       holo.reconstruct(20.)))
+
+    def test_fixed_carrier(self):
+        holo = dhi.OffAxisHologram(sideband_fraction=0.25,
+                                   carrier=self.carrier)
+        holo.load(self.data)
+        self.assertTrue(numpy.allclose(self.object_wave[::4, ::4],
+                                       holo.reconstruct(0.)))
+
+
+class UnwrapTest(unittest.TestCase):
+    """Tests for the least-squares phase unwrappers."""
+
+    def setUp(self):
+        y, x = numpy.mgrid[:64, :80] / 64.
+        self.phase = (20 * numpy.exp(-((x - 0.6) ** 2 + (y - 0.4) ** 2) / 0.05)
+                      + 8 * x)
+        self.wrapped = numpy.angle(numpy.exp(1j * self.phase))
+
+    def assertUnwrapped(self, expected, unwrapped, mask=Ellipsis):
+        difference = (unwrapped - expected)[mask]
+        self.assertTrue(numpy.allclose(difference, difference.mean(),
+                                       atol=1e-3))
+
+    def test_unweighted(self):
+        self.assertUnwrapped(self.phase, dhi.unwrap_phase(self.wrapped))
+
+    def test_complex_stack(self):
+        fields = numpy.exp(1j * numpy.array([self.phase, -self.phase]))
+        unwrapped = dhi.unwrap_phase(fields.astype(numpy.complex64))
+        self.assertEqual(numpy.float32, unwrapped.dtype)
+        self.assertUnwrapped(self.phase, unwrapped[0])
+        self.assertUnwrapped(-self.phase, unwrapped[1])
+
+    def test_weighted(self):
+        #a band of noise, which the weights mark as unreliable
+        noisy = self.wrapped.copy()
+        noisy[30:36, :40] = numpy.random.RandomState(3).uniform(-3, 3, (6, 40))
+        weights = numpy.ones_like(noisy)
+        weights[30:36, :40] = 0.
+        good = weights > 0
+        self.assertUnwrapped(self.phase, dhi.unwrap_phase(noisy, weights),
+                             good)
+        difference = (dhi.unwrap_phase(noisy) - self.phase)[good]
+        self.assertFalse(numpy.allclose(difference, difference.mean(),
+                                        atol=1e-1))
+
+    def test_hologram_field(self):
+        holo = dhi.Hologram()
+        holo.load(numpy.exp(1j * self.phase))
+        holo.reconstruct(0.)
+        self.assertUnwrapped(self.phase, holo.unwrap_phase())
+        self.assertUnwrapped(self.phase, holo.unwrap_phase(weighted=True))
+
+
+class InstrumentationTest(unittest.TestCase):
+    """Tests for the per-stage timing of reconstructions."""
+
+    def setUp(self):
+        self.data = numpy.random.RandomState(2).rand(16, 24)
+
+    def test_disabled_by_default(self):
+        holo = dhi.Hologram()
+        holo.load(self.data)
+        holo.reconstruct(10.)
+        self.assertIsNone(holo.stats)
+
+    def test_stages(self):
+        holo = dhi.Hologram()
+        holo.load(self.data)
+        calls = []
+        with holo.instrument(lambda stats, z: calls.append(z)) as stats:
+            holo.reconstruct(10.)
+            holo.reconstruct(10.)
+            holo.reconstruct(20.)
+        self.assertIsNone(holo.stats)
+        self.assertEqual([10., 10., 20.], calls)
+        self.assertEqual(3, stats.reconstructions)
+        #the forward FFT is only computed once
+        self.assertEqual(1, stats.calls['fft'])
+        self.assertEqual(3, stats.calls['holokern'])
+        self.assertEqual(3, stats.calls['ifft2'])
+        field_bytes = holo.field.nbytes
+        self.assertEqual(field_bytes, stats.bytes['fft'])
+        #the second kernel for z = 10 came from the cache
+        self.assertEqual(2 * field_bytes, stats.bytes['holokern'])
+        self.assertEqual(3 * field_bytes, stats.bytes['multiply'])
+        self.assertGreater(stats.total_seconds, 0)
+        self.assertEqual(set(['holokern', 'multiply', 'ifft2']),
+                         set(stats.last))
+        self.assertEqual(3, stats.as_dict()['stages']['ifft2']['calls'])
+
+    def test_workspace(self):
+        holo = dhi.Hologram(workspace=True)
+        holo.load(self.data)
+        holo.stats = dhi.ReconstructionStats()
+        holo.reconstruct(10.)
+        holo.reconstruct(20.)
+        self.assertEqual(2, holo.stats.calls['multiply'])
+        self.assertEqual(0, holo.stats.bytes['holokern'])
+        self.assertEqual(0, holo.stats.bytes['multiply'])
+        holo.stats.reset()
+        self.assertEqual(0, holo.stats.calls['multiply'])
+
+
+class SyntheticTest(unittest.TestCase):
+    """Tests for the synthetic hologram forward model."""
+
+    def test_refocus(self):
+        particles = [(20, 12, 15., 3.), (40, 30, 15., 2.)]
+        field = dhi.synthetic_field((48, 64), particles, 0.658e-3, 0.010)
+        holo = dhi.Hologram(0.658e-3, 0.010)
+        holo.load(field)
+        expected = numpy.ones((48, 64))
+        rows, cols = numpy.indices(expected.shape)
+        for x, y, _, radius in particles:
+            expected[(rows - y) ** 2 + (cols - x) ** 2 <= radius ** 2] = 0
+        self.assertTrue(numpy.allclose(expected, holo.reconstruct(15.)))
+
+    def test_depths_add(self):
+        near = [(10, 10, 5., 0.)]
+        far = [(30, 20, 12., 1.)]
+        fields = [dhi.synthetic_field((32, 40), particles, opacity=0.5)
+                  for particles in (near, far, near + far)]
+        self.assertTrue(numpy.allclose(fields[0] + fields[1] - 1, fields[2]))
+
+    def test_continuous_depths(self):
+        #particles at different depths are propagated over small patches,
+        #which match a propagation of the whole sensor up to the kernel's
+        #aliasing limit
+        particles = [(40, 50, 10.2, 2.), (90, 70, 10.7, 2.)]
+        field = dhi.synthetic_field((128, 128), particles, 0.658e-3, 0.010)
+        holo = dhi.Hologram(0.658e-3, 0.010)
+        rows, cols = numpy.indices((128, 128))
+        expected = numpy.ones((128, 128), dtype=complex)
+        for x, y, z, radius in particles:
+            disk = (rows - y) ** 2 + (cols - x) ** 2 <= radius ** 2
+            holo.load(disk.astype(float))
+            expected -= holo.reconstruct(-z)
+        self.assertTrue(numpy.allclose(expected, field, atol=0.02))
+
+    def test_depth_tolerance(self):
+        particles = numpy.array([(40, 50, 10.2, 2.), (90, 70, 10.7, 2.)])
+        grouped = dhi.synthetic_field((128, 128), particles,
+                                      depth_tolerance=2.)
+        particles[:, 2] = 10.45
+        self.assertTrue(numpy.allclose(
+            dhi.synthetic_field((128, 128), particles), grouped))
+
+    def test_hologram(self):
+        random_state = numpy.random.RandomState(3)
+        particles = dhi.random_particles(50, (64, 80), (10., 20.), radius=1.5,
+                                         n_depths=3, random_state=random_state)
+        self.assertEqual((50, 4), particles.shape)
+        self.assertEqual(3, len(numpy.unique(particles[:, 2])))
+        hologram = dhi.synthetic_hologram((64, 80), particles, noise=0.01,
+                                          bit_depth=16,
+                                          random_state=random_state)
+        self.assertEqual(numpy.uint16, hologram.dtype)
+        self.assertAlmostEqual(0.5, hologram.mean() / 65535., delta=0.05)
+        empty = dhi.synthetic_hologram((16, 16), numpy.zeros((0, 4)))
+        self.assertTrue(numpy.all(empty == 128))
+
+
+class IterativeTest(unittest.TestCase):
+    """Tests for iterative twin-image suppression."""
+
+    def setUp(self):
+        shape = (96, 96)
+        particles = [(30, 40, 20., 4.), (70, 60, 20., 3.)]
+        self.hologram = dhi.synthetic_hologram(shape, particles, 0.658e-3,
+                                               0.010, bit_depth=None)
+        rows, cols = numpy.indices(shape)
+        self.transmission = numpy.ones(shape)
+        self.support = numpy.zeros(shape, dtype=bool)
+        for x, y, _, radius in particles:
+            distance = (rows - y) ** 2 + (cols - x) ** 2
+            self.transmission[distance <= radius ** 2] = 0
+            self.support[distance <= (radius + 3) ** 2] = True
+
+    def test_twin_image_suppression(self):
+        holo = dhi.Hologram(0.658e-3, 0.010)
+        holo.load(self.hologram)
+        single = numpy.abs(holo.reconstruct(20.))
+        single /= single.mean()
+        errors = []
+        field = holo.reconstruct_iterative(
+            20., iterations=100, callback=lambda k, error: errors.append(error))
+        self.assertIs(field, holo.field)
+        stats = holo.iterative_stats
+        self.assertEqual(errors, stats['errors'])
+        self.assertEqual(len(errors), stats['iterations'])
+        self.assertGreater(stats['iterations_per_sec'], 0)
+        single_error = numpy.abs(single - self.transmission).mean()
+        iterative_error = numpy.abs(numpy.abs(field) -
+                                    self.transmission).mean()
+        self.assertLess(iterative_error, single_error / 10)
+
+    def test_support(self):
+        holo = dhi.Hologram(0.658e-3, 0.010, dtype=numpy.float32)
+        holo.load(self.hologram)
+        field = holo.reconstruct_iterative(20., iterations=100,
+                                           support=self.support)
+        self.assertEqual(numpy.complex64, field.dtype)
+        #the support constraint converges quickly
+        self.assertLess(holo.iterative_stats['iterations'], 100)
+        self.assertTrue(numpy.allclose(self.transmission, numpy.abs(field),
+                                       atol=1e-2))
+
+    def test_needs_intensity(self):
+        holo = dhi.Hologram()
+        holo.load(self.hologram + 0j)
+        self.assertRaises(ValueError, holo.reconstruct_iterative, 20.)
+        off_axis = dhi.OffAxisHologram()
+        off_axis.load(self.hologram)
+        self.assertRaises(ValueError, off_axis.reconstruct_iterative, 20.)
+
+
+class IngestTest(unittest.TestCase):
+    """Tests for loading 8- and 16-bit hologram files."""
+
+    data = (numpy.random.RandomState(0).rand(30, 20) * 4095).astype('uint16')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def filename(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def test_pgm(self):
+        cv2.imwrite(self.filename('holo.pgm'), self.data)
+        holo = dhi.Hologram(dtype=numpy.float32)
+        holo.load(self.filename('holo.pgm'))
+        self.assertEqual(numpy.float32, holo.data.dtype)
+        self.assertTrue(numpy.allclose(self.data / 65535., holo.data))
+        holo.load(self.filename('holo.pgm'), bit_depth=12)
+        self.assertTrue(numpy.allclose(self.data / 4095., holo.data))
+
+    def test_pgm_header(self):
+        #the white level comes from the header
+        with open(self.filename('holo.pgm'), 'wb') as pgm:
+            pgm.write(b'P5\n# camera frame\n20 30\n4095\n')
+            pgm.write(self.data.astype('>u2').tobytes())
+        holo = dhi.Hologram()
+        holo.load(self.filename('holo.pgm'))
+        self.assertEqual((30, 20), holo.data.shape)
+        self.assertTrue(numpy.allclose(self.data / 4095., holo.data))
+
+    def test_ascii_pgm(self):
+        #ASCII (P2) files can't be memory-mapped, so opencv reads them
+        with open(self.filename('holo.pgm'), 'w') as pgm:
+            pgm.write('P2\n20 30\n4095\n')
+            for row in self.data:
+                pgm.write(' '.join(str(value) for value in row) + '\n')
+        holo = dhi.Hologram()
+        holo.load(self.filename('holo.pgm'))
+        #the white level still comes from the header
+        self.assertTrue(numpy.allclose(self.data / 4095., holo.data))
+
+    def test_raw(self):
+        with open(self.filename('holo.raw'), 'wb') as raw:
+            raw.write(b'header')
+            raw.write(self.data.tobytes())
+        holo = dhi.Hologram(dtype=numpy.float32)
+        holo.load(self.filename('holo.raw'), bit_depth=12,
+                  shape=self.data.shape, raw_dtype='uint16', offset=6)
+        self.assertTrue(numpy.allclose(self.data / 4095., holo.data))
+
+    def test_tiff_and_npy(self):
+        cv2.imwrite(self.filename('holo.tif'), self.data,
+                    [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+        numpy.save(self.filename('holo.npy'), self.data)
+        for name in ('holo.tif', 'holo.npy'):
+            holo = dhi.Hologram()
+            holo.load(self.filename(name))
+            self.assertNotIsInstance(holo.data, numpy.memmap)
+            self.assertEqual(numpy.float64, holo.data.dtype)
+            self.assertTrue(numpy.allclose(self.data / 65535., holo.data))
+
+    def test_tiled_tiff(self):
+        #tiled TIFFs can't be memory-mapped, so opencv reads them instead
+        holotilesunittests.write_tiled_tiff(self.filename('holo.tif'),
+                                            self.data)
+        holo = dhi.Hologram()
+        holo.load(self.filename('holo.tif'))
+        self.assertTrue(numpy.allclose(self.data / 65535., holo.data))
+
+    def test_16_bit_png(self):
+        #files which can't be memory-mapped keep their bit depth
+        cv2.imwrite(self.filename('holo.png'), self.data)
+        holo = dhi.Hologram()
+        holo.load(self.filename('holo.png'), bit_depth=12)
+        self.assertTrue(numpy.allclose(self.data / 4095., holo.data))
+
+    def test_8_bit_color(self):
+        gray = (self.data // 16).astype('uint8')
+        cv2.imwrite(self.filename('holo.bmp'), cv2.merge([gray] * 3))
+        holo = dhi.Hologram(dtype=numpy.float32)
+        holo.load(self.filename('holo.bmp'))
+        self.assertEqual((30, 20), holo.data.shape)
+        self.assertTrue(numpy.allclose(gray / 255., holo.data))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+Headless batch reconstruction of directories of holograms.
+
+Each hologram is reconstructed at a list of depths and the result is written
+to <out_dir>/<path>.npy, a (depth, ny, nx) array of intensities (or complex
+fields with --field), where <path> is the hologram's file name, extension
+included, relative to the deepest directory holding all of the inputs; eg,
+d1/a.png and d2/a.png are written to <out_dir>/d1/a.png.npy and
+<out_dir>/d2/a.png.npy. Files are farmed out to a pool of worker processes;
+each worker keeps one Hologram per image shape, so the frequency grids are
+re-used for every same-size input. The depths are reconstructed in batched
+chunks (see Hologram.iter_stack) with separable kernels, which are cheap
+enough to rebuild for every file, however many depths there are. Workers
+write their results straight to disk and only report the file name and
+timing back to the parent.
+
+Outputs are written under a temporary name and renamed when complete, so an
+interrupted run can be restarted with the same command: holograms which
+already have an output are skipped unless --overwrite is given.
+
+Example:
+  $ python holobatch.py 'holograms/*.png' --out-dir recon \\
+      --wavelength 658e-6 --pixel-size 9e-3 --z 50:60:0.5 --workers 8
+
+Change log:
+  2026/10/18 -- module started; nloomis@gmail.com
+  2026/10/18 -- output names keep the relative path and extension; depths
+                are reconstructed in batched chunks; nloomis@
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import digitalholography as dhi
+
+import argparse
+import glob
+import multiprocessing
+import numpy
+import os
+import sys
+import time
+
+# Per-process state for the worker pool: the reconstruction settings, and one
+# Hologram for each image shape seen so far.
+_worker_settings = None
+_worker_holograms = {}
+
+def parse_z_values(text):
+    """Parses a list of depths: 'z1,z2,...' or a range 'start:stop:step'.
+
+    The stop value of a range is included if it falls on a step."""
+    if ':' in text:
+        start, stop, step = [float(value) for value in text.split(':')]
+        n_steps = int(numpy.floor((stop - start) / step + 1e-9))
+        return start + step * numpy.arange(n_steps + 1)
+    return numpy.array([float(value) for value in text.split(',')])
+
+def find_holograms(patterns):
+    """Lists the hologram files matching directories or glob patterns."""
+    filenames = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*')
+        filenames.extend(name for name in glob.glob(pattern)
+                         if os.path.isfile(name))
+    return sorted(set(filenames))
+
+def common_root(filenames):
+    """Deepest directory which holds all of the files."""
+    directories = [os.path.dirname(os.path.abspath(name)) for name in filenames]
+    if not directories:
+        return os.getcwd()
+    root = os.path.commonprefix([directory + os.sep
+                                 for directory in directories])
+    #commonprefix works character by character; cut back to a directory
+    return os.path.dirname(root)
+
+def output_filename(filename, out_dir, root=None):
+    """Name of the output file for a hologram.
+
+    The output keeps the hologram's path relative to root, which defaults to
+    the hologram's own directory, and its extension."""
+    if root is None:
+        root = os.path.dirname(os.path.abspath(filename))
+    relative = os.path.relpath(os.path.abspath(filename), root)
+    return os.path.join(out_dir, relative + '.npy')
+
+def _init_worker(settings):
+    """Stores the reconstruction settings in a worker process."""
+    global _worker_settings
+    _worker_settings = settings
+    _worker_holograms.clear()
+
+def _worker_hologram(shape):
+    """Returns the worker's Hologram for images of a given shape."""
+    holo = _worker_holograms.get(shape)
+    if holo is None:
+        settings = _worker_settings
+        holo = dhi.Hologram(settings['wavelength'], settings['pixel_size'],
+                            kernel_cache_bytes=0, dtype=settings['dtype'],
+                            kernel_mode='separable')
+        _worker_holograms[shape] = holo
+    return holo
+
+def _reconstruct_file(filename):
+    """Reconstructs one hologram to disk; returns (filename, seconds, error).
+
+    The error is None on success, or a message if the file failed."""
+    start_time = time.time()
+    settings = _worker_settings
+    out_name = output_filename(filename, settings['out_dir'],
+                               settings['root'])
+    partial_name = out_name + '.partial'
+    try:
+        probe = dhi.Hologram(dtype=settings['dtype'])
+        probe.load(filename)
+        holo = _worker_hologram(probe.data.shape)
+        holo.data = probe.data
+        del probe
+        z_values = settings['z_values']
+        out_dtype = holo.complex_dtype if settings['field'] else holo.dtype
+        out = numpy.lib.format.open_memmap(
+            partial_name, mode='w+', dtype=out_dtype,
+            shape=(len(z_values), holo.ny, holo.nx))
+        start = 0
+        for _, fields in holo.iter_stack(z_values, settings['max_bytes']):
+            if settings['field']:
+                out[start:start + len(fields)] = fields
+            else:
+                out[start:start + len(fields)] = numpy.abs(fields) ** 2
+            start += len(fields)
+        out.flush()
+        del out
+        os.rename(partial_name, out_name)
+    except Exception as err:
+        if os.path.exists(partial_name):
+            os.remove(partial_name)
+        return filename, time.time() - start_time, str(err)
+    return filename, time.time() - start_time, None
+
+def run_batch(filenames, out_dir, z_values, wavelength, pixel_size,
+              workers=None, dtype=numpy.float32, field=False, overwrite=False,
+              max_bytes=dhi.STACK_MAX_BYTES, verbose=True):
+    """Reconstructs a list of hologram files with a pool of processes.
+
+    See the module documentation for the output layout; a ValueError is
+    raised if two of the files would have the same output. max_bytes is the
+    memory budget of each worker's depth chunks, as for
+    Hologram.reconstruct_stack. Returns a dictionary
+    with the counts of 'done', 'skipped' and 'failed' files, the list of
+    'failures' as (filename, message) pairs, the wall-clock 'seconds' and the
+    'throughput' in holograms per second."""
+    root = common_root(filenames)
+    out_names = [output_filename(name, out_dir, root) for name in filenames]
+    if len(set(out_names)) < len(out_names):
+        raise ValueError('Some of the holograms are listed more than once.')
+    if overwrite:
+        todo = list(filenames)
+    else:
+        todo = [name for name, out_name in zip(filenames, out_names)
+                if not os.path.exists(out_name)]
+    for directory in set([out_dir] + [os.path.dirname(name)
+                                      for name in out_names]):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    settings = {'out_dir': out_dir, 'root': root, 'z_values': list(z_values),
+                'wavelength': wavelength, 'pixel_size': pixel_size,
+                'dtype': dtype, 'field': field, 'max_bytes': max_bytes}
+    summary = {'done': 0, 'skipped': len(filenames) - len(todo), 'failed': 0,
+               'failures': []}
+    start_time = time.time()
+    pool = multiprocessing.Pool(workers, _init_worker, (settings,))
+    try:
+        results = pool.imap_unordered(_reconstruct_file, todo)
+        for filename, _, error in results:
+            if error is None:
+                summary['done'] += 1
+            else:
+                summary['failed'] += 1
+                summary['failures'].append((filename, error))
+                if verbose:
+                    print('Failed: %s (%s)' % (filename, error))
+            if verbose:
+                finished = summary['done'] + summary['failed']
+                elapsed = time.time() - start_time
+                sys.stdout.write('\r%d/%d holograms, %.2f holograms/sec' %
+                                 (finished, len(todo), finished / elapsed))
+                sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+    summary['seconds'] = time.time() - start_time
+    summary['throughput'] = summary['done'] / max(summary['seconds'], 1e-9)
+    if verbose:
+        print('\nReconstructed %d holograms in %.1f s (%.2f holograms/sec); '
+              '%d skipped, %d failed.' %
+              (summary['done'], summary['seconds'], summary['throughput'],
+               summary['skipped'], summary['failed']))
+    return summary
+
+def main(argv=None):
+    """Command-line entry point; returns the process exit code."""
+    parser = argparse.ArgumentParser(
+        description='Reconstruct a batch of holograms at a list of depths.')
+    parser.add_argument('inputs', nargs='+',
+                        help='hologram files, directories or glob patterns')
+    parser.add_argument('--out-dir', required=True,
+                        help='directory for the reconstructed .npy files')
+    parser.add_argument('--wavelength', type=float, default=0.500e-3,
+                        help='wavelength, in the same units as the pixel size')
+    parser.add_argument('--pixel-size', type=float, default=0.010)
+    parser.add_argument('--z', required=True, type=parse_z_values,
+                        help="depths as 'z1,z2,...' or 'start:stop:step'")
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes; defaults to one per CPU')
+    parser.add_argument('--double', action='store_true',
+                        help='reconstruct in double instead of single precision')
+    parser.add_argument('--field', action='store_true',
+                        help='store the complex field instead of the intensity')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='reconstruct files which already have an output')
+    parser.add_argument('--stack-mb', type=float,
+                        default=dhi.STACK_MAX_BYTES / 1024. ** 2,
+                        help='memory for the depth chunks of each worker, '
+                        'in MB')
+    args = parser.parse_args(argv)
+
+    filenames = find_holograms(args.inputs)
+    if not filenames:
+        print('No holograms found.')
+        return 1
+    summary = run_batch(filenames, args.out_dir, args.z, args.wavelength,
+                        args.pixel_size, workers=args.workers,
+                        dtype=numpy.float64 if args.double else numpy.float32,
+                        field=args.field, overwrite=args.overwrite,
+                        max_bytes=int(args.stack_mb * 1024 ** 2))
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for holobatch.py.
+
+Change log:
+  2026/10/18: unit tests started; nloomis@gmail.com
+  2026/10/18: output names; chunked depths; nloomis@
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import digitalholography as dhi
+import holobatch
+
+import cv2
+import numpy
+import os.path
+import shutil
+import tempfile
+import unittest
+
+class BatchTest(unittest.TestCase):
+    """Tests for batch reconstructions of a directory of holograms."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.tmp_dir, 'out')
+        random_state = numpy.random.RandomState(0)
+        for name, shape in (('a', (32, 32)), ('b', (32, 32)), ('c', (24, 40))):
+            img = (random_state.rand(*shape) * 255).astype(numpy.uint8)
+            cv2.imwrite(os.path.join(self.tmp_dir, name + '.png'), img)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parse_z_values(self):
+        self.assertTrue(numpy.allclose([1., 1.5, 2.],
+                                       holobatch.parse_z_values('1:2:0.5')))
+        self.assertTrue(numpy.allclose([3., 5.],
+                                       holobatch.parse_z_values('3,5')))
+
+    def test_batch_and_resume(self):
+        filenames = holobatch.find_holograms([self.tmp_dir])
+        self.assertEqual(3, len(filenames))
+        z_values = [10., 20.]
+        summary = holobatch.run_batch(filenames, self.out_dir, z_values,
+                                      0.5e-3, 0.010, workers=2,
+                                      dtype=numpy.float64, verbose=False)
+        self.assertEqual((3, 0, 0), (summary['done'], summary['skipped'],
+                                     summary['failed']))
+        result = numpy.load(os.path.join(self.out_dir, 'c.png.npy'))
+        self.assertEqual((2, 24, 40), result.shape)
+        holo = dhi.Hologram()
+        holo.load(filenames[2])
+        self.assertTrue(numpy.allclose(numpy.abs(holo.reconstruct(20.)) ** 2,
+                                       result[1]))
+        #files with outputs are skipped when the run is repeated
+        summary = holobatch.run_batch(filenames, self.out_dir, z_values,
+                                      0.5e-3, 0.010, workers=2, verbose=False)
+        self.assertEqual((0, 3), (summary['done'], summary['skipped']))
+
+    def test_output_names(self):
+        #files with the same name in different directories, or with
+        #different extensions, get their own outputs
+        for directory in ('d1', 'd2'):
+            os.mkdir(os.path.join(self.tmp_dir, directory))
+            shutil.copy(os.path.join(self.tmp_dir, 'a.png'),
+                        os.path.join(self.tmp_dir, directory, 'a.png'))
+        shutil.copy(os.path.join(self.tmp_dir, 'a.png'),
+                    os.path.join(self.tmp_dir, 'a.bmp'))
+        filenames = holobatch.find_holograms(
+            [os.path.join(self.tmp_dir, pattern)
+             for pattern in ('a.*', 'd1', 'd2')])
+        self.assertEqual(4, len(filenames))
+        summary = holobatch.run_batch(filenames, self.out_dir, [10.],
+                                      0.5e-3, 0.010, workers=2, verbose=False)
+        self.assertEqual(4, summary['done'])
+        for name in ('a.png.npy', 'a.bmp.npy', os.path.join('d1', 'a.png.npy'),
+                     os.path.join('d2', 'a.png.npy')):
+            self.assertTrue(os.path.exists(os.path.join(self.out_dir, name)),
+                            name)
+        with self.assertRaises(ValueError):
+            holobatch.run_batch(filenames + filenames[:1], self.out_dir, [10.],
+                                0.5e-3, 0.010, workers=1, verbose=False)
+
+    def test_many_depths(self):
+        #the depths are reconstructed in chunks, whatever the memory budget
+        filenames = holobatch.find_holograms([self.tmp_dir])[:1]
+        z_values = numpy.linspace(5., 30., 11)
+        holobatch.run_batch(filenames, self.out_dir, z_values, 0.5e-3, 0.010,
+                            workers=1, dtype=numpy.float64,
+                            max_bytes=3 * 32 * 32 * 16, verbose=False)
+        result = numpy.load(os.path.join(self.out_dir, 'a.png.npy'))
+        holo = dhi.Hologram()
+        holo.load(filenames[0])
+        self.assertTrue(numpy.allclose(
+            numpy.abs(holo.reconstruct_stack(z_values)) ** 2, result))
+
+    def test_failures(self):
+        bad_name = os.path.join(self.tmp_dir, 'bad.png')
+        with open(bad_name, 'w') as bad_file:
+            bad_file.write('not an image')
+        summary = holobatch.run_batch([bad_name], self.out_dir, [10.],
+                                      0.5e-3, 0.010, workers=1, verbose=False)
+        self.assertEqual(1, summary['failed'])
+        self.assertFalse(os.listdir(self.out_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,344 @@
+"""
+Benchmarks for digitalholography and holofocus.
+
+Each benchmark case is run over a matrix of image sizes and dtypes. A case is
+timed by repeating it until at least min_time seconds have passed, after one
+untimed warm-up call (which fills kernel caches, FFT plans and the like, as
+in a long-running reconstruction); the result records the operations per
+second and the peak memory allocated by the case, including its set-up.
+
+The results are written as JSON, along with the versions and machine details
+needed to compare runs across releases and hardware:
+  {"metadata": {...},
+   "results": [{"case": "reconstruct", "size": 1024, "dtype": "float32",
+                "ops_per_sec": ..., "seconds_per_op": ..., "runs": ...,
+                "items_per_op": ..., "peak_bytes": ...}, ...]}
+items_per_op is the number of depths (or planes) processed by each
+operation, so items_per_op * ops_per_sec is the throughput in depths/sec.
+
+The kernel_exp and kernel_cs cases compare the two ways of evaluating the
+propagation kernel, exp(1j * phase) and cos(phase) + 1j * sin(phase), both
+from the double-precision phase and rounded to the working precision.
+kernel_exp times numpy.exp directly, since Hologram.holokern already uses
+cos+sin in single precision.
+
+By default, each case runs in a fresh worker process, so that the peak
+memory of one case doesn't hide the next; the peak is measured with
+tracemalloc where it is available (Python 3), and otherwise from the growth
+of the maximum resident set size of the worker.
+
+Example:
+  $ python holobench.py --sizes 256,1024 --dtypes float32 --output bench.json
+  $ python holobench.py --cases 'kernel_*,fft*'
+
+Change log:
+  2026/10/18 -- module started; nloomis@gmail.com
+  2026/10/18 -- synthetic particle holograms as inputs; nloomis@
+  2026/10/18 -- kernel_exp times numpy.exp in every precision; nloomis@
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import digitalholography as dhi
+import holofocus
+
+import argparse
+import collections
+import fnmatch
+import json
+import multiprocessing
+import numpy
+import platform
+import sys
+import time
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2
+    tracemalloc = None
+
+DEFAULT_SIZES = (256, 512, 1024, 2048, 4096)
+DEFAULT_DTYPES = ('float32', 'float64')
+
+# Depths in each scan benchmark, and the depth used for single
+# reconstructions; lengths are in mm, as for Hologram.
+SCAN_DEPTHS = 16
+BENCH_Z = 25.
+
+# Particle density of the synthetic holograms.
+PIXELS_PER_PARTICLE = 4096
+
+def _hologram(size, dtype, fft_backend, **kwargs):
+    """A Hologram loaded with a synthetic particle hologram of a size."""
+    random_state = numpy.random.RandomState(0)
+    particles = dhi.random_particles(max(size ** 2 // PIXELS_PER_PARTICLE, 1),
+                                     (size, size), (10., 40.), radius=3.,
+                                     n_depths=4, random_state=random_state)
+    data = dhi.synthetic_hologram((size, size), particles, noise=0.01,
+                                  dtype=dtype, random_state=random_state)
+    holo = dhi.Hologram(dtype=dtype, fft_backend=fft_backend, **kwargs)
+    holo.load(data.astype(dtype) / 255.)
+    return holo
+
+def _field(size, dtype):
+    """A random complex field of the given size."""
+    random_state = numpy.random.RandomState(0)
+    complex_dtype = numpy.result_type(dtype, numpy.complex64)
+    field = random_state.randn(size, size) + 1j * random_state.randn(size, size)
+    return field.astype(complex_dtype)
+
+def _case_kernel_exp(size, dtype, fft_backend):
+    #timed directly: in single precision, holokern() already uses cos+sin
+    holo = _hologram(size, dtype, fft_backend, kernel_cache_bytes=0)
+    holo._prepare_frequency_grids()
+    a = numpy.pi * holo.wavelength * BENCH_Z
+    return lambda: numpy.exp(1j * a * holo._freq_R2).astype(
+        holo.complex_dtype, copy=False), 1
+
+def _case_kernel_cs(size, dtype, fft_backend):
+    holo = _hologram(size, dtype, fft_backend, kernel_cache_bytes=0)
+    return lambda: holo.holokern_cs(BENCH_Z), 1
+
+def _case_fft2(size, dtype, fft_backend):
+    backend = dhi.make_fft_backend(fft_backend)
+    data = numpy.random.RandomState(0).random_sample((size, size))
+    data = data.astype(dtype)
+    return lambda: backend.fft2(data), 1
+
+def _case_ifft2(size, dtype, fft_backend):
+    backend = dhi.make_fft_backend(fft_backend)
+    field = _field(size, dtype)
+    return lambda: backend.ifft2(field), 1
+
+def _case_reconstruct(size, dtype, fft_backend):
+    #no kernel cache, so that every call evaluates its kernel
+    holo = _hologram(size, dtype, fft_backend, kernel_cache_bytes=0)
+    return lambda: holo.reconstruct(BENCH_Z), 1
+
+def _case_reconstruct_cached(size, dtype, fft_backend):
+    holo = _hologram(size, dtype, fft_backend)
+    return lambda: holo.reconstruct(BENCH_Z), 1
+
+def _case_scan(size, dtype, fft_backend):
+    holo = _hologram(size, dtype, fft_backend, kernel_cache_bytes=0)
+    z_values = BENCH_Z + 0.5 * numpy.arange(SCAN_DEPTHS)
+    def scan():
+        for _ in holo.scan(z_values):
+            pass
+    return scan, SCAN_DEPTHS
+
+def _case_reconstruct_stack(size, dtype, fft_backend):
+    holo = _hologram(size, dtype, fft_backend, kernel_cache_bytes=0)
+    z_values = BENCH_Z + 0.5 * numpy.arange(SCAN_DEPTHS)
+    def stack():
+        for _ in holo.iter_stack(z_values):
+            pass
+    return stack, SCAN_DEPTHS
+
+def _metric_case(metric):
+    """Makes a benchmark case for a holofocus metric."""
+    def case(size, dtype, fft_backend):
+        field = _field(size, dtype)
+        return lambda: metric(field, None), 1
+    return case
+
+def _case_all_metrics(size, dtype, fft_backend):
+    #every metric on a stack, sharing the magnitude
+    fields = numpy.array([_field(size, dtype)] * 4)
+    return lambda: holofocus.evaluate_metrics(fields), len(fields)
+
+def _make_cases():
+    """Builds the ordered dictionary of benchmark cases."""
+    cases = [('kernel_exp', _case_kernel_exp),
+             ('kernel_cs', _case_kernel_cs),
+             ('fft2', _case_fft2),
+             ('ifft2', _case_ifft2),
+             ('reconstruct', _case_reconstruct),
+             ('reconstruct_cached', _case_reconstruct_cached),
+             ('scan', _case_scan),
+             ('reconstruct_stack', _case_reconstruct_stack)]
+    for name in sorted(holofocus.METRICS):
+        cases.append(('focus_' + name,
+                      _metric_case(holofocus.METRICS[name])))
+    cases.append(('focus_all_stack', _case_all_metrics))
+    return collections.OrderedDict(cases)
+
+# Registered benchmark cases: name -> function(size, dtype, fft_backend),
+# which sets up the data and returns (operation, items_per_op). The
+# operation is called with no arguments.
+CASES = _make_cases()
+
+
+def _rss_bytes():
+    """Current resident set size in bytes, or None if it is unavailable."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (IOError, OSError, AttributeError):
+        return None
+
+def _max_rss_bytes():
+    """Maximum resident set size so far in bytes, or None."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #bytes on OS X, kilobytes elsewhere
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+def time_operation(operation, min_time=0.2, max_runs=1000):
+    """Times a callable; returns (runs, total seconds).
+
+    The operation is called once to warm up, then repeated until min_time has
+    passed or it has run max_runs times."""
+    operation()
+    runs = 0
+    start_time = time.time()
+    elapsed = 0.
+    while runs < max_runs and (runs == 0 or elapsed < min_time):
+        operation()
+        runs += 1
+        elapsed = time.time() - start_time
+    return runs, elapsed
+
+def run_case(task):
+    """Runs one benchmark case; returns its result dictionary.
+
+    task is a tuple of (case name, size, dtype name, fft backend, min_time),
+    so that run_case can be used with a process pool."""
+    name, size, dtype, fft_backend, min_time = task
+    result = {'case': name, 'size': size, 'dtype': dtype,
+              'fft_backend': fft_backend}
+    if tracemalloc is not None:
+        tracemalloc.start()
+    rss_before = _rss_bytes()
+    try:
+        operation, items_per_op = CASES[name](size, numpy.dtype(dtype),
+                                              fft_backend)
+        runs, elapsed = time_operation(operation, min_time)
+    except MemoryError as err:
+        result['error'] = 'MemoryError: %s' % err
+        return result
+    finally:
+        if tracemalloc is not None:
+            result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    if tracemalloc is None:
+        max_rss = _max_rss_bytes()
+        if max_rss is not None and rss_before is not None:
+            result['peak_bytes'] = max(max_rss - rss_before, 0)
+        else:
+            result['peak_bytes'] = None
+    result.update({'runs': runs, 'items_per_op': items_per_op,
+                   'seconds_per_op': elapsed / runs,
+                   'ops_per_sec': runs / elapsed})
+    return result
+
+def metadata(fft_backend):
+    """Describes the software and machine for a set of results."""
+    import scipy
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'scipy': scipy.__version__,
+            'pyfftw': getattr(dhi.pyfftw, '__version__', None),
+            'fft_backend': fft_backend,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': multiprocessing.cpu_count()}
+
+def select_cases(patterns=None):
+    """Names of the cases matching a list of glob patterns (all if None)."""
+    if not patterns:
+        return list(CASES)
+    return [name for name in CASES
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)]
+
+def run_benchmarks(cases=None, sizes=DEFAULT_SIZES, dtypes=DEFAULT_DTYPES,
+                   fft_backend='numpy', min_time=0.2, isolate=True,
+                   verbose=False):
+    """Runs a matrix of benchmarks; returns the JSON-ready report.
+
+    cases is a list of case names or glob patterns (see CASES); every case
+    is run for every size and dtype. With isolate, each case runs in its own
+    worker process."""
+    tasks = [(name, size, numpy.dtype(dtype).name, fft_backend, min_time)
+             for name in select_cases(cases) for size in sizes
+             for dtype in dtypes]
+    results = []
+    if isolate:
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            result_iter = pool.imap(run_case, tasks)
+            for result in result_iter:
+                results.append(result)
+                if verbose:
+                    _report(result)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            results.append(run_case(task))
+            if verbose:
+                _report(results[-1])
+    return {'metadata': metadata(fft_backend), 'results': results}
+
+def _report(result):
+    """Writes a one-line summary of a result to stderr."""
+    if 'error' in result:
+        summary = result['error']
+    else:
+        summary = '%10.2f ops/sec' % result['ops_per_sec']
+        if result['peak_bytes'] is not None:
+            summary += ', %8.1f MB peak' % (result['peak_bytes'] / 1024. ** 2)
+    sys.stderr.write('%-24s %5d %-8s %s\n' % (result['case'], result['size'],
+                                              result['dtype'], summary))
+
+def main(argv=None):
+    """Command-line entry point; returns the process exit code."""
+    parser = argparse.ArgumentParser(
+        description='Benchmark digitalholography and holofocus.')
+    parser.add_argument('--cases', default=None,
+                        help='comma-separated case names or glob patterns; '
+                             'use --list to see the cases')
+    parser.add_argument('--list', action='store_true',
+                        help='list the benchmark cases and exit')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma-separated image sizes, in pixels')
+    parser.add_argument('--dtypes', default=','.join(DEFAULT_DTYPES),
+                        help='comma-separated working dtypes')
+    parser.add_argument('--fft-backend', default='numpy',
+                        choices=sorted(dhi.FFT_BACKENDS))
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='minimum timing duration for each case, in s')
+    parser.add_argument('--no-isolate', action='store_true',
+                        help='run every case in this process')
+    parser.add_argument('--output', default=None,
+                        help='JSON file for the results; default is stdout')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(CASES))
+        return 0
+    cases = args.cases.split(',') if args.cases else None
+    if not select_cases(cases):
+        sys.stderr.write('No benchmark cases match %s.\n' % args.cases)
+        return 1
+    report = run_benchmarks(cases, [int(size) for size in args.sizes.split(',')],
+                            args.dtypes.split(','), args.fft_backend,
+                            args.min_time, not args.no_isolate, verbose=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=1, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
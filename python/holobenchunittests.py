@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for holobench.py.
+
+Change log:
+  2026/10/18: unit tests started; nloomis@gmail.com
+  2026/10/18: kernel cases; nloomis@
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import holobench
+
+import json
+import numpy
+import unittest
+
+class BenchmarkTest(unittest.TestCase):
+    """Tests for the benchmark harness, with tiny sizes and short timings."""
+
+    def test_select_cases(self):
+        self.assertEqual(['kernel_exp', 'kernel_cs'],
+                         holobench.select_cases(['kernel_*']))
+        self.assertIn('focus_Sobel', holobench.select_cases(['focus_*']))
+        self.assertEqual(list(holobench.CASES), holobench.select_cases())
+
+    def test_kernel_cases(self):
+        #kernel_exp computes the same kernel as holokern_cs, in the working
+        #precision, but always through numpy.exp
+        for dtype in (numpy.float32, numpy.float64):
+            kernel_exp, _ = holobench.CASES['kernel_exp'](32, dtype, 'numpy')
+            holo = holobench._hologram(32, dtype, 'numpy')
+            holo.holokern_cs(holobench.BENCH_Z)
+            expected = numpy.result_type(dtype, numpy.complex64)
+            self.assertEqual(expected, kernel_exp().dtype)
+            self.assertTrue(numpy.allclose(holo.kernel, kernel_exp(),
+                                           atol=1e-5))
+
+    def test_report(self):
+        report = holobench.run_benchmarks(['kernel_cs', 'scan'], sizes=[32],
+                                          dtypes=['float32', 'float64'],
+                                          min_time=0.001, isolate=False)
+        self.assertEqual('numpy', report['metadata']['fft_backend'])
+        results = report['results']
+        self.assertEqual(4, len(results))
+        for result in results:
+            self.assertGreater(result['ops_per_sec'], 0)
+            self.assertGreaterEqual(result['runs'], 1)
+        self.assertEqual(holobench.SCAN_DEPTHS, results[-1]['items_per_op'])
+        #the report must round-trip through JSON
+        self.assertEqual(report, json.loads(json.dumps(report)))
+
+    def test_isolated(self):
+        report = holobench.run_benchmarks(['fft2'], sizes=[32],
+                                          dtypes=['float32'], min_time=0.001)
+        self.assertEqual(1, len(report['results']))
+        self.assertIn('peak_bytes', report['results'][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
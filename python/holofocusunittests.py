@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for holofocus.py.
+
+Change log:
+  2026/10/18: unit tests started; nloomis@gmail.com
+  2026/10/18: metric registry and tiled evaluation; nloomis@
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import digitalholography as dhi
+import holofocus
+
+import numpy
+import unittest
+
+METRICS = (holofocus.SobelMetric, holofocus.PrewittMetric,
+           holofocus.ScharrMetric, holofocus.GaussianGradientMetric,
+           holofocus.GaussianLaplaceMetric, holofocus.LaplaceMetric,
+           holofocus.RobersMetric, holofocus.EntropyMetric,
+           holofocus.RangeMetric, holofocus.SteerableDerivativeMetric)
+
+class MetricTest(unittest.TestCase):
+    """Tests that each metric works on single fields and on stacks."""
+
+    fields = numpy.random.RandomState(0).rand(3, 20, 24) + 0j
+
+    def test_batched_metrics(self):
+        for metric in METRICS:
+            stack_focus = metric(self.fields, None)
+            self.assertEqual(self.fields.shape, stack_focus.shape)
+            for field, focus in zip(self.fields, stack_focus):
+                self.assertTrue(numpy.allclose(metric(field, None), focus),
+                                metric.__name__)
+
+    def test_tiled_threads(self):
+        fields = numpy.random.RandomState(4).rand(2, 45, 38) + 0j
+        whole = holofocus.evaluate_metrics(fields, tile_size=None)
+        tiled = holofocus.evaluate_metrics(fields, workers=3, tile_size=16)
+        self.assertEqual(set(holofocus.METRICS), set(whole))
+        for name in holofocus.METRICS:
+            self.assertEqual(numpy.float32, tiled[name].dtype)
+            self.assertTrue(numpy.allclose(whole[name], tiled[name],
+                                           atol=1e-6), name)
+
+    def test_options(self):
+        field = self.fields[0]
+        metric = holofocus.GaussianGradientMetric
+        self.assertTrue(numpy.allclose(metric(field, None),
+                                       metric(field, {'sigma': 2.0})))
+        self.assertFalse(numpy.allclose(metric(field, None),
+                                        metric(field, {'sigma': 1.0})))
+        results = holofocus.evaluate_metrics(
+            self.fields, ['Entropy', 'Range'], {'Range': {'radius': 2}})
+        self.assertTrue(numpy.allclose(
+            holofocus.RangeMetric(self.fields, {'radius': 2}), results['Range']))
+
+
+class FocusStackTest(unittest.TestCase):
+    """Tests for the streaming best-focus search."""
+
+    def setUp(self):
+        self.holo = dhi.Hologram()
+        self.holo.load(numpy.random.RandomState(1).rand(24, 32))
+        self.z_values = numpy.linspace(20., 80., 7)
+
+    def test_focus_stack(self):
+        #a small budget splits the depths over several chunks
+        value, pixel, index = holofocus.FocusStack(
+            self.holo, self.z_values, holofocus.LaplaceMetric, max_bytes=0)
+        self.assertEqual(numpy.uint8, index.dtype)
+        volume = self.holo.reconstruct_stack(self.z_values)
+        focus = holofocus.LaplaceMetric(volume, None)
+        self.assertTrue(numpy.array_equal(numpy.argmax(focus, axis=0), index))
+        self.assertTrue(numpy.allclose(numpy.max(focus, axis=0), value))
+        rows, cols = numpy.indices(index.shape)
+        self.assertTrue(numpy.allclose(volume[index, rows, cols], pixel))
+
+
+class AutofocusTest(unittest.TestCase):
+    """Tests for the coarse-to-fine autofocus search."""
+
+    def test_autofocus(self):
+        #the complex field of a single disk, propagated away from its plane of
+        #focus; using the field rather than the intensity avoids a twin image
+        z_focus = 5.37
+        rows, cols = numpy.indices((128, 128))
+        disk = ((rows - 64) ** 2 + (cols - 60) ** 2 <= 36).astype(float)
+        holo = dhi.Hologram(wavelength=0.658e-3, pixel_size=0.010)
+        holo.load(1. - disk)
+        holo.load(holo.reconstruct(-z_focus))
+        z, score, n_reconstructions = holofocus.Autofocus(
+            holo, 1., 10., tolerance=0.010)
+        self.assertAlmostEqual(z_focus, z, delta=0.010)
+        self.assertGreater(score, 0)
+        self.assertLessEqual(n_reconstructions, 25)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+Tiled reconstruction of holograms which are too large to fit in memory.
+
+The hologram is read through a numpy memmap (see imageutils.memmap_image) and
+reconstructed as a set of overlapping tiles. Each tile is padded by a guard
+band as wide as the spatial extent of the propagation kernel, so that the
+central, valid region of the tile is not affected by the tile's edges; the
+valid regions are stitched together into an output memmap. Peak memory is set
+by the tile size and the number of workers, not by the hologram size.
+
+Change log:
+  2026/10/18 -- module started; nloomis@gmail.com
+  2026/10/18 -- TIFFs which can't be memory-mapped are read with opencv;
+                nloomis@
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import cv2
+import cv2utils
+import digitalholography as dhi
+import imageutils
+
+import multiprocessing.pool
+import numpy
+import threading
+
+
+def guard_band(wavelength, pixel_size, z):
+    """Half-width, in pixels, of the propagation kernel at a distance z.
+
+    The Fresnel kernel is a chirp whose local frequency grows linearly with
+    the distance from its centre, x / (wavelength * z). It reaches the
+    Nyquist frequency of the sampling, 1 / (2 * pixel_size), at
+      x = wavelength * z / (2 * pixel_size),
+    so light recorded further away than this from a point can't contribute to
+    the reconstruction at that point."""
+    return int(numpy.ceil(abs(z) * wavelength / (2. * pixel_size ** 2)))
+
+def tile_origins(n, tile_size):
+    """Start indices of the valid regions of tiles along one axis."""
+    return range(0, n, tile_size)
+
+def reconstruct_tiled(source, z, out, wavelength=0.500e-3, pixel_size=0.010,
+                      tile_size=1024, workers=1, intensity=True,
+                      dtype=numpy.float32, scale=None, fft_backend=None):
+    """Reconstructs a large hologram at a depth, one tile at a time.
+
+    Inputs:
+      source: 2D array-like with the hologram; usually a memmap from
+        imageutils.memmap_image, or a filename to open with it. TIFFs which
+        can't be memory-mapped are read into memory with opencv.
+      z: reconstruction distance.
+      out: filename of a .npy file to create for the result, or an existing
+        array (or memmap) of the same shape as the source to fill.
+      wavelength, pixel_size: as for digitalholography.Hologram.
+      tile_size: size of the square valid region of each tile, in pixels.
+        Each tile is reconstructed with a guard band of guard_band() pixels on
+        every side, so tile_size should be large compared to the guard band.
+      workers: number of tiles to reconstruct in parallel threads. Threads
+        only overlap their FFTs with backends which release the GIL, such as
+        scipy.fft or pyfftw.
+      intensity: if True, the intensity of the field is stored; otherwise,
+        the complex field.
+      dtype: working precision of the reconstruction, numpy.float32 or
+        numpy.float64.
+      scale: factor applied to the source values; the default maps the full
+        range of integer data to [0, 1] and leaves float data unchanged.
+      fft_backend: FFT backend for the tiles; see digitalholography.
+
+    Tiles at the edges of the hologram are padded with their mean value, so
+    that every tile has the same shape and can share kernels and FFT plans.
+
+    Returns the output array, which is flushed to disk if it is a memmap."""
+    if isinstance(source, basestring):
+        try:
+            source = imageutils.memmap_image(source)
+        except ValueError:
+            #compressed or tiled TIFFs can't be memory-mapped; opencv reads
+            #them into memory instead
+            if not source.lower().endswith(('.tif', '.tiff')):
+                raise
+            source = cv2utils.imread(source, cv2.IMREAD_UNCHANGED)
+    ny, nx = source.shape[:2]
+    if scale is None:
+        if numpy.issubdtype(source.dtype, numpy.integer):
+            scale = 1. / numpy.iinfo(source.dtype).max
+        else:
+            scale = 1.
+    complex_dtype = numpy.result_type(dtype, numpy.complex64)
+    out_dtype = dtype if intensity else complex_dtype
+    if isinstance(out, basestring):
+        out = numpy.lib.format.open_memmap(out, mode='w+', dtype=out_dtype,
+                                           shape=(ny, nx))
+    if out.shape[:2] != (ny, nx):
+        raise ValueError('The output shape %s does not match the source %s.'
+                         % (out.shape, (ny, nx)))
+
+    guard = guard_band(wavelength, pixel_size, z)
+    padded_size = tile_size + 2 * guard
+    #each thread gets its own Hologram, since a Hologram stores its results;
+    #they share the FFT backend, which keeps per-thread plans
+    local = threading.local()
+
+    def reconstruct_tile(origin):
+        y0, x0 = origin
+        if not hasattr(local, 'holo'):
+            local.holo = dhi.Hologram(wavelength, pixel_size, dtype=dtype,
+                                      fft_backend=fft_backend)
+        y1 = min(y0 + tile_size, ny)
+        x1 = min(x0 + tile_size, nx)
+        #region of the source covered by the padded tile
+        ys = max(y0 - guard, 0)
+        ye = min(y0 + tile_size + guard, ny)
+        xs = max(x0 - guard, 0)
+        xe = min(x0 + tile_size + guard, nx)
+        tile = numpy.multiply(source[ys:ye, xs:xe], scale, dtype=dtype)
+        padding = ((ys - (y0 - guard), (y0 - guard + padded_size) - ye),
+                   (xs - (x0 - guard), (x0 - guard + padded_size) - xe))
+        if any(before or after for before, after in padding):
+            tile = numpy.pad(tile, padding, mode='constant',
+                             constant_values=tile.mean())
+        local.holo.load(tile)
+        field = local.holo.reconstruct(z)[guard:guard + y1 - y0,
+                                          guard:guard + x1 - x0]
+        if intensity:
+            out[y0:y1, x0:x1] = numpy.abs(field) ** 2
+        else:
+            out[y0:y1, x0:x1] = field
+
+    origins = [(y0, x0) for y0 in tile_origins(ny, tile_size)
+               for x0 in tile_origins(nx, tile_size)]
+    if workers > 1:
+        pool = multiprocessing.pool.ThreadPool(workers)
+        try:
+            for _ in pool.imap_unordered(reconstruct_tile, origins):
+                pass
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for origin in origins:
+            reconstruct_tile(origin)
+    if isinstance(out, numpy.memmap):
+        out.flush()
+    return out
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for holotiles.py and the memory-mapped image reading it uses.
+
+Change log:
+  2026/10/18: unit tests started; nloomis@gmail.com
+  2026/10/18: memory-mapped pgm files; nloomis@
+  2026/10/18: tiled and truncated tiffs; nloomis@
+  2026/10/18: threads sharing a pyfftw backend; nloomis@
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import digitalholography as dhi
+import holotiles
+import imageutils
+
+import cv2
+import numpy
+import os.path
+import scipy.ndimage
+import shutil
+import struct
+import tempfile
+import unittest
+
+def write_tiled_tiff(filename, data, tile_size=16):
+    """Writes a little-endian, uncompressed, single-channel tiled TIFF."""
+    ny, nx = data.shape
+    tiles = []
+    for y0 in range(0, ny, tile_size):
+        for x0 in range(0, nx, tile_size):
+            tile = numpy.zeros((tile_size, tile_size), dtype=data.dtype)
+            block = data[y0:y0 + tile_size, x0:x0 + tile_size]
+            tile[:block.shape[0], :block.shape[1]] = block
+            tiles.append(tile.astype('<' + data.dtype.str[1:]).tobytes())
+    n_tags = 10
+    pixel_start = 8 + 2 + 12 * n_tags + 4
+    arrays_start = pixel_start + sum(len(tile) for tile in tiles)
+    offsets = [pixel_start + sum(len(tile) for tile in tiles[:k])
+               for k in range(len(tiles))]
+    #(tag, type, count, value); type 3 is a short and 4 a long
+    entries = [(256, 4, 1, nx), (257, 4, 1, ny),
+               (258, 3, 1, 8 * data.dtype.itemsize), (259, 3, 1, 1),
+               (262, 3, 1, 1), (277, 3, 1, 1), (322, 4, 1, tile_size),
+               (323, 4, 1, tile_size),
+               (324, 4, len(tiles), arrays_start),
+               (325, 4, len(tiles), arrays_start + 4 * len(tiles))]
+    with open(filename, 'wb') as tiff:
+        tiff.write(struct.pack('<2sHI', b'II', 42, 8))
+        tiff.write(struct.pack('<H', n_tags))
+        for tag, field_type, count, value in entries:
+            if field_type == 3:
+                tiff.write(struct.pack('<HHIHH', tag, field_type, count,
+                                       value, 0))
+            else:
+                tiff.write(struct.pack('<HHII', tag, field_type, count,
+                                       value))
+        tiff.write(struct.pack('<I', 0))
+        for tile in tiles:
+            tiff.write(tile)
+        tiff.write(struct.pack('<%dI' % len(tiles), *offsets))
+        tiff.write(struct.pack('<%dI' % len(tiles),
+                               *[len(tile) for tile in tiles]))
+
+class MemmapImageTest(unittest.TestCase):
+    """Tests for imageutils.memmap_image."""
+
+    data = (numpy.random.RandomState(0).rand(30, 20) * 4095).astype('uint16')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_npy(self):
+        filename = os.path.join(self.tmp_dir, 'holo.npy')
+        numpy.save(filename, self.data)
+        img = imageutils.memmap_image(filename)
+        self.assertIsInstance(img, numpy.memmap)
+        self.assertTrue(numpy.array_equal(self.data, img))
+
+    def test_raw(self):
+        filename = os.path.join(self.tmp_dir, 'holo.raw')
+        with open(filename, 'wb') as raw:
+            raw.write(b'header')
+            raw.write(self.data.tobytes())
+        img = imageutils.memmap_image(filename, self.data.shape, 'uint16',
+                                      offset=6)
+        self.assertTrue(numpy.array_equal(self.data, img))
+        with self.assertRaises(ValueError):
+            imageutils.memmap_image(filename)
+
+    def test_tiff(self):
+        filename = os.path.join(self.tmp_dir, 'holo.tif')
+        cv2.imwrite(filename, self.data, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+        img = imageutils.memmap_image(filename)
+        self.assertEqual(numpy.uint16, img.dtype)
+        self.assertTrue(numpy.array_equal(self.data, img))
+
+    def test_tiled_tiff(self):
+        #tiled TIFFs can't be memory-mapped, but opencv reads them
+        filename = os.path.join(self.tmp_dir, 'holo.tif')
+        write_tiled_tiff(filename, self.data)
+        self.assertRaises(ValueError, imageutils.memmap_image, filename)
+        self.assertTrue(numpy.array_equal(
+            self.data, cv2.imread(filename, cv2.IMREAD_UNCHANGED)))
+
+    def test_truncated_tiff(self):
+        filename = os.path.join(self.tmp_dir, 'holo.tif')
+        cv2.imwrite(filename, self.data, [cv2.IMWRITE_TIFF_COMPRESSION, 1])
+        shape, dtype, offset = imageutils._tiff_layout(filename)
+        with open(filename, 'rb') as tiff:
+            contents = tiff.read()
+        #drop the tail of the pixels, and the byte count which covered them
+        pixel_bytes = self.data.nbytes
+        count = struct.pack('<I', pixel_bytes)
+        self.assertEqual(1, contents.count(count))
+        contents = contents.replace(count, struct.pack('<I', pixel_bytes // 2))
+        with open(filename, 'wb') as tiff:
+            tiff.write(contents)
+        self.assertRaises(ValueError, imageutils.memmap_image, filename)
+
+    def test_pgm(self):
+        filename = os.path.join(self.tmp_dir, 'holo.pgm')
+        cv2.imwrite(filename, self.data)
+        img = imageutils.memmap_image(filename)
+        self.assertTrue(numpy.array_equal(self.data, img))
+        self.assertEqual(65535, imageutils.image_white_level(filename,
+                                                             img.dtype))
+
+
+class TiledReconstructionTest(unittest.TestCase):
+    """Tests for holotiles.reconstruct_tiled."""
+
+    def test_guard_band(self):
+        self.assertEqual(25, holotiles.guard_band(0.5e-3, 0.010, 10.))
+        self.assertEqual(25, holotiles.guard_band(0.5e-3, 0.010, -10.))
+
+    def test_reconstruct_tiled(self):
+        #smooth data, so that little energy falls outside the guard band
+        data = scipy.ndimage.gaussian_filter(
+            numpy.random.RandomState(1).rand(120, 100), 3, mode='wrap')
+        z = 10.
+        holo = dhi.Hologram()
+        holo.load(data)
+        field = holo.reconstruct(z)
+        tiled = holotiles.reconstruct_tiled(
+            data, z, numpy.zeros(data.shape, dtype=complex), tile_size=32,
+            workers=2, intensity=False, dtype=numpy.float64)
+        #the full reconstruction wraps around at the edges; compare the
+        #interior, which is unaffected
+        guard = holotiles.guard_band(holo.wavelength, holo.pixel_size, z)
+        interior = (slice(guard, -guard), slice(guard, -guard))
+        self.assertTrue(numpy.allclose(field[interior], tiled[interior],
+                                       atol=1e-2))
+
+    def test_tiled_tiff_source(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmp_dir, 'holo.tif')
+            write_tiled_tiff(source, numpy.full((40, 50), 1000,
+                                                dtype=numpy.uint16))
+            out = holotiles.reconstruct_tiled(source, 5., numpy.zeros(
+                (40, 50), dtype=numpy.float32), tile_size=16)
+            self.assertTrue(numpy.allclose((1000. / 65535.) ** 2, out))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    @unittest.skipIf(dhi.pyfftw is None, 'pyFFTW is not installed')
+    def test_threads_share_pyfftw(self):
+        #threads share one pyfftw backend, and must not corrupt each other's
+        #transforms
+        data = numpy.random.RandomState(2).rand(256, 256)
+        backend = dhi.FFTWFFT(threads=1, planner_effort='FFTW_ESTIMATE')
+        single = holotiles.reconstruct_tiled(
+            data, 5., numpy.zeros(data.shape, dtype=numpy.float32),
+            tile_size=32, workers=1)
+        threaded = holotiles.reconstruct_tiled(
+            data, 5., numpy.zeros(data.shape, dtype=numpy.float32),
+            tile_size=32, workers=8, fft_backend=backend)
+        self.assertTrue(numpy.allclose(single, threaded, atol=1e-5))
+
+    def test_memmap_output(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            source = os.path.join(tmp_dir, 'holo.npy')
+            numpy.save(source, numpy.full((40, 50), 128, dtype=numpy.uint8))
+            out = holotiles.reconstruct_tiled(
+                source, 5., os.path.join(tmp_dir, 'out.npy'), tile_size=16)
+            self.assertEqual(numpy.float32, out.dtype)
+            #a uniform hologram reconstructs to a uniform intensity
+            self.assertTrue(numpy.allclose((128. / 255.) ** 2, out))
+            del out
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
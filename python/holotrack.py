@@ -0,0 +1,295 @@
+"""
+Depth-constrained particle tracking through a sequence of holograms.
+
+Particles move only a little between frames, so after a particle has been
+found, it is looked for in the next frame only near its predicted position:
+a small region of the hologram around the prediction is cut out (padded by
+the guard band of the propagation kernel, as in holotiles) and reconstructed
+at a few depths around the predicted depth. The per-frame cost then scales
+with the number of tracks and the size of their search windows, rather than
+with the size of the hologram or the depth of the volume. A full sweep of
+the whole hologram through all of the depths is only done for the first
+frame, and again whenever a track is lost, to re-acquire it and to pick up
+new particles.
+
+Detections come from a holofocus metric: the best focus value over depth is
+thresholded, the connected regions above the threshold are the particles,
+the (x, y) position of a particle is the focus-weighted centroid of its
+region and its depth is the depth of best focus at the region's peak.
+
+Positions are in pixels for x and y, and in the hologram's length units for
+z. Tracks predict their next position with a constant-velocity model.
+
+Example:
+  tracker = ParticleTracker(wavelength=0.658e-3, pixel_size=0.010,
+                            z_values=numpy.arange(10., 50., 0.5))
+  for frame in frames:
+      tracker.process(frame)
+  for track in tracker.tracks:
+      print(track.track_id, track.positions)
+
+Change log:
+  2026/10/18 -- module started; nloomis@gmail.com
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import digitalholography as dhi
+import holofocus
+import holotiles
+
+import numpy
+import scipy.ndimage
+
+
+class Track(object):
+    """A particle's trajectory.
+
+    positions is a list of (frame, x, y, z, size, score) tuples, one for each
+    frame in which the particle was detected; missed counts the frames since
+    the last detection."""
+
+    def __init__(self, track_id):
+        self.track_id = track_id
+        self.positions = []
+        self.missed = 0
+        self.active = True
+
+    def add(self, frame, detection):
+        """Appends a detection, (x, y, z, size, score), for a frame."""
+        self.positions.append((frame,) + tuple(detection))
+        self.missed = 0
+
+    def predict(self, frame):
+        """Predicted (x, y, z) at a frame, from the last two detections."""
+        last = numpy.array(self.positions[-1][1:4])
+        if len(self.positions) < 2:
+            return last
+        previous = numpy.array(self.positions[-2][1:4])
+        frames = float(self.positions[-1][0] - self.positions[-2][0])
+        velocity = (last - previous) / frames
+        return last + velocity * (frame - self.positions[-1][0])
+
+
+class ParticleTracker(object):
+    """Tracks particles through a sequence of holograms.
+
+    Inputs:
+      wavelength, pixel_size: as for digitalholography.Hologram.
+      z_values: depths of the full sweeps.
+      z_window: half-width of the depth range searched around a track's
+        predicted depth; defaults to four of the full sweep's depth steps.
+      z_step: depth step within the window; defaults to a quarter of the full
+        sweep's step, so that tracking also refines the depths.
+      roi_radius: half-size, in pixels, of the region searched around a
+        track's predicted (x, y) position.
+      focus_function, options: the holofocus metric used for detection.
+      threshold_sigma: the detection threshold is the mean plus this many
+        standard deviations of the best-focus map of the last full sweep.
+      max_missed: a track is ended after this many frames without a
+        detection.
+      dtype: working precision of the reconstructions.
+
+    The full_sweeps and local_searches counters record how many of each
+    search have been done."""
+
+    def __init__(self, wavelength=0.500e-3, pixel_size=0.010, z_values=None,
+                 z_window=None, z_step=None, roi_radius=16,
+                 focus_function=None, options=None, threshold_sigma=4.,
+                 max_missed=2, dtype=numpy.float32):
+        if z_values is None:
+            raise ValueError('z_values are needed for the full sweeps.')
+        self.wavelength = wavelength
+        self.pixel_size = pixel_size
+        self.z_values = numpy.atleast_1d(numpy.asarray(z_values, dtype=float))
+        sweep_step = (numpy.abs(numpy.diff(self.z_values)).mean()
+                      if len(self.z_values) > 1 else 1.)
+        self.z_window = 4 * sweep_step if z_window is None else z_window
+        self.z_step = sweep_step / 4. if z_step is None else z_step
+        self.roi_radius = roi_radius
+        if focus_function is None:
+            focus_function = holofocus.GaussianGradientMetric
+        self.focus_function = focus_function
+        self.options = options
+        self.threshold_sigma = threshold_sigma
+        self.max_missed = max_missed
+        self.dtype = dtype
+        self.tracks = []
+        self.threshold = None
+        self.frame = -1
+        self.full_sweeps = 0
+        self.local_searches = 0
+        # _frame_holo holds the current frame; _roi_holos has one Hologram
+        # per search window shape, so that their kernels are re-used.
+        self._frame_holo = dhi.Hologram(wavelength, pixel_size, dtype=dtype)
+        self._roi_holos = {}
+
+    @property
+    def active_tracks(self):
+        """Returns the tracks which are still being followed."""
+        return [track for track in self.tracks if track.active]
+
+    def process(self, frame_data):
+        """Tracks the particles into the next frame.
+
+        frame_data is a hologram array or filename, as for Hologram.load.
+        Returns a list of (track, detection) pairs for the particles which
+        were found in this frame."""
+        self.frame += 1
+        self._frame_holo.load(frame_data)
+        found = []
+        lost = False
+        for track in self.active_tracks:
+            detection = self._local_search(track.predict(self.frame))
+            if detection is None:
+                track.missed += 1
+                lost = True
+            else:
+                track.add(self.frame, detection)
+                found.append((track, detection))
+        if lost or not self.active_tracks:
+            found.extend(self._reacquire(found))
+        for track in self.active_tracks:
+            if track.missed > self.max_missed:
+                track.active = False
+        return found
+
+    def _detect(self, value, index, z_values, mask=None):
+        """Finds particles in a best-focus map.
+
+        value and index are the best focus value and depth index of each
+        pixel, from holofocus.FocusStack. Returns a list of (x, y, z, size,
+        score) detections, in the map's pixel coordinates."""
+        above = value > self.threshold
+        if mask is not None:
+            above &= mask
+        labels, n_labels = scipy.ndimage.label(above)
+        if n_labels == 0:
+            return []
+        label_ids = numpy.arange(1, n_labels + 1)
+        y, x = numpy.indices(value.shape)
+        weights = numpy.where(above, value, 0.)
+        total = scipy.ndimage.sum(weights, labels, label_ids)
+        x_mean = scipy.ndimage.sum(weights * x, labels, label_ids) / total
+        y_mean = scipy.ndimage.sum(weights * y, labels, label_ids) / total
+        sizes = scipy.ndimage.sum(above, labels, label_ids)
+        peaks = scipy.ndimage.maximum_position(value, labels, label_ids)
+        detections = []
+        for k, peak in enumerate(peaks):
+            detections.append((float(x_mean[k]), float(y_mean[k]),
+                               float(z_values[index[peak]]), int(sizes[k]),
+                               float(value[peak])))
+        return detections
+
+    def _full_sweep(self):
+        """Detects particles in the whole frame at all of the depths."""
+        self.full_sweeps += 1
+        value, _, index = holofocus.FocusStack(
+            self._frame_holo, self.z_values, self.focus_function, self.options)
+        self.threshold = value.mean() + self.threshold_sigma * value.std()
+        return self._detect(value, index, self.z_values)
+
+    def _reacquire(self, found):
+        """Runs a full sweep; links its detections to lost tracks.
+
+        Detections of particles which were already found in this frame are
+        dropped; the rest are matched, nearest first, to the predicted
+        positions of the tracks which weren't found, within the search window.
+        Unmatched detections start new tracks. Returns the new (track,
+        detection) pairs."""
+        detections = self._full_sweep()
+        detections = [detection for detection in detections
+                      if not any(self._in_window(detection, other[:3])
+                                 for _, other in found)]
+        found_tracks = set(track for track, _ in found)
+        lost_tracks = [track for track in self.active_tracks
+                       if track not in found_tracks]
+        pairs = []
+        for track in lost_tracks:
+            predicted = track.predict(self.frame)
+            for k, detection in enumerate(detections):
+                if self._in_window(detection, predicted):
+                    distance = numpy.hypot(detection[0] - predicted[0],
+                                           detection[1] - predicted[1])
+                    pairs.append((distance, k, track))
+        matched = []
+        used_detections = set()
+        used_tracks = set()
+        for _, k, track in sorted(pairs, key=lambda pair: pair[0]):
+            if k in used_detections or track in used_tracks:
+                continue
+            used_detections.add(k)
+            used_tracks.add(track)
+            track.add(self.frame, detections[k])
+            matched.append((track, detections[k]))
+        for k, detection in enumerate(detections):
+            if k not in used_detections:
+                track = Track(len(self.tracks))
+                track.add(self.frame, detection)
+                self.tracks.append(track)
+                matched.append((track, detection))
+        return matched
+
+    def _in_window(self, detection, predicted):
+        """Whether a detection falls in the search window of a prediction."""
+        return (abs(detection[0] - predicted[0]) <= self.roi_radius and
+                abs(detection[1] - predicted[1]) <= self.roi_radius and
+                abs(detection[2] - predicted[2]) <= self.z_window)
+
+    def _local_search(self, predicted):
+        """Looks for a particle near a predicted (x, y, z) position.
+
+        Only a region of roi_radius around the prediction, plus the kernel's
+        guard band, is reconstructed, at depths within z_window of the
+        prediction. Returns the detection nearest to the prediction, or None
+        if there isn't one above the threshold."""
+        self.local_searches += 1
+        x, y, z = predicted
+        z_local = numpy.arange(z - self.z_window, z + self.z_window +
+                               0.5 * self.z_step, self.z_step)
+        #z = 0 is the sensor plane; negative depths are valid scans
+        z_local = z_local[z_local != 0]
+        if z_local.size == 0:
+            return None
+        guard = holotiles.guard_band(self.wavelength, self.pixel_size,
+                                     numpy.abs(z_local).max())
+        half = self.roi_radius + guard
+        size = 2 * half + 1
+        data = self._frame_holo.data
+        ny, nx = data.shape[:2]
+        cx, cy = int(round(x)), int(round(y))
+        if not (0 <= cx < nx and 0 <= cy < ny):
+            return None
+        #region of the frame covered by the window, padded to a fixed size
+        ys, ye = max(cy - half, 0), min(cy + half + 1, ny)
+        xs, xe = max(cx - half, 0), min(cx + half + 1, nx)
+        window = data[ys:ye, xs:xe]
+        padding = ((ys - (cy - half), (cy + half + 1) - ye),
+                   (xs - (cx - half), (cx + half + 1) - xe))
+        if any(before or after for before, after in padding):
+            window = numpy.pad(window, padding, mode='constant',
+                               constant_values=window.mean())
+        holo = self._roi_holos.get(size)
+        if holo is None:
+            holo = dhi.Hologram(self.wavelength, self.pixel_size,
+                                dtype=self.dtype)
+            self._roi_holos[size] = holo
+        holo.load(window)
+        value, _, index = holofocus.FocusStack(holo, z_local,
+                                               self.focus_function,
+                                               self.options)
+        mask = numpy.zeros(value.shape, dtype=bool)
+        mask[guard:size - guard, guard:size - guard] = True
+        detections = self._detect(value, index, z_local, mask)
+        if not detections:
+            return None
+        #back to frame coordinates; the window starts at cx - half, cy - half
+        detections = [(d[0] + cx - half, d[1] + cy - half) + d[2:]
+                      for d in detections]
+        return min(detections, key=lambda detection: numpy.hypot(
+            detection[0] - x, detection[1] - y))
+
+    def track(self, frames):
+        """Processes a sequence of frames; returns all of the tracks."""
+        for frame_data in frames:
+            self.process(frame_data)
+        return self.tracks
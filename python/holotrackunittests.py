@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for holotrack.py.
+
+Change log:
+  2026/10/18: unit tests started; nloomis@gmail.com
+  2026/10/18: negative depths; nloomis@
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import digitalholography as dhi
+import holotrack
+
+import numpy
+import unittest
+
+def particle_field(particles, shape=(128, 128)):
+    """Complex field of small opaque disks at (x, y, z), seen from z = 0."""
+    rows, cols = numpy.indices(shape)
+    holo = dhi.Hologram(wavelength=0.658e-3, pixel_size=0.010)
+    field = numpy.ones(shape, dtype=complex)
+    for x, y, z in particles:
+        disk = ((rows - y) ** 2 + (cols - x) ** 2 <= 9).astype(float)
+        holo.load(1. - disk)
+        field += holo.reconstruct(-z) - 1.
+    return field
+
+class TrackerTest(unittest.TestCase):
+    """Tests for tracking particles through a short sequence of frames."""
+
+    def make_tracker(self):
+        return holotrack.ParticleTracker(0.658e-3, 0.010,
+                                         numpy.arange(2., 10., 0.5),
+                                         roi_radius=8)
+
+    def test_tracking(self):
+        frames = [particle_field([(30 + 2 * k, 40 + k, 4.), (90 - k, 80, 7.)])
+                  for k in range(4)]
+        tracker = self.make_tracker()
+        tracks = tracker.track(frames)
+        self.assertEqual(2, len(tracks))
+        #after the first frame, only the search windows were reconstructed
+        self.assertEqual(1, tracker.full_sweeps)
+        self.assertEqual(6, tracker.local_searches)
+        for track in tracks:
+            self.assertEqual(range(4), [position[0]
+                                        for position in track.positions])
+        first = min(tracks, key=lambda track: track.positions[0][1])
+        for k, (_, x, y, z, _, _) in enumerate(first.positions):
+            self.assertAlmostEqual(30 + 2 * k, x, delta=0.5)
+            self.assertAlmostEqual(40 + k, y, delta=0.5)
+            self.assertAlmostEqual(4., z, delta=0.25)
+
+    def test_negative_depths(self):
+        #a conjugate field refocuses at negative depths, which are searched
+        #locally like positive ones
+        frames = [numpy.conj(particle_field([(30 + 2 * k, 40 + k, 4.)]))
+                  for k in range(3)]
+        tracker = holotrack.ParticleTracker(0.658e-3, 0.010,
+                                            -numpy.arange(2., 10., 0.5),
+                                            roi_radius=8)
+        tracks = tracker.track(frames)
+        self.assertEqual(1, tracker.full_sweeps)
+        self.assertEqual(1, len(tracks))
+        self.assertEqual(3, len(tracks[0].positions))
+        for k, (_, x, y, z, _, _) in enumerate(tracks[0].positions):
+            self.assertAlmostEqual(30 + 2 * k, x, delta=0.5)
+            self.assertAlmostEqual(-4., z, delta=0.25)
+
+    def test_reacquire(self):
+        #the second particle leaves after two frames and a third one appears
+        frames = [particle_field([(30, 40, 4.), (90, 80, 7.)]),
+                  particle_field([(31, 40, 4.), (91, 80, 7.)]),
+                  particle_field([(32, 40, 4.), (60, 100, 6.)]),
+                  particle_field([(33, 40, 4.), (60, 100, 6.)])]
+        tracker = self.make_tracker()
+        tracker.max_missed = 0
+        tracker.track(frames)
+        self.assertEqual(2, tracker.full_sweeps)
+        self.assertEqual(3, len(tracker.tracks))
+        self.assertEqual(2, len(tracker.active_tracks))
+        self.assertEqual(4, len(tracker.tracks[0].positions))
+        self.assertFalse(tracker.tracks[1].active)
+        self.assertEqual([2, 3], [position[0] for position in
+                                  tracker.tracks[2].positions])
+
+    def test_reacquire_after_all_tracks_end(self):
+        #the only particle leaves, and a new one appears two frames later
+        frames = [particle_field([(30, 40, 4.)]),
+                  particle_field([(31, 40, 4.)]),
+                  particle_field([]),
+                  particle_field([]),
+                  particle_field([(80, 90, 6.)]),
+                  particle_field([(81, 90, 6.)])]
+        tracker = self.make_tracker()
+        tracker.max_missed = 0
+        tracker.track(frames)
+        #frames 2 and 3 have no active tracks, so they are swept as well
+        self.assertEqual(4, tracker.full_sweeps)
+        self.assertEqual(2, len(tracker.tracks))
+        self.assertFalse(tracker.tracks[0].active)
+        self.assertEqual([4, 5], [position[0] for position in
+                                  tracker.tracks[1].positions])
+        self.assertAlmostEqual(6., tracker.tracks[1].positions[-1][3],
+                               delta=0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
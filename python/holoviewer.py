@@ -0,0 +1,282 @@
+"""
+Interactive viewer for focusing through a hologram with a depth slider.
+
+Moving the slider shows a reduced-resolution preview (Hologram.preview, which
+only inverse-transforms the centre of the spectrum) straight away, and asks a
+background thread for the full-resolution reconstruction at that depth; the
+preview is replaced when it is ready. While the slider is still, the thread
+prefetches the neighbouring depths, so stepping through them is instant. The
+full-resolution images are kept in a small least-recently-used cache.
+
+The image is drawn once and then updated with set_data(), so scrubbing only
+costs a preview and a redraw. Results from the background thread are picked
+up by a timer on the figure's event loop, since matplotlib can only be used
+from the main thread.
+
+Example:
+  holo = digitalholography.Hologram(wavelength=0.658e-3, pixel_size=0.009)
+  holo.load('hologram.png')
+  holoviewer.view(holo, 10., 80., z_step=0.25)
+
+Change log:
+  2026/10/18 -- module started; nloomis@gmail.com
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import digitalholography as dhi
+
+import collections
+import matplotlib.pyplot as plt
+import matplotlib.widgets
+import numpy
+import threading
+import time
+
+# Quantities that the viewer can display.
+DISPLAY_MODES = ('intensity', 'amplitude', 'phase')
+
+
+def _display_image(field, mode):
+    """Converts a field to the displayed quantity, in single precision."""
+    if mode == 'phase':
+        return numpy.angle(field).astype(numpy.float32)
+    amplitude = numpy.abs(field).astype(numpy.float32)
+    if mode == 'intensity':
+        amplitude **= 2
+    return amplitude
+
+
+class ZViewer(object):
+    """Figure with a hologram reconstruction and a depth slider.
+
+    Inputs:
+      holo: a loaded Hologram.
+      z_min, z_max: range of the slider.
+      z_step: depth increment; the slider snaps to it, and the cache and
+        prefetching work in steps of it. Defaults to 1/200 of the range.
+      z: initial depth; defaults to the middle of the range.
+      mode: one of DISPLAY_MODES.
+      preview_factor: downsampling factor of the previews (see
+        Hologram.preview); 1 disables the previews.
+      cache_size: number of full-resolution images to keep.
+      prefetch: number of depths on either side of the current one to
+        reconstruct while the viewer is idle.
+      clim: color limits; by default, they are set from the first image.
+      poll_interval: interval, in ms, of the timer which shows the results of
+        the background thread.
+      settle: time, in s, that the slider has to be still before the
+        background thread starts a reconstruction, so that it doesn't compete
+        with the previews while scrubbing.
+
+    The background thread reconstructs with its own Hologram, which shares
+    the spectrum and the FFT backend of holo, so holo can still be used from
+    the main thread: the backends can be shared between threads (the pyfftw
+    backend keeps per-thread plans)."""
+
+    def __init__(self, holo, z_min, z_max, z_step=None, z=None,
+                 mode='intensity', preview_factor=4, cache_size=16,
+                 prefetch=2, clim=None, poll_interval=50, settle=0.1):
+        if mode not in DISPLAY_MODES:
+            raise ValueError('mode must be one of %s.' % (DISPLAY_MODES,))
+        self.holo = holo
+        self.z_min = z_min
+        self.z_max = z_max
+        self.z_step = (z_max - z_min) / 200. if z_step is None else z_step
+        self.mode = mode
+        self.preview_factor = preview_factor
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        self.settle = settle
+        holo._prepare_fft()
+        self._worker_holo = dhi.Hologram(holo.wavelength, holo.pixel_size,
+                                         kernel_cache_bytes=0,
+                                         fft_backend=holo.fft_backend,
+                                         dtype=holo.dtype,
+                                         kernel_mode=holo.kernel_mode)
+        self._worker_holo.data = holo.data
+        self._worker_holo.fft = holo.fft
+        # _cache maps snapped depths to full-resolution images; it is shared
+        # with the background thread, under _lock.
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._target = None
+        self._request_time = 0.
+        self._busy = False
+        self._stopped = False
+        self.z = self.snap(z_min + (z_max - z_min) / 2. if z is None else z)
+        self.showing_preview = False
+        self.reconstructions = 0
+
+        first = self._full_image(self.z)
+        self._store(self.z, first)
+        self.figure = plt.figure()
+        self.axes = self.figure.add_axes([0.05, 0.15, 0.9, 0.8])
+        ny, nx = first.shape
+        #a fixed extent lets the previews, which are smaller, fill the axes
+        self.image = self.axes.imshow(first, extent=(0, nx, ny, 0),
+                                      interpolation='nearest')
+        if clim is not None:
+            self.image.set_clim(clim)
+        self.axes.set_title(self._title())
+        slider_axes = self.figure.add_axes([0.15, 0.04, 0.7, 0.04])
+        self.slider = matplotlib.widgets.Slider(slider_axes, 'z', z_min, z_max,
+                                                valinit=self.z,
+                                                valstep=self.z_step)
+        self.slider.on_changed(self.set_z)
+        self._timer = self.figure.canvas.new_timer(interval=poll_interval)
+        self._timer.add_callback(self.poll)
+        self._timer.start()
+        self.figure.canvas.mpl_connect('close_event',
+                                       lambda event: self.close())
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        self._request(self.z)
+
+    def snap(self, z):
+        """Rounds a depth to the slider's grid and range."""
+        steps = numpy.round((z - self.z_min) / self.z_step)
+        return float(min(max(self.z_min + steps * self.z_step, self.z_min),
+                         self.z_max))
+
+    def _title(self):
+        suffix = ' (preview)' if self.showing_preview else ''
+        return '%s; z = %f%s' % (self.mode.capitalize(), self.z, suffix)
+
+    def _full_image(self, z, holo=None):
+        """Reconstructs the full-resolution image at a depth.
+
+        Uses the background thread's Hologram unless another is given."""
+        self.reconstructions += 1
+        holo = self._worker_holo if holo is None else holo
+        return _display_image(holo.reconstruct(z), self.mode)
+
+    def _store(self, z, image):
+        """Adds an image to the cache, evicting the least recently used."""
+        with self._lock:
+            self._cache[z] = image
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cached(self, z):
+        """Returns the cached image at a depth, or None."""
+        with self._lock:
+            image = self._cache.pop(z, None)
+            if image is not None:
+                self._cache[z] = image
+            return image
+
+    def _request(self, z):
+        """Asks the background thread for the image at a depth."""
+        with self._wake:
+            self._target = z
+            self._request_time = time.time()
+            self._wake.notify()
+
+    def _next_job(self, take=True):
+        """Picks the next depth for the background thread, or None.
+
+        The requested depth comes first; then the uncached neighbours of the
+        current depth, nearest first. With take, the request is marked as
+        handled. Called with the lock held."""
+        if self._target is not None:
+            z = self._target
+            if take:
+                self._target = None
+            if z not in self._cache:
+                return z
+        for k in range(1, self.prefetch + 1):
+            for z in (self.z + k * self.z_step, self.z - k * self.z_step):
+                z = self.snap(z)
+                if z not in self._cache:
+                    return z
+        return None
+
+    def _run(self):
+        """Background thread: reconstructs requested and nearby depths."""
+        while True:
+            with self._wake:
+                z = self._next_job(take=False)
+                while not self._stopped:
+                    #wait for work, and for the slider to settle
+                    wait = self._request_time + self.settle - time.time()
+                    if z is not None and wait <= 0:
+                        break
+                    self._busy = False
+                    self._wake.wait(wait if z is not None else None)
+                    z = self._next_job(take=False)
+                if self._stopped:
+                    return
+                self._next_job()
+                self._busy = True
+            self._store(z, self._full_image(z))
+
+    def set_z(self, z):
+        """Shows the image at a depth; the slider's callback.
+
+        A cached full-resolution image is shown if there is one; otherwise,
+        a preview is shown and the full image is requested."""
+        self.z = self.snap(z)
+        image = self._cached(self.z)
+        if image is None and self.preview_factor > 1:
+            #preview() matches the amplitude of the full-resolution field, so
+            #the color limits still apply
+            image = _display_image(self.holo.preview(self.z,
+                                                     self.preview_factor),
+                                   self.mode)
+            self.showing_preview = True
+        elif image is None:
+            image = self._full_image(self.z, self.holo)
+            self._store(self.z, image)
+            self.showing_preview = False
+        else:
+            self.showing_preview = False
+        self.image.set_data(image)
+        self.axes.set_title(self._title())
+        self.figure.canvas.draw_idle()
+        self._request(self.z)
+
+    def poll(self):
+        """Replaces a preview with the full image once it is ready.
+
+        Runs on the figure's timer; returns True if the image changed."""
+        if not self.showing_preview:
+            return False
+        image = self._cached(self.z)
+        if image is None:
+            return False
+        self.showing_preview = False
+        self.image.set_data(image)
+        self.axes.set_title(self._title())
+        self.figure.canvas.draw_idle()
+        return True
+
+    def wait_idle(self, timeout=None):
+        """Waits until the background thread has nothing left to do."""
+        start_time = time.time()
+        while True:
+            with self._lock:
+                if not self._busy and self._next_job(take=False) is None:
+                    return True
+            if timeout is not None and time.time() - start_time > timeout:
+                return False
+            time.sleep(0.01)
+
+    def close(self):
+        """Stops the background thread and the timer.
+
+        Waits for a reconstruction which is under way to finish."""
+        self._timer.stop()
+        with self._wake:
+            self._stopped = True
+            self._wake.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+
+
+def view(holo, z_min, z_max, z_step=None, **kwargs):
+    """Opens a ZViewer for a hologram and shows it; see ZViewer."""
+    viewer = ZViewer(holo, z_min, z_max, z_step, **kwargs)
+    plt.show()
+    return viewer
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for holoviewer.py.
+
+Change log:
+  2026/10/18: unit tests started; nloomis@gmail.com
+  2026/10/18: sharing a pyfftw backend with the background thread; nloomis@
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import matplotlib
+matplotlib.use('Agg')
+
+import digitalholography as dhi
+import holoviewer
+
+import matplotlib.pyplot as plt
+import numpy
+import unittest
+
+class ZViewerTest(unittest.TestCase):
+    """Tests for the depth-scrubbing viewer, without a GUI event loop."""
+
+    def setUp(self):
+        self.holo = dhi.Hologram()
+        self.holo.load(numpy.random.RandomState(0).rand(32, 48))
+        self.viewer = holoviewer.ZViewer(self.holo, 10., 20., z_step=1.,
+                                         cache_size=4, prefetch=1)
+
+    def tearDown(self):
+        self.viewer.close()
+        plt.close(self.viewer.figure)
+
+    def expected(self, z):
+        return numpy.abs(self.holo.reconstruct(z)) ** 2
+
+    def test_preview_then_refine(self):
+        self.assertTrue(numpy.allclose(self.expected(15.),
+                                       self.viewer.image.get_array()))
+        self.assertTrue(self.viewer.wait_idle(10.))
+        self.viewer.set_z(12.2)
+        self.assertEqual(12., self.viewer.z)
+        if self.viewer.showing_preview:
+            self.assertEqual((8, 12), self.viewer.image.get_array().shape)
+        self.assertTrue(self.viewer.wait_idle(10.))
+        self.viewer.poll()
+        self.assertFalse(self.viewer.showing_preview)
+        self.assertTrue(numpy.allclose(self.expected(12.),
+                                       self.viewer.image.get_array()))
+
+    def test_prefetch(self):
+        self.assertTrue(self.viewer.wait_idle(10.))
+        #the neighbours of the initial depth were prefetched, so they are
+        #shown at full resolution without a preview
+        self.viewer.set_z(16.)
+        self.assertFalse(self.viewer.showing_preview)
+        self.assertTrue(numpy.allclose(self.expected(16.),
+                                       self.viewer.image.get_array()))
+        self.assertTrue(self.viewer.wait_idle(10.))
+        self.assertLessEqual(len(self.viewer._cache), 4)
+
+    @unittest.skipIf(dhi.pyfftw is None, 'pyFFTW is not installed')
+    def test_shared_pyfftw(self):
+        #the main thread reconstructs while the background thread does, with
+        #the same pyfftw backend
+        holo = dhi.Hologram(fft_backend=dhi.FFTWFFT(
+            threads=1, planner_effort='FFTW_ESTIMATE'))
+        data = numpy.random.RandomState(1).rand(256, 256)
+        holo.load(data)
+        reference = dhi.Hologram(fft_backend='numpy')
+        reference.load(data)
+        viewer = holoviewer.ZViewer(holo, 10., 30., z_step=1.,
+                                    preview_factor=1, cache_size=32,
+                                    prefetch=4, settle=0.)
+        try:
+            for z in range(10, 31) * 3:
+                viewer.set_z(z)
+                self.assertTrue(numpy.allclose(
+                    numpy.abs(reference.reconstruct(z)) ** 2,
+                    viewer.image.get_array()))
+            self.assertTrue(viewer.wait_idle(10.))
+            for z, image in viewer._cache.items():
+                self.assertTrue(numpy.allclose(
+                    numpy.abs(reference.reconstruct(z)) ** 2, image), z)
+        finally:
+            viewer.close()
+            plt.close(viewer.figure)
+
+    def test_snap(self):
+        self.assertEqual(10., self.viewer.snap(3.))
+        self.assertEqual(20., self.viewer.snap(20.4))
+        self.assertEqual(13., self.viewer.snap(12.6))
+
+
+if __name__ == '__main__':
+    unittest.main()
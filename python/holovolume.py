@@ -0,0 +1,346 @@
+"""
+Chunked, compressed on-disk storage for reconstructed volumes.
+
+A volume is a (depth, ny, nx) array of intensities or complex fields, stored
+in a directory:
+  volume.json    -- shape, dtype, chunk shape, compression and the
+                    reconstruction metadata (wavelength, pixel size, depths)
+  chunks/        -- one zlib-compressed file per chunk, named
+                    '<depth chunk>.<row chunk>.<column chunk>'
+Chunks cover a few depths and a square tile of each plane, so a single depth
+or a small region of interest can be read without decompressing the whole
+volume. Only the standard library and numpy are needed to read a volume.
+
+VolumeWriter takes the slices of a depth scan one at a time, so only one
+depth-chunk's worth of slices is held in memory; write_scan() streams the
+reconstructions of a Hologram straight to disk. VolumeReader gives lazy,
+numpy-style access:
+  volume = VolumeReader('scan.vol')
+  plane = volume[10]                          # one depth
+  roi = volume[:, 100:200, 300:400]           # every depth, one region
+  plane = volume.slice_at(52.3, roi=(slice(0, 64), slice(0, 64)))
+
+Change log:
+  2026/10/18 -- module started; nloomis@gmail.com
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import collections
+import json
+import numpy
+import os
+import zlib
+
+FORMAT_VERSION = 1
+METADATA_FILE = 'volume.json'
+CHUNK_DIR = 'chunks'
+
+# Default chunk shape: a few depths, and tiles which are large enough that
+# compression is effective but small enough for quick region reads.
+DEFAULT_CHUNKS = (4, 256, 256)
+
+# Default memory budget, in bytes, for each reader's cache of decompressed
+# chunks.
+CHUNK_CACHE_MAX_BYTES = 64 * 1024 ** 2
+
+
+def _chunk_name(indices):
+    """File name of the chunk with (depth, row, column) chunk indices."""
+    return '%d.%d.%d' % tuple(indices)
+
+def _chunk_ranges(n, chunk):
+    """(start, stop) of each chunk along an axis."""
+    return [(start, min(start + chunk, n)) for start in range(0, n, chunk)]
+
+
+class VolumeWriter(object):
+    """Writes a volume to a chunked directory, one depth slice at a time.
+
+    Inputs:
+      path: directory for the volume; it is created if needed, and an
+        existing volume in it is replaced.
+      shape: (ny, nx) of each slice.
+      z_values: the depth of each slice; the volume has len(z_values) slices.
+      dtype: dtype of the stored values, eg, numpy.float32 for intensities or
+        numpy.complex64 for fields.
+      chunks: (depths, rows, columns) in each chunk.
+      wavelength, pixel_size: reconstruction parameters, stored in the
+        metadata along with z_values.
+      compression_level: zlib level, 0 (none) to 9; low levels are fastest.
+      attrs: dictionary of extra, JSON-serializable metadata.
+
+    Slices can be written in any order. A chunk is compressed and written as
+    soon as all of its slices have been given, so the writer holds at most
+    the slices of the depth chunks which are in progress; when the slices
+    come in order, that is one depth chunk. The metadata is marked complete
+    by close(), which also writes any unfinished chunks; use the writer as a
+    context manager to close it automatically. If the with-block raises, the
+    volume is closed without being marked complete."""
+
+    def __init__(self, path, shape, z_values, dtype=numpy.float32,
+                 chunks=DEFAULT_CHUNKS, wavelength=None, pixel_size=None,
+                 compression_level=3, attrs=None):
+        self.path = path
+        self.z_values = numpy.atleast_1d(numpy.asarray(z_values, dtype=float))
+        self.shape = (len(self.z_values),) + tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.chunks = tuple(min(c, n) for c, n in zip(chunks, self.shape))
+        self.compression_level = compression_level
+        self.metadata = {'format_version': FORMAT_VERSION,
+                         'shape': list(self.shape),
+                         'dtype': self.dtype.str,
+                         'chunks': list(self.chunks),
+                         'compression': 'zlib',
+                         'wavelength': wavelength,
+                         'pixel_size': pixel_size,
+                         'z_values': self.z_values.tolist(),
+                         'attrs': attrs or {},
+                         'complete': False}
+        # _pending maps a depth chunk index to its buffer and the set of
+        # slices which have been written to it.
+        self._pending = {}
+        self._written = set()
+        self.closed = False
+        chunk_dir = os.path.join(path, CHUNK_DIR)
+        if not os.path.isdir(chunk_dir):
+            os.makedirs(chunk_dir)
+        for name in os.listdir(chunk_dir):
+            os.remove(os.path.join(chunk_dir, name))
+        self._write_metadata()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(complete=exc_type is None)
+
+    def _write_metadata(self):
+        """Writes the metadata file, replacing it atomically."""
+        filename = os.path.join(self.path, METADATA_FILE)
+        with open(filename + '.partial', 'w') as metadata_file:
+            json.dump(self.metadata, metadata_file, indent=1, sort_keys=True)
+        if os.path.exists(filename):
+            os.remove(filename)
+        os.rename(filename + '.partial', filename)
+
+    def write_slice(self, index, data):
+        """Stores the slice for depth index z_values[index]."""
+        if self.closed:
+            raise ValueError('The volume has been closed.')
+        if not 0 <= index < self.shape[0]:
+            raise IndexError('Slice %d is outside the %d depths.'
+                             % (index, self.shape[0]))
+        data = numpy.asarray(data)
+        if data.shape != self.shape[1:]:
+            raise ValueError('The slice shape %s does not match %s.'
+                             % (data.shape, self.shape[1:]))
+        depth_chunk = index // self.chunks[0]
+        if depth_chunk not in self._pending:
+            start, stop = _chunk_ranges(self.shape[0],
+                                        self.chunks[0])[depth_chunk]
+            buffer = numpy.empty((stop - start,) + self.shape[1:],
+                                 dtype=self.dtype)
+            self._pending[depth_chunk] = (buffer, set())
+        buffer, filled = self._pending[depth_chunk]
+        buffer[index - depth_chunk * self.chunks[0]] = data
+        filled.add(index)
+        if len(filled) == len(buffer):
+            self._flush_depth_chunk(depth_chunk)
+
+    def _flush_depth_chunk(self, depth_chunk):
+        """Compresses and writes the chunks of a depth chunk."""
+        buffer, _ = self._pending.pop(depth_chunk)
+        for row, (y0, y1) in enumerate(_chunk_ranges(self.shape[1],
+                                                     self.chunks[1])):
+            for col, (x0, x1) in enumerate(_chunk_ranges(self.shape[2],
+                                                         self.chunks[2])):
+                chunk = numpy.ascontiguousarray(buffer[:, y0:y1, x0:x1])
+                name = _chunk_name((depth_chunk, row, col))
+                with open(os.path.join(self.path, CHUNK_DIR, name),
+                          'wb') as chunk_file:
+                    chunk_file.write(zlib.compress(chunk.tobytes(),
+                                                   self.compression_level))
+        self._written.add(depth_chunk)
+
+    def close(self, complete=True):
+        """Writes any unfinished chunks and marks the volume complete.
+
+        Slices which were never written are stored as zeros. If complete is
+        False, as when a scan fails, the unfinished chunks are dropped and the
+        volume stays marked incomplete, so VolumeReader refuses to open it."""
+        if self.closed:
+            return
+        if not complete:
+            self._pending.clear()
+            self.closed = True
+            return
+        for depth_chunk in sorted(self._pending):
+            buffer, filled = self._pending[depth_chunk]
+            start = depth_chunk * self.chunks[0]
+            for offset in range(len(buffer)):
+                if start + offset not in filled:
+                    buffer[offset] = 0
+            self._flush_depth_chunk(depth_chunk)
+        n_depth_chunks = len(_chunk_ranges(self.shape[0], self.chunks[0]))
+        for depth_chunk in range(n_depth_chunks):
+            if depth_chunk not in self._written:
+                start, stop = _chunk_ranges(self.shape[0],
+                                            self.chunks[0])[depth_chunk]
+                self._pending[depth_chunk] = (numpy.zeros(
+                    (stop - start,) + self.shape[1:], dtype=self.dtype), set())
+                self._flush_depth_chunk(depth_chunk)
+        self.metadata['complete'] = True
+        self._write_metadata()
+        self.closed = True
+
+
+def write_scan(holo, z_values, path, intensity=True, chunks=DEFAULT_CHUNKS,
+               compression_level=3, attrs=None):
+    """Reconstructs a hologram at a list of depths straight into a volume.
+
+    The depths are reconstructed with Hologram.scan, so only one field and
+    one depth chunk are in memory at a time. The intensities are stored in
+    the hologram's working dtype, or the complex fields if intensity is
+    False. Returns the path."""
+    dtype = holo.dtype if intensity else holo.complex_dtype
+    attrs = dict(attrs or {})
+    attrs.setdefault('kind', 'intensity' if intensity else 'field')
+    with VolumeWriter(path, (holo.ny, holo.nx), z_values, dtype, chunks,
+                      holo.wavelength, holo.pixel_size, compression_level,
+                      attrs) as writer:
+        for index, (_, field) in enumerate(holo.scan(z_values)):
+            if intensity:
+                writer.write_slice(index, numpy.abs(field) ** 2)
+            else:
+                writer.write_slice(index, field)
+    return path
+
+
+class VolumeReader(object):
+    """Lazy, read-only access to a volume written by VolumeWriter.
+
+    Index the reader like a numpy array of shape (depth, ny, nx); only the
+    chunks which overlap the request are read and decompressed. Recently-used
+    chunks are kept in memory up to cache_bytes. The metadata is available as
+    attributes: shape, dtype, chunks, z_values, wavelength, pixel_size and
+    attrs."""
+
+    def __init__(self, path, cache_bytes=CHUNK_CACHE_MAX_BYTES):
+        self.path = path
+        with open(os.path.join(path, METADATA_FILE)) as metadata_file:
+            self.metadata = json.load(metadata_file)
+        if self.metadata['format_version'] > FORMAT_VERSION:
+            raise ValueError('Unsupported volume format version %d.'
+                             % self.metadata['format_version'])
+        if not self.metadata['complete']:
+            raise ValueError('The volume at %s was not closed; it may be '
+                             'incomplete.' % path)
+        self.shape = tuple(self.metadata['shape'])
+        self.dtype = numpy.dtype(str(self.metadata['dtype']))
+        self.chunks = tuple(self.metadata['chunks'])
+        self.z_values = numpy.array(self.metadata['z_values'])
+        self.wavelength = self.metadata['wavelength']
+        self.pixel_size = self.metadata['pixel_size']
+        self.attrs = self.metadata['attrs']
+        self.cache_bytes = cache_bytes
+        self._cache = collections.OrderedDict()
+        self._cache_nbytes = 0
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def ndim(self):
+        return 3
+
+    def _chunk(self, indices):
+        """Returns a decompressed chunk, from the cache if possible."""
+        chunk = self._cache.pop(indices, None)
+        if chunk is None:
+            ranges = [_chunk_ranges(n, c)[index] for n, c, index in
+                      zip(self.shape, self.chunks, indices)]
+            shape = tuple(stop - start for start, stop in ranges)
+            with open(os.path.join(self.path, CHUNK_DIR,
+                                   _chunk_name(indices)), 'rb') as chunk_file:
+                data = zlib.decompress(chunk_file.read())
+            chunk = numpy.frombuffer(data, dtype=self.dtype).reshape(shape)
+            if chunk.nbytes <= self.cache_bytes:
+                while (self._cache and
+                       self._cache_nbytes + chunk.nbytes > self.cache_bytes):
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_nbytes -= evicted.nbytes
+                self._cache_nbytes += chunk.nbytes
+            else:
+                return chunk
+        self._cache[indices] = chunk
+        return chunk
+
+    def __getitem__(self, key):
+        """Reads a region of the volume; supports integers and slices."""
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 3:
+            raise IndexError('Too many indices for a volume.')
+        key = key + (slice(None),) * (3 - len(key))
+        ranges = []
+        steps = []
+        squeeze = []
+        for axis, (index, n) in enumerate(zip(key, self.shape)):
+            if isinstance(index, slice):
+                start, stop, step = index.indices(n)
+                if step < 0:
+                    raise IndexError('Negative steps are not supported.')
+                stop = max(start, stop)
+            else:
+                start = int(index)
+                if start < 0:
+                    start += n
+                if not 0 <= start < n:
+                    raise IndexError('Index %d is out of bounds for axis %d '
+                                     'with size %d.' % (index, axis, n))
+                stop, step = start + 1, 1
+                squeeze.append(axis)
+            ranges.append((start, stop))
+            steps.append(step)
+        out = numpy.empty([stop - start for start, stop in ranges],
+                          dtype=self.dtype)
+        first = [start // c for (start, _), c in zip(ranges, self.chunks)]
+        last = [(stop - 1) // c for (_, stop), c in zip(ranges, self.chunks)]
+        if out.size:
+            for iz in range(first[0], last[0] + 1):
+                for iy in range(first[1], last[1] + 1):
+                    for ix in range(first[2], last[2] + 1):
+                        self._copy_chunk((iz, iy, ix), ranges, out)
+        out = out[tuple(slice(None, None, step) for step in steps)]
+        return out.reshape([n for axis, n in enumerate(out.shape)
+                            if axis not in squeeze])
+
+    def _copy_chunk(self, indices, ranges, out):
+        """Copies the overlap of a chunk and the requested ranges to out."""
+        chunk = self._chunk(indices)
+        source = []
+        target = []
+        for index, c, (start, stop) in zip(indices, self.chunks, ranges):
+            chunk_start = index * c
+            lo = max(start, chunk_start)
+            hi = min(stop, chunk_start + c)
+            source.append(slice(lo - chunk_start, hi - chunk_start))
+            target.append(slice(lo - start, hi - start))
+        out[tuple(target)] = chunk[tuple(source)]
+
+    def z_index(self, z):
+        """Index of the stored depth closest to z."""
+        return int(numpy.argmin(numpy.abs(self.z_values - z)))
+
+    def slice_at(self, z, roi=None):
+        """Reads the slice closest to depth z, optionally within a region.
+
+        roi is a (row slice, column slice) pair."""
+        if roi is None:
+            roi = (slice(None), slice(None))
+        return self[(self.z_index(z),) + tuple(roi)]
+
+    def clear_cache(self):
+        """Drops the cached chunks."""
+        self._cache.clear()
+        self._cache_nbytes = 0
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for holovolume.py.
+
+Change log:
+  2026/10/18: unit tests started; nloomis@gmail.com
+"""
+__authors__ = ('nloomis@gmail.com',)
+
+import digitalholography as dhi
+import holovolume
+
+import numpy
+import os.path
+import shutil
+import tempfile
+import unittest
+
+class VolumeTest(unittest.TestCase):
+    """Tests for writing and lazily reading chunked volumes."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'scan.vol')
+        self.z_values = numpy.linspace(10., 20., 7)
+        self.volume = numpy.random.RandomState(0).rand(7, 30, 45).astype(
+            numpy.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, order=None, **kwargs):
+        with holovolume.VolumeWriter(self.path, (30, 45), self.z_values,
+                                     chunks=(3, 16, 16), wavelength=0.658e-3,
+                                     pixel_size=0.009, **kwargs) as writer:
+            for index in order or range(7):
+                writer.write_slice(index, self.volume[index])
+
+    def test_random_access(self):
+        self.write(order=[6, 0, 3, 1, 2, 5, 4], attrs={'camera': 'A'})
+        volume = holovolume.VolumeReader(self.path, cache_bytes=4096)
+        self.assertEqual((7, 30, 45), volume.shape)
+        self.assertEqual(numpy.float32, volume.dtype)
+        self.assertEqual(0.658e-3, volume.wavelength)
+        self.assertEqual(0.009, volume.pixel_size)
+        self.assertEqual('A', volume.attrs['camera'])
+        self.assertTrue(numpy.allclose(self.z_values, volume.z_values))
+        for key in [4, -1, (slice(None), slice(5, 20), slice(14, 40)),
+                    (slice(1, 6, 2), 17), (2, slice(None), 44),
+                    (slice(3, 3),)]:
+            self.assertTrue(numpy.array_equal(self.volume[key], volume[key]),
+                            key)
+            self.assertEqual(self.volume[key].shape, volume[key].shape)
+        self.assertTrue(numpy.array_equal(
+            self.volume[2, :10, :12],
+            volume.slice_at(13.4, (slice(0, 10), slice(0, 12)))))
+
+    def test_incomplete(self):
+        writer = holovolume.VolumeWriter(self.path, (30, 45), self.z_values)
+        writer.write_slice(0, self.volume[0])
+        self.assertRaises(ValueError, holovolume.VolumeReader, self.path)
+        writer.close()
+        volume = holovolume.VolumeReader(self.path)
+        self.assertTrue(numpy.array_equal(self.volume[0], volume[0]))
+        self.assertFalse(volume[1:].any())
+
+    def test_failed_scan(self):
+        #a with-block which raises leaves the volume marked incomplete
+        with self.assertRaises(RuntimeError):
+            with holovolume.VolumeWriter(self.path, (30, 45), self.z_values,
+                                         chunks=(3, 16, 16)) as writer:
+                for index in range(4):
+                    writer.write_slice(index, self.volume[index])
+                raise RuntimeError('reconstruction failed')
+        self.assertTrue(writer.closed)
+        self.assertRaises(ValueError, holovolume.VolumeReader, self.path)
+
+    def test_write_scan(self):
+        holo = dhi.Hologram(dtype=numpy.float32)
+        holo.load(numpy.random.RandomState(1).rand(24, 32))
+        holovolume.write_scan(holo, self.z_values, self.path, intensity=False,
+                              chunks=(2, 8, 8))
+        volume = holovolume.VolumeReader(self.path)
+        self.assertEqual(numpy.complex64, volume.dtype)
+        self.assertEqual('field', volume.attrs['kind'])
+        expected = holo.reconstruct_stack(self.z_values)
+        self.assertTrue(numpy.allclose(expected, volume[:], atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
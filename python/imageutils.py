@@ -10,6 +10,11 @@ Change log:
   2015/10/10 -- added channel management methods; nloomis@
   2016/01/24 -- added __authors__ variable; fixed order of imports; nloomis@
   2017/02/05 -- added image resize/scaling functions; nloomis@
+  2026/10/18 -- fixed numpy.arctan2 call in apply_gradient_filter; nloomis@
+  2026/10/18 -- memory-mapped reading of npy, raw and tiff images; nloomis@
+  2026/10/18 -- memory-mapped pgm images; image_white_level; nloomis@
+  2026/10/18 -- tiled and truncated tiffs raise ValueError in
+                memmap_image; nloomis@
 """
 __authors__ = ('nloomis@gmail.com',)
 
@@ -20,6 +25,7 @@ import matplotlib.pyplot as plt
 import numpy
 import os
 import scipy.ndimage
+import struct
 #try:
 #    from skimage import filters
 #except ImportError:
@@ -93,6 +99,166 @@ def test_image(image_name=None):
         print('loading: %s' % filename)
         return cv2utils.imread(filename)
 
+def memmap_image(filename, shape=None, dtype=None, offset=0):
+    """Opens a single-channel image as a read-only numpy memmap.
+
+    Nothing is read into memory until the array is indexed, so images larger
+    than the available RAM can be processed a piece at a time. The format is
+    chosen from the file extension:
+      .npy: numpy arrays written by numpy.save
+      .tif, .tiff: uncompressed, single-channel TIFF or BigTIFF files whose
+        strips are stored contiguously (the usual layout for camera and
+        stitching software)
+      .pgm: binary (P5) 8- or 16-bit PGM files
+      anything else: raw pixel data; the shape (rows, columns) and dtype must
+        be given, and offset is the number of header bytes to skip
+    Other images should be read with cv2utils.imread instead."""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.npy':
+        return numpy.load(filename, mmap_mode='r')
+    if ext in ('.tif', '.tiff'):
+        shape, dtype, offset = _tiff_layout(filename)
+    elif ext == '.pgm':
+        shape, dtype, offset, _ = _pgm_layout(filename)
+    elif shape is None or dtype is None:
+        raise ValueError('The shape and dtype are needed for raw file %s.'
+                         % filename)
+    return numpy.memmap(filename, dtype=dtype, mode='r', offset=offset,
+                        shape=tuple(shape))
+
+def image_white_level(filename, dtype):
+    """Pixel value of full scale for an image read by memmap_image.
+
+    This is the maximum value in the header of a PGM file (binary or ASCII),
+    the largest value of an integer dtype, or 1 for floating-point data."""
+    if os.path.splitext(filename)[1].lower() == '.pgm':
+        fields, _ = _pgm_header(filename)
+        if len(fields) == 4 and fields[0] in (b'P2', b'P5'):
+            return int(fields[3])
+    dtype = numpy.dtype(dtype)
+    if dtype.kind in 'ui':
+        return numpy.iinfo(dtype).max
+    return 1
+
+def _pgm_header(filename):
+    """Returns the header fields of a PGM file and the position after them.
+
+    The fields are the magic number, width, height and maximum value; fewer
+    are returned if the header is malformed."""
+    with open(filename, 'rb') as pgm:
+        header = pgm.read(1024)
+    fields = []
+    position = 0
+    while len(fields) < 4:
+        #fields are separated by whitespace; comments run to the end of a line
+        while header[position:position + 1].isspace():
+            position += 1
+        if header[position:position + 1] == b'#':
+            position = header.find(b'\n', position)
+            if position < 0:
+                break
+            continue
+        end = position
+        while end < len(header) and not header[end:end + 1].isspace():
+            end += 1
+        if end == position or end == len(header):
+            break
+        fields.append(header[position:end])
+        position = end
+    return fields, position
+
+def _pgm_layout(filename):
+    """Returns (shape, dtype, offset, max_value) of the pixels in a PGM file.
+
+    Raises ValueError for anything other than a binary (P5) PGM file."""
+    fields, position = _pgm_header(filename)
+    if len(fields) < 4 or fields[0] != b'P5':
+        raise ValueError('%s is not a binary PGM file.' % filename)
+    width, height, max_value = [int(field) for field in fields[1:]]
+    #a 16-bit PGM is stored most significant byte first
+    dtype = numpy.dtype('u1' if max_value < 256 else '>u2')
+    #a single whitespace character separates the header from the pixels
+    return (height, width), dtype, position + 1, max_value
+
+#TIFF tags and field types used by _tiff_layout
+_TIFF_TAGS = {256: 'width', 257: 'height', 258: 'bits', 259: 'compression',
+              273: 'strip_offsets', 277: 'samples', 279: 'strip_counts',
+              339: 'sample_format'}
+_TIFF_TYPES = {3: 'H', 4: 'I', 16: 'Q'}
+_TIFF_SAMPLE_KINDS = {1: 'u', 2: 'i', 3: 'f'}
+
+def _tiff_layout(filename):
+    """Returns (shape, dtype, offset) of the pixel data in a TIFF file.
+
+    Only the first image in the file is used. Raises ValueError if the pixels
+    can't be memory-mapped: compressed, multi-channel or tiled data, or strips
+    which are not stored back-to-back or don't hold the whole image."""
+    with open(filename, 'rb') as tiff:
+        byte_order = {b'II': '<', b'MM': '>'}.get(tiff.read(2))
+        if byte_order is None:
+            raise ValueError('%s is not a TIFF file.' % filename)
+        version, = struct.unpack(byte_order + 'H', tiff.read(2))
+        if version == 42:
+            #classic TIFF: 4-byte offsets, 12-byte tag entries
+            ifd_offset, = struct.unpack(byte_order + 'I', tiff.read(4))
+            count_format, entry_format, entry_size = 'H', 'HHI', 12
+        elif version == 43:
+            #BigTIFF: 8-byte offsets, 20-byte tag entries
+            tiff.read(4)
+            ifd_offset, = struct.unpack(byte_order + 'Q', tiff.read(8))
+            count_format, entry_format, entry_size = 'Q', 'HHQ', 20
+        else:
+            raise ValueError('%s is not a TIFF file.' % filename)
+        tiff.seek(ifd_offset)
+        n_tags, = struct.unpack(byte_order + count_format,
+                                tiff.read(struct.calcsize(count_format)))
+        value_size = entry_size - struct.calcsize('=' + entry_format)
+        tags = {}
+        for _ in range(n_tags):
+            entry = tiff.read(entry_size)
+            tag, field_type, count = struct.unpack(
+                byte_order + entry_format, entry[:entry_size - value_size])
+            if tag not in _TIFF_TAGS or field_type not in _TIFF_TYPES:
+                continue
+            value_format = byte_order + _TIFF_TYPES[field_type] * count
+            if struct.calcsize(value_format) <= value_size:
+                value_bytes = entry[entry_size - value_size:]
+                value_bytes = value_bytes[:struct.calcsize(value_format)]
+            else:
+                #the values don't fit in the entry, which holds an offset
+                pointer_format = byte_order + ('I' if value_size == 4 else 'Q')
+                pointer, = struct.unpack(pointer_format,
+                                         entry[entry_size - value_size:])
+                position = tiff.tell()
+                tiff.seek(pointer)
+                value_bytes = tiff.read(struct.calcsize(value_format))
+                tiff.seek(position)
+            tags[_TIFF_TAGS[tag]] = struct.unpack(value_format, value_bytes)
+    if tags.get('compression', (1,))[0] != 1:
+        raise ValueError('%s is compressed and cannot be memory-mapped.'
+                         % filename)
+    if tags.get('samples', (1,))[0] != 1:
+        raise ValueError('%s has more than one channel.' % filename)
+    if 'strip_offsets' not in tags or 'strip_counts' not in tags:
+        #tiled images store their pixels in tiles instead of strips
+        raise ValueError('%s is not stored in strips and cannot be '
+                         'memory-mapped.' % filename)
+    offsets = tags['strip_offsets']
+    counts = tags['strip_counts']
+    for k in range(len(offsets) - 1):
+        if offsets[k] + counts[k] != offsets[k + 1]:
+            raise ValueError('The strips in %s are not contiguous.' % filename)
+    bits = tags.get('bits', (1,))[0]
+    kind = _TIFF_SAMPLE_KINDS.get(tags.get('sample_format', (1,))[0])
+    if kind is None or bits % 8:
+        raise ValueError('Unsupported TIFF sample type in %s.' % filename)
+    dtype = numpy.dtype('%s%s%d' % (byte_order, kind, bits // 8))
+    shape = (tags['height'][0], tags['width'][0])
+    if sum(counts) < shape[0] * shape[1] * dtype.itemsize:
+        raise ValueError('The strips in %s do not hold the whole image.'
+                         % filename)
+    return shape, dtype, offsets[0]
+
 #
 # image channels
 #
@@ -279,7 +445,7 @@ def apply_gradient_filter(img, x_dir_filter):
     gradient_x = scipy.ndimage.filters.convolve(img, x_dir_filter)
     gradient_y = scipy.ndimage.filters.convolve(img, x_dir_filter.transpose())
     S = numpy.sqrt(gradient_x**2 + gradient_y**2)
-    O = numpy.atan2(gradient_y, gradient_x)
+    O = numpy.arctan2(gradient_y, gradient_x)
     return S, O, gradient_x, gradient_y
 
 def local_mean_filter(img, structuring_element):